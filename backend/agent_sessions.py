@@ -0,0 +1,574 @@
+"""
+Agent 会话（费曼学习对话）持久化
+
+- 使用 LangGraph checkpointer 在服务端保存对话状态，线程键为 ``agent:session_id:card``，
+  客户端每轮只需发送新输入，不必重发历史。session_id 不能包含冒号，保证不同的 (session_id, card) 不会拼出同一个线程键
+- 默认存储在 SQLite（AGENT_SESSION_DB_PATH）；配置 AGENT_SESSION_DB_URL 为 postgresql://
+  且安装了 langgraph-checkpoint-postgres 时改用 Postgres
+- 历史超过 token 预算时，把较早的消息压缩进摘要（LLM 不可用时直接截断），
+  保证长对话中每轮的 prompt token 基本恒定
+- 空闲超过 AGENT_SESSION_TTL_SECONDS 的会话会被定期清理
+"""
+
+from __future__ import annotations
+
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Annotated, Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, RemoveMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.graph import add_messages
+from typing_extensions import NotRequired, TypedDict
+
+try:
+    from .config import (
+        agent_session_db_path,
+        agent_session_db_url,
+        agent_session_max_tokens,
+        agent_session_summarize,
+        agent_session_ttl_seconds,
+    )
+    from .llm import invoke_llm
+    from .metrics import record_fallback
+except ImportError:
+    from config import (
+        agent_session_db_path,
+        agent_session_db_url,
+        agent_session_max_tokens,
+        agent_session_summarize,
+        agent_session_ttl_seconds,
+    )
+    from llm import invoke_llm
+    from metrics import record_fallback
+
+
+# 两次过期清理之间的最小间隔（秒），清理在处理请求时顺带执行
+_EXPIRE_INTERVAL = 300
+
+SUMMARY_SYSTEM_PROMPT = """
+你负责压缩一段费曼学习对话的历史。请把“已有摘要”和“新增对话”合并成一段简洁的中文摘要，
+保留：正在学习的概念、用户已经解释清楚的要点、仍然不理解或解释有误的地方、已经讨论过的类比。
+不要输出与学习无关的内容，不要使用 Markdown，控制在 300 字以内。
+""".strip()
+
+
+class SessionState(TypedDict):
+    """带摘要的 Agent 对话状态"""
+
+    messages: Annotated[List[BaseMessage], add_messages]
+    summary: NotRequired[str]
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文约 1 字 1 token，其余约 4 字符 1 token"""
+    han = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    return han + (len(text) - han + 3) // 4
+
+
+def _message_tokens(message: BaseMessage) -> int:
+    content = message.content
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    # 每条消息额外计入角色等开销
+    return estimate_tokens(str(content)) + 4
+
+
+def _format_transcript(messages: Sequence[BaseMessage]) -> str:
+    lines = []
+    for message in messages:
+        role = "用户" if isinstance(message, HumanMessage) else "助手"
+        lines.append(f"{role}：{message.content}")
+    return "\n".join(lines)
+
+
+def compact_history(
+    messages: Sequence[BaseMessage],
+    summary: str,
+    max_tokens: int,
+    summarize: Optional[Callable[[str, Sequence[BaseMessage]], str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    历史超过 max_tokens 时，保留最近约一半预算的消息，其余移出对话。
+
+    Args:
+        messages: 当前对话消息（最后一条为本轮用户输入）
+        summary: 已有摘要
+        max_tokens: 历史 token 预算
+        summarize: 摘要函数 (旧摘要, 被移出的消息) -> 新摘要；为 None 时直接截断
+
+    Returns:
+        需要写回状态的更新（RemoveMessage 列表与新摘要），无需压缩时返回 None
+    """
+    costs = [_message_tokens(m) for m in messages]
+    if sum(costs) <= max_tokens or len(messages) <= 1:
+        return None
+
+    keep_budget = max_tokens // 2
+    kept = 1  # 本轮输入始终保留
+    used = costs[-1]
+    while kept < len(messages) and used + costs[-kept - 1] <= keep_budget:
+        used += costs[-kept - 1]
+        kept += 1
+    start = len(messages) - kept
+    # 保留部分从用户消息开始，避免出现没有提问的回答
+    while start < len(messages) - 1 and not isinstance(messages[start], HumanMessage):
+        start += 1
+
+    dropped = list(messages[:start])
+    if not dropped:
+        return None
+    new_summary = summary
+    if summarize is not None:
+        new_summary = summarize(summary, dropped)
+    return {
+        "messages": [RemoveMessage(id=m.id) for m in dropped],
+        "summary": new_summary,
+    }
+
+
+def make_compact_node(llm, max_tokens: int = agent_session_max_tokens):
+    """
+    构造 LangGraph 节点：在调用模型前把历史控制在 token 预算内。
+    """
+
+    def summarize(summary: str, dropped: Sequence[BaseMessage]) -> str:
+        if not agent_session_summarize:
+            return summary
+        prompt = f"已有摘要：\n{summary or '（无）'}\n\n新增对话：\n{_format_transcript(dropped)}"
+        try:
+            response = invoke_llm(
+                llm,
+                [SystemMessage(content=SUMMARY_SYSTEM_PROMPT), HumanMessage(content=prompt)],
+                call_site="session_summary",
+            )
+        except Exception as exc:  # noqa: BLE001
+            print(f"[AgentSessions] 历史摘要失败，直接截断: {exc}")
+            record_fallback("session_summary", reason="llm_error")
+            return summary
+        text = str(response.content).strip()
+        # 摘要本身也限制在预算的 1/4 以内
+        limit = max(1, max_tokens // 4)
+        return text[:limit] if estimate_tokens(text) > limit else text
+
+    def compact(state: SessionState):
+        update = compact_history(state["messages"], state.get("summary", ""), max_tokens, summarize)
+        return update or {}
+
+    return compact
+
+
+def history_with_summary(state: SessionState) -> List[BaseMessage]:
+    """返回发送给模型的历史：摘要（若有）+ 保留的消息"""
+    history: List[BaseMessage] = []
+    summary = state.get("summary")
+    if summary:
+        history.append(SystemMessage(content=f"此前对话摘要：\n{summary}"))
+    history.extend(state["messages"])
+    return history
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    基于 SQLite 的 LangGraph checkpointer。
+
+    只保留每个线程最近的两个 checkpoint（当前与其父节点），
+    会话只需要“继续对话”，不需要回溯历史版本，避免存储随轮数增长。
+    """
+
+    def __init__(self, db_path: str, *, serde=None):
+        super().__init__(serde=serde)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self.setup()
+
+    def setup(self) -> None:
+        with self._lock, self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS agent_checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    checkpoint_type TEXT NOT NULL,
+                    checkpoint BLOB NOT NULL,
+                    metadata_type TEXT NOT NULL,
+                    metadata BLOB NOT NULL,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                );
+                CREATE TABLE IF NOT EXISTS agent_checkpoint_writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    value_type TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                );
+                """
+            )
+
+    @contextmanager
+    def _cursor(self) -> Iterator[sqlite3.Cursor]:
+        with self._lock, self._conn:
+            yield self._conn.cursor()
+
+    def _load_writes(self, cursor, thread_id: str, checkpoint_ns: str, checkpoint_id: str):
+        cursor.execute(
+            """
+            SELECT task_id, channel, value_type, value FROM agent_checkpoint_writes
+            WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+            ORDER BY task_id, idx
+            """,
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        return [
+            (task_id, channel, self.serde.loads_typed((value_type, value)))
+            for task_id, channel, value_type, value in cursor.fetchall()
+        ]
+
+    def _to_tuple(self, cursor, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, c_type, c_blob, m_type, m_blob = row
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed((c_type, c_blob)),
+            metadata=self.serde.loads_typed((m_type, m_blob)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=self._load_writes(cursor, thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = (
+            "thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+            "checkpoint_type, checkpoint, metadata_type, metadata"
+        )
+        with self._cursor() as cursor:
+            if checkpoint_id := get_checkpoint_id(config):
+                cursor.execute(
+                    f"SELECT {columns} FROM agent_checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                )
+            else:
+                cursor.execute(
+                    f"SELECT {columns} FROM agent_checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                )
+            row = cursor.fetchone()
+            return self._to_tuple(cursor, row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+            "checkpoint_type, checkpoint, metadata_type, metadata FROM agent_checkpoints"
+        )
+        conditions: List[str] = []
+        params: List[Any] = []
+        if config:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            conditions.append("checkpoint_id < ?")
+            params.append(before_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            results = []
+            for row in rows:
+                item = self._to_tuple(cursor, row)
+                if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(item)
+                if limit is not None and len(results) >= limit:
+                    break
+        yield from results
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        c_type, c_blob = self.serde.dumps_typed(checkpoint)
+        m_type, m_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        keep = (checkpoint["id"], parent_id or checkpoint["id"])
+        with self._cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO agent_checkpoints
+                (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,
+                 checkpoint_type, checkpoint, metadata_type, metadata)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (thread_id, checkpoint_ns, checkpoint["id"], parent_id, c_type, c_blob, m_type, m_blob),
+            )
+            for table in ("agent_checkpoints", "agent_checkpoint_writes"):
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "AND checkpoint_id NOT IN (?, ?)",
+                    (thread_id, checkpoint_ns, *keep),
+                )
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # 特殊通道（错误、中断等）写入固定下标，只保留第一次；普通通道允许覆盖
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            value_type, value_blob = self.serde.dumps_typed(value)
+            rows.append(
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint_id,
+                    task_id,
+                    WRITES_IDX_MAP.get(channel, idx),
+                    channel,
+                    value_type,
+                    value_blob,
+                    task_path,
+                )
+            )
+        with self._cursor() as cursor:
+            cursor.executemany(
+                f"""
+                {verb} INTO agent_checkpoint_writes
+                (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, value_type, value, task_path)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM agent_checkpoints WHERE thread_id = ?", (thread_id,))
+            cursor.execute("DELETE FROM agent_checkpoint_writes WHERE thread_id = ?", (thread_id,))
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+
+class SessionRegistry:
+    """
+    记录会话的最近活跃时间，用于清理空闲会话。
+
+    与 checkpointer 使用同一个数据库；SQLite 与 Postgres 共用同一套 SQL。
+    """
+
+    _CREATE_SQL = """
+        CREATE TABLE IF NOT EXISTS agent_sessions (
+            thread_id TEXT PRIMARY KEY,
+            agent TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            card TEXT NOT NULL DEFAULT '',
+            created_at DOUBLE PRECISION NOT NULL,
+            last_active_at DOUBLE PRECISION NOT NULL
+        )
+    """
+
+    def __init__(self, execute: Callable[[str, Sequence[Any]], List[tuple]]):
+        self._execute = execute
+        self._execute(self._CREATE_SQL, ())
+
+    def touch(self, thread_id: str, agent: str, session_id: str, card: str, now: float) -> None:
+        self._execute(
+            """
+            INSERT INTO agent_sessions (thread_id, agent, session_id, card, created_at, last_active_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (thread_id) DO UPDATE SET last_active_at = excluded.last_active_at
+            """,
+            (thread_id, agent, session_id, card, now, now),
+        )
+
+    def idle_threads(self, cutoff: float) -> List[str]:
+        rows = self._execute("SELECT thread_id FROM agent_sessions WHERE last_active_at < ?", (cutoff,))
+        return [row[0] for row in rows]
+
+    def remove(self, thread_id: str) -> None:
+        self._execute("DELETE FROM agent_sessions WHERE thread_id = ?", (thread_id,))
+
+
+def _sqlite_executor(saver: SQLiteCheckpointSaver):
+    def execute(sql: str, params: Sequence[Any]) -> List[tuple]:
+        with saver._cursor() as cursor:
+            cursor.execute(sql, tuple(params))
+            return cursor.fetchall()
+
+    return execute
+
+
+def _postgres_executor(pool):
+    def execute(sql: str, params: Sequence[Any]) -> List[tuple]:
+        with pool.connection() as conn:
+            cursor = conn.execute(sql.replace("?", "%s"), tuple(params))
+            return cursor.fetchall() if cursor.description else []
+
+    return execute
+
+
+class AgentSessionStore:
+    """checkpointer + 会话活跃时间登记 + 空闲清理"""
+
+    def __init__(self, saver: BaseCheckpointSaver, registry: SessionRegistry, ttl_seconds: float):
+        self.saver = saver
+        self.registry = registry
+        self.ttl_seconds = ttl_seconds
+        self._last_expire = 0.0
+        self._expire_lock = threading.Lock()
+
+    def open(self, agent: str, session_id: str, card: Optional[str] = None) -> RunnableConfig:
+        """
+        登记会话活跃并返回该会话线程的 LangGraph 配置
+
+        Raises:
+            ValueError: session_id 为空或包含冒号
+        """
+        if not session_id or ":" in session_id:
+            # 冒号是线程键的分隔符，"a:b" + "c" 与 "a" + "b:c" 会拼出同一个线程键
+            raise ValueError(f"无效的会话ID: {session_id!r}")
+        card = (card or "").strip()
+        thread_id = f"{agent}:{session_id}:{card}"
+        now = time.time()
+        self.registry.touch(thread_id, agent, session_id, card, now)
+        if now - self._last_expire >= _EXPIRE_INTERVAL:
+            self.expire_idle(now)
+        return {"configurable": {"thread_id": thread_id}}
+
+    def expire_idle(self, now: Optional[float] = None) -> int:
+        """删除空闲超过 TTL 的会话，返回删除数量"""
+        if not self._expire_lock.acquire(blocking=False):
+            return 0
+        try:
+            now = time.time() if now is None else now
+            self._last_expire = now
+            expired = self.registry.idle_threads(now - self.ttl_seconds)
+            for thread_id in expired:
+                self.saver.delete_thread(thread_id)
+                self.registry.remove(thread_id)
+            if expired:
+                print(f"[AgentSessions] 清理空闲会话 {len(expired)} 个")
+            return len(expired)
+        finally:
+            self._expire_lock.release()
+
+
+def _create_store() -> AgentSessionStore:
+    if agent_session_db_url.startswith(("postgres://", "postgresql://")):
+        try:
+            from langgraph.checkpoint.postgres import PostgresSaver
+            from psycopg_pool import ConnectionPool
+        except ImportError as exc:
+            raise RuntimeError(
+                "AGENT_SESSION_DB_URL 指向 Postgres，但未安装 langgraph-checkpoint-postgres / psycopg-pool"
+            ) from exc
+        pool = ConnectionPool(
+            agent_session_db_url, kwargs={"autocommit": True, "prepare_threshold": 0}, open=True
+        )
+        saver = PostgresSaver(pool)
+        saver.setup()
+        registry = SessionRegistry(_postgres_executor(pool))
+    else:
+        saver = SQLiteCheckpointSaver(agent_session_db_path)
+        registry = SessionRegistry(_sqlite_executor(saver))
+    return AgentSessionStore(saver, registry, agent_session_ttl_seconds)
+
+
+@lru_cache(maxsize=1)
+def get_session_store() -> AgentSessionStore:
+    """返回进程内共享的会话存储（首次使用时创建）"""
+    return _create_store()
+
+
+__all__ = [
+    "AgentSessionStore",
+    "SQLiteCheckpointSaver",
+    "SessionRegistry",
+    "SessionState",
+    "compact_history",
+    "estimate_tokens",
+    "get_session_store",
+    "history_with_summary",
+    "make_compact_node",
+]
@@ -0,0 +1,217 @@
+"""
+多文件 / 压缩包批量提取
+
+学生经常一次上传一整个文件夹的课堂照片或一个讲义 zip，原先只能逐个调用
+/notes/extract-terms/file，每个文件各自 OCR、各自调用一次 LLM。这里：
+
+- zip 内的文件逐个解压为临时文件（不使用压缩包里的路径，避免路径穿越），
+  按文件名自然顺序排列（2.jpg 在 10.jpg 之前）；目录、隐藏文件与 __MACOSX 忽略，
+  文件数与解压后总大小受 BATCH_MAX_FILES / UPLOAD_MAX_BYTES 限制（防止 zip 炸弹）
+- 各文件并行提取（图片交给 OCR 工作进程池，PDF 交给 PDF 进程池，结果复用提取缓存），
+  按上传顺序拼接全文；单个文件失败时跳过并记录，不影响其他文件
+- 图片每 OCR_BATCH_SIZE 张合并为一个 OCR 任务，同尺寸的照片一起批量推理
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    from .config import batch_max_files, batch_workers, ocr_batch_size, upload_max_bytes, upload_spool_dir
+    from .file_text_extractor import extract_image_texts, extract_text_from_upload, is_image
+    from .upload_spool import CHUNK_SIZE, discard_upload
+except ImportError:  # pragma: no cover
+    from config import batch_max_files, batch_workers, ocr_batch_size, upload_max_bytes, upload_spool_dir
+    from file_text_extractor import extract_image_texts, extract_text_from_upload, is_image
+    from upload_spool import CHUNK_SIZE, discard_upload
+
+
+# (原始文件名, 临时文件路径)
+BatchItem = Tuple[str, str]
+
+
+class BatchFileText(NamedTuple):
+    """批量提取中一个文件的结果"""
+
+    # 在批次中的序号（上传顺序）
+    index: int
+    filename: str
+    # 提取失败时为 None，error 为失败原因
+    text: Optional[str]
+    error: Optional[str]
+
+
+def is_archive(filename: Optional[str]) -> bool:
+    return (filename or "").lower().endswith(".zip")
+
+
+def _natural_key(name: str):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+def _archive_members(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    members = []
+    for info in archive.infolist():
+        parts = info.filename.replace("\\", "/").split("/")
+        if info.is_dir() or "__MACOSX" in parts or parts[-1].startswith("."):
+            continue
+        members.append(info)
+    return sorted(members, key=lambda info: _natural_key(info.filename))
+
+
+def expand_archive(path: str, max_files: int, max_bytes: int) -> List[BatchItem]:
+    """
+    把 zip 中的文件解压为临时文件，返回 (文件名, 临时文件路径) 列表（调用方负责删除）。
+
+    Raises:
+        ValueError: 不是有效的 zip、文件数或解压后总大小超过上限
+    """
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as exc:
+        raise ValueError("无法解析 zip 压缩包") from exc
+
+    items: List[BatchItem] = []
+    try:
+        with archive:
+            members = _archive_members(archive)
+            if len(members) > max_files:
+                raise ValueError(f"压缩包内文件过多，最多 {max_files} 个")
+            # 声明的大小可以伪造，解压时再按实际字节数检查
+            written = 0
+            for info in members:
+                name = os.path.basename(info.filename.replace("\\", "/"))
+                _, ext = os.path.splitext(name)
+                fd, member_path = tempfile.mkstemp(prefix="upload-", suffix=ext.lower(), dir=upload_spool_dir)
+                items.append((name, member_path))
+                with os.fdopen(fd, "wb") as out, archive.open(info) as src:
+                    while True:
+                        chunk = src.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        written += len(chunk)
+                        if written > max_bytes:
+                            raise ValueError(
+                                f"压缩包解压后过大，最大允许 {max_bytes / 1024 / 1024:.0f}MB"
+                            )
+                        out.write(chunk)
+    except BaseException:
+        for _, member_path in items:
+            discard_upload(member_path)
+        raise
+    return items
+
+
+def expand_uploads(
+    items: List[BatchItem], max_files: Optional[int] = None, discard_archives: bool = True
+) -> List[BatchItem]:
+    """
+    展开上传列表中的 zip，保持上传顺序。discard_archives 时原 zip 临时文件随即删除；
+    任务可能重试时传 False，保留原 zip，由调用方在任务结束后删除。
+
+    Raises:
+        ValueError: 文件总数超过上限，或压缩包无效/过大（已展开的临时文件会被删除）
+    """
+    max_files = batch_max_files if max_files is None else max_files
+    expanded: List[BatchItem] = []
+    try:
+        for filename, path in items:
+            if is_archive(filename):
+                expanded.extend(expand_archive(path, max_files - len(expanded), upload_max_bytes))
+                if discard_archives:
+                    discard_upload(path)
+            else:
+                expanded.append((filename, path))
+            if len(expanded) > max_files:
+                raise ValueError(f"文件过多，一次最多 {max_files} 个")
+    except BaseException:
+        for _, path in expanded:
+            discard_upload(path)
+        raise
+    return expanded
+
+
+def _extract_one(index: int, filename: str, path: str) -> List[BatchFileText]:
+    try:
+        return [BatchFileText(index, filename, extract_text_from_upload(filename, path), None)]
+    except Exception as exc:  # noqa: BLE001
+        print(f"[Batch] 文件 {filename} 提取失败: {exc}")
+        return [BatchFileText(index, filename, None, str(exc))]
+
+
+def _extract_images(indexed: List[Tuple[int, BatchItem]]) -> List[BatchFileText]:
+    """一组图片合并为一个 OCR 任务"""
+    try:
+        texts = extract_image_texts([item for _, item in indexed])
+    except Exception as exc:  # noqa: BLE001
+        texts = [(None, str(exc))] * len(indexed)
+    results = []
+    for (index, (filename, _)), (text, error) in zip(indexed, texts):
+        if error is not None:
+            print(f"[Batch] 文件 {filename} 提取失败: {error}")
+        results.append(BatchFileText(index, filename, text, error))
+    return results
+
+
+def _batch_tasks(items: List[BatchItem], batch_size: int) -> List[Tuple[Callable[..., List[BatchFileText]], tuple]]:
+    """每个非图片文件一个任务；图片按上传顺序每 batch_size 张一个任务"""
+    tasks = []
+    images: List[Tuple[int, BatchItem]] = []
+    for index, (filename, path) in enumerate(items):
+        if is_image(filename):
+            images.append((index, (filename, path)))
+        else:
+            tasks.append((_extract_one, (index, filename, path)))
+    for start in range(0, len(images), batch_size):
+        tasks.append((_extract_images, (images[start : start + batch_size],)))
+    return tasks
+
+
+def iter_batch_texts(
+    items: List[BatchItem], workers: Optional[int] = None, batch_size: Optional[int] = None
+) -> Iterator[BatchFileText]:
+    """
+    并行提取各文件文本，按完成顺序产出。
+
+    每个任务（一个文件或一组图片）一个线程：实际的解析与 OCR 在 PDF/OCR 进程池中进行，
+    线程只负责提交与等待，同时进行的任务数受 BATCH_WORKERS 限制（OCR 进程池另有排队上限）。
+    """
+    workers = max(1, batch_workers if workers is None else workers)
+    tasks = _batch_tasks(items, max(1, ocr_batch_size if batch_size is None else batch_size))
+    if workers == 1 or len(tasks) <= 1:
+        for fn, args in tasks:
+            yield from fn(*args)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(tasks)), thread_name_prefix="batch-extract")
+    try:
+        pending = {executor.submit(fn, *args) for fn, args in tasks}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+    finally:
+        # 调用方提前停止迭代时不再开始新的文件
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def join_batch_texts(results: List[BatchFileText]) -> str:
+    """按上传顺序拼接各文件文本（用于提取过程中的部分结果与最终全文）"""
+    ordered = sorted(results, key=lambda r: r.index)
+    return "\n\n".join(r.text.strip() for r in ordered if r.text and r.text.strip())
+
+
+__all__ = [
+    "BatchFileText",
+    "BatchItem",
+    "expand_archive",
+    "expand_uploads",
+    "is_archive",
+    "iter_batch_texts",
+    "join_batch_texts",
+]
@@ -0,0 +1,20 @@
+"""测试共用的 fixture"""
+
+import pytest
+
+import extraction_cache
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _worker_extraction_cache_dir(tmp_path_factory):
+    # PDF/OCR 工作进程在启动时从环境变量读取缓存目录，不写入 backend/extraction_cache
+    mp = pytest.MonkeyPatch()
+    mp.setenv("EXTRACTION_CACHE_DIR", str(tmp_path_factory.mktemp("worker_extraction_cache")))
+    yield
+    mp.undo()
+
+
+@pytest.fixture(autouse=True)
+def _isolated_extraction_cache(tmp_path, monkeypatch):
+    """每个测试使用独立的临时提取结果缓存"""
+    monkeypatch.setattr(extraction_cache, "_cache", extraction_cache.ExtractionCache(str(tmp_path / "extraction_cache")))
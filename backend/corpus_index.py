@@ -0,0 +1,373 @@
+"""
+语料统计索引（文档频率）
+
+为所有笔记维护“词 -> 出现该词的笔记数”的文档频率表，供词语抽取做 TF-IDF / BM25 打分：
+在每篇笔记里都出现的泛用词得分低，只在少数笔记中出现的领域术语得分高。
+
+- 内存结构：词表（词 -> 编号）+ numpy int32 文档频率数组 + 每篇笔记的去重词编号数组
+- 增量更新：新建/修改/删除笔记时只处理该笔记的词，复杂度为 O(该笔记的词数)
+- 持久化：快照文件 + 追加写日志。快照为定长二进制数组，加载时直接 np.frombuffer，
+  日志在加载时重放，超过阈值后合并进新快照
+- 多进程（uvicorn --workers N）：快照与日志的读写由锁文件串行化。每个进程记录已重放到的日志位置，
+  修改前先重放其他进程追加的日志；快照被其他进程替换时重新加载，合并快照前已包含全部日志
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import math
+import os
+import struct
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    from .config import corpus_index_path
+except ImportError:  # pragma: no cover
+    from config import corpus_index_path
+
+
+_MAGIC = b"NSCIDX01"
+# magic, 词表大小, 笔记数, 全部笔记的词数之和
+_HEADER = struct.Struct("<8sIIQ")
+
+# 日志累计多少条操作后合并进快照
+_COMPACT_THRESHOLD = 1000
+
+
+@contextlib.contextmanager
+def _file_lock(path: str):
+    """跨进程互斥锁（锁文件 path）"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:  # pragma: no cover - Windows
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:  # pragma: no cover - Windows
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _file_id(path: str) -> Optional[Tuple[int, int, int]]:
+    """用于判断文件是否被替换；文件不存在时为 None"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class CorpusIndex:
+    """线程安全、多进程共享磁盘文件的文档频率索引"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or corpus_index_path
+        self.journal_path = self.path + ".journal"
+        self.lock_path = self.path + ".lock"
+        self._lock = threading.Lock()
+        self._reset()
+        # 已加载的快照文件（_file_id）与已重放到的日志位置（字节）
+        self._snapshot_id: Optional[Tuple[int, int, int]] = None
+        self._journal_offset = 0
+        # 上次看到的日志大小；大于 _journal_offset 时末尾是进程中途退出留下的不完整行
+        self._journal_size = 0
+        self._journal_ops = 0
+        # 是否从磁盘加载到了已有索引
+        self.loaded = False
+
+    def _reset(self) -> None:
+        self._vocab: Dict[str, int] = {}
+        self._terms: List[str] = []
+        self._df = np.zeros(1024, dtype=np.int32)
+        self._notes: Dict[str, np.ndarray] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+
+    # ---------- 查询 ----------
+
+    @property
+    def note_count(self) -> int:
+        return len(self._notes)
+
+    @property
+    def average_length(self) -> float:
+        return self._total_length / len(self._notes) if self._notes else 0.0
+
+    def df(self, term: str) -> int:
+        term_id = self._vocab.get(term)
+        return int(self._df[term_id]) if term_id is not None else 0
+
+    def idf(self, term: str) -> float:
+        """BM25 形式的逆文档频率（始终为正）"""
+        n = len(self._notes)
+        df = self.df(term)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    # ---------- 增量更新 ----------
+
+    def _ids_for(self, terms: Iterable[str]) -> np.ndarray:
+        ids = []
+        for term in set(terms):
+            term_id = self._vocab.get(term)
+            if term_id is None:
+                term_id = len(self._terms)
+                self._vocab[term] = term_id
+                self._terms.append(term)
+                if term_id >= len(self._df):
+                    self._df = np.concatenate([self._df, np.zeros(len(self._df), dtype=np.int32)])
+            ids.append(term_id)
+        return np.array(sorted(ids), dtype=np.int32)
+
+    def _apply_set(self, note_id: str, terms: List[str]) -> None:
+        self._apply_remove(note_id)
+        ids = self._ids_for(terms)
+        self._df[ids] += 1
+        self._notes[note_id] = ids
+        self._lengths[note_id] = len(terms)
+        self._total_length += len(terms)
+
+    def _apply_remove(self, note_id: str) -> None:
+        old = self._notes.pop(note_id, None)
+        if old is not None:
+            self._df[old] -= 1
+            self._total_length -= self._lengths.pop(note_id, 0)
+
+    def set_note(self, note_id: str, terms: List[str]) -> None:
+        """新建或修改笔记：terms 为笔记中的候选词（含重复，用于统计篇幅）"""
+        terms = list(terms)
+        with self._lock, _file_lock(self.lock_path):
+            self._sync()
+            self._apply_set(note_id, terms)
+            self._append_journal({"op": "set", "note": note_id, "terms": terms})
+
+    def remove_note(self, note_id: str) -> None:
+        """删除笔记"""
+        with self._lock, _file_lock(self.lock_path):
+            self._sync()
+            if note_id not in self._notes:
+                return
+            self._apply_remove(note_id)
+            self._append_journal({"op": "del", "note": note_id})
+
+    def rebuild(self, notes: Dict[str, List[str]]) -> None:
+        """用全部笔记重建索引并写入快照"""
+        with self._lock, _file_lock(self.lock_path):
+            self._reset()
+            for note_id, terms in notes.items():
+                self._apply_set(note_id, list(terms))
+            self._write_snapshot()
+            self.loaded = True
+
+    def refresh(self) -> None:
+        """重放其他进程追加的日志；快照被替换时重新加载。磁盘文件没有变化时不加锁"""
+        try:
+            journal_size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            journal_size = 0
+        if _file_id(self.path) == self._snapshot_id and journal_size == self._journal_size:
+            return
+        with self._lock, _file_lock(self.lock_path):
+            self._sync()
+
+    # ---------- 持久化 ----------
+
+    def _append_journal(self, entry: dict) -> None:
+        """追加一条日志；调用方需持有锁，且已 _sync 到日志末尾"""
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        if self._journal_size > self._journal_offset:
+            # 先结束中途退出的进程留下的半行，重放时作为无效行跳过
+            line = "\n" + line
+        # 每次重新打开：合并快照时其他进程会删除日志文件
+        with open(self.journal_path, "ab") as f:
+            f.write(line.encode("utf-8"))
+            self._journal_offset = self._journal_size = f.tell()
+        self._journal_ops += 1
+        if self._journal_ops >= _COMPACT_THRESHOLD:
+            self._write_snapshot()
+
+    def _write_snapshot(self) -> None:
+        """把当前状态写成快照（原子替换）并清空日志；调用方需持有锁，且已 _sync 到日志末尾"""
+        # 只保存仍被引用的词，顺便回收删除笔记留下的词
+        live = np.flatnonzero(self._df[: len(self._terms)] > 0)
+        remap = np.full(len(self._terms), -1, dtype=np.int32)
+        remap[live] = np.arange(len(live), dtype=np.int32)
+        terms = [self._terms[i] for i in live.tolist()]
+        note_ids = list(self._notes)
+        offsets = np.zeros(len(note_ids) + 1, dtype=np.int64)
+        chunks = []
+        for i, note_id in enumerate(note_ids):
+            ids = remap[self._notes[note_id]]
+            chunks.append(ids)
+            offsets[i + 1] = offsets[i] + len(ids)
+        all_ids = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int32)
+        lengths = np.array([self._lengths[n] for n in note_ids], dtype=np.int32)
+        vocab_blob = "\n".join(terms).encode("utf-8")
+        notes_blob = "\n".join(note_ids).encode("utf-8")
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".corpus-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, len(terms), len(note_ids), self._total_length))
+                for blob in (vocab_blob, notes_blob):
+                    f.write(struct.pack("<Q", len(blob)))
+                    f.write(blob)
+                for array in (self._df[live], lengths, offsets, all_ids):
+                    f.write(array.tobytes())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        # 内存中的编号与快照保持一致
+        self._terms = terms
+        self._vocab = {term: i for i, term in enumerate(terms)}
+        self._df = np.concatenate([self._df[live], np.zeros(max(1024, len(terms)), dtype=np.int32)])
+        self._notes = {note_id: remap[ids] for note_id, ids in self._notes.items()}
+
+        if os.path.exists(self.journal_path):
+            os.unlink(self.journal_path)
+        self._snapshot_id = _file_id(self.path)
+        self._journal_offset = self._journal_size = 0
+        self._journal_ops = 0
+
+    def _read_snapshot(self) -> None:
+        with open(self.path, "rb") as f:
+            buf = f.read()
+        magic, n_terms, n_notes, total_length = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"无效的语料索引文件: {self.path}")
+        offset = _HEADER.size
+        blobs = []
+        for _ in range(2):
+            (size,) = struct.unpack_from("<Q", buf, offset)
+            offset += 8
+            blobs.append(buf[offset : offset + size].decode("utf-8"))
+            offset += size
+
+        def take(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        df = take(np.int32, n_terms)
+        lengths = take(np.int32, n_notes)
+        offsets = take(np.int64, n_notes + 1)
+        all_ids = take(np.int32, int(offsets[-1]))
+
+        self._terms = blobs[0].split("\n") if n_terms else []
+        self._vocab = {term: i for i, term in enumerate(self._terms)}
+        self._df = np.concatenate([df, np.zeros(max(1024, n_terms), dtype=np.int32)])
+        note_ids = blobs[1].split("\n") if n_notes else []
+        bounds = offsets.tolist()
+        self._notes = {note_id: all_ids[bounds[i] : bounds[i + 1]] for i, note_id in enumerate(note_ids)}
+        self._lengths = dict(zip(note_ids, lengths.tolist()))
+        self._total_length = total_length
+
+    def _sync(self) -> None:
+        """与磁盘同步：快照被替换（或首次加载）时重新读取快照，再重放尚未重放的日志；调用方需持有锁"""
+        snapshot_id = _file_id(self.path)
+        if snapshot_id != self._snapshot_id:
+            self._reset()
+            if snapshot_id is not None:
+                self._read_snapshot()
+            self._snapshot_id = snapshot_id
+            self._journal_offset = self._journal_size = 0
+            self._journal_ops = 0
+
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                # 进程中途退出时留下的不完整行
+                continue
+            if entry.get("op") == "set":
+                self._apply_set(entry["note"], entry.get("terms", []))
+            elif entry.get("op") == "del":
+                self._apply_remove(entry["note"])
+            self._journal_ops += 1
+        self._journal_size = self._journal_offset + len(data)
+        self._journal_offset += end
+
+    def load(self) -> bool:
+        """
+        从快照 + 日志加载索引。
+
+        Returns:
+            快照或日志存在时返回 True；都不存在时返回 False（需要调用方用全部笔记 rebuild）
+        """
+        if not os.path.exists(self.path) and not os.path.exists(self.journal_path):
+            # 还没有索引（由调用方 rebuild），不必创建锁文件
+            self.loaded = False
+            return False
+        with self._lock, _file_lock(self.lock_path):
+            self._snapshot_id = None
+            self._sync()
+            found = self._snapshot_id is not None or os.path.exists(self.journal_path)
+            if self._journal_ops >= _COMPACT_THRESHOLD:
+                self._write_snapshot()
+            self.loaded = found
+            return found
+
+    def close(self) -> None:
+        """日志每次追加后即关闭，没有需要释放的资源；保留以兼容调用方"""
+
+
+_index: Optional[CorpusIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_corpus_index() -> CorpusIndex:
+    """返回进程内共享的语料索引（首次调用时从磁盘加载，之后同步其他进程的修改）"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = CorpusIndex()
+                try:
+                    index.load()
+                except (OSError, ValueError, struct.error) as exc:
+                    print(f"[CorpusIndex] 加载失败，将重建: {exc}")
+                    index = CorpusIndex()
+                _index = index
+                return _index
+    try:
+        _index.refresh()
+    except (OSError, ValueError, struct.error) as exc:
+        print(f"[CorpusIndex] 同步失败，继续使用内存中的索引: {exc}")
+    return _index
+
+
+__all__ = ["CorpusIndex", "get_corpus_index"]
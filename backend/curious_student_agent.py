@@ -1,45 +1,62 @@
-from typing import Annotated, List
+from functools import lru_cache
+from typing import Optional
 
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
-from langgraph.graph import END, StateGraph, add_messages
-from typing_extensions import TypedDict
+from langchain_core.messages import HumanMessage, SystemMessage
+from langgraph.graph import END, StateGraph
 
 try:
-    from .llm import get_default_llm
+    from .agent_sessions import SessionState, get_session_store, history_with_summary, make_compact_node
+    from .llm import get_default_llm, invoke_llm
     from .system_prompt import curious_student_agent_system_prompt
 except ImportError:
-    from llm import get_default_llm
+    from agent_sessions import SessionState, get_session_store, history_with_summary, make_compact_node
+    from llm import get_default_llm, invoke_llm
     from system_prompt import curious_student_agent_system_prompt
 
 
-class AgentState(TypedDict):
-    messages: Annotated[List[BaseMessage], add_messages]
-
-
 def _build_graph():
     llm = get_default_llm()
-    graph = StateGraph(AgentState)
+    graph = StateGraph(SessionState)
 
-    def call_model(state: AgentState):
+    def call_model(state: SessionState):
         conversation = [SystemMessage(content=curious_student_agent_system_prompt.strip())]
-        conversation.extend(state["messages"])
-        response = llm.invoke(conversation)
+        conversation.extend(history_with_summary(state))
+        response = invoke_llm(llm, conversation, call_site="curious_student")
         return {"messages": [response]}
 
+    graph.add_node("compact", make_compact_node(llm))
     graph.add_node("llm", call_model)
-    graph.set_entry_point("llm")
+    graph.set_entry_point("compact")
+    graph.add_edge("compact", "llm")
     graph.add_edge("llm", END)
-    return graph.compile()
+    return graph
+
 
+_GRAPH_BUILDER = _build_graph()
+_CURIOUS_STUDENT_GRAPH = _GRAPH_BUILDER.compile()
 
-_CURIOUS_STUDENT_GRAPH = _build_graph()
 
+@lru_cache(maxsize=1)
+def _session_graph():
+    """带 checkpointer 的图，首次使用会话时才创建存储"""
+    return _GRAPH_BUILDER.compile(checkpointer=get_session_store().saver)
 
-def run_curious_student_agent(user_text: str) -> str:
+
+def run_curious_student_agent(
+    user_text: str, session_id: Optional[str] = None, card: Optional[str] = None
+) -> str:
     """
     以 LangGraph 执行提示词,返回模型回复内容。
+
+    传入 session_id 时在服务端会话（按 session_id + card 区分）中继续对话，
+    客户端每轮只需发送本轮输入；不传则为无状态的单轮调用。
     """
-    result = _CURIOUS_STUDENT_GRAPH.invoke({"messages": [HumanMessage(content=user_text)]})
+    message = {"messages": [HumanMessage(content=user_text)]}
+    if not session_id:
+        result = _CURIOUS_STUDENT_GRAPH.invoke(message)
+    else:
+        config = get_session_store().open("curious_student", session_id, card)
+        result = _session_graph().invoke(message, config)
     return result["messages"][-1].content
 
 
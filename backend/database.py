@@ -5,10 +5,16 @@ SQLite 数据库实现
 
 import sqlite3
 from datetime import datetime, timedelta
-from pathlib import Path
 from typing import Dict, List, Optional
 from uuid import uuid4
 
+try:
+    from .config import sqlite_db_path
+    from .term_normalizer import clean_term, normalize_term
+except ImportError:  # pragma: no cover
+    from config import sqlite_db_path
+    from term_normalizer import clean_term, normalize_term
+
 
 class Note:
     """笔记模型"""
@@ -95,10 +101,12 @@ class Database:
                     status TEXT NOT NULL DEFAULT 'notStarted',
                     created_at TEXT NOT NULL,
                     last_reviewed_at TEXT,
+                    normalized_term TEXT,
                     FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE,
                     UNIQUE(note_id, term)
                 )
             """)
+            self._migrate_normalized_terms(cursor)
 
             # 创建索引以提高查询性能
             # 创建复习计划表
@@ -131,6 +139,10 @@ class Database:
                 CREATE INDEX IF NOT EXISTS idx_flash_cards_note_id 
                 ON flash_cards(note_id)
             """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_flash_cards_term
+                ON flash_cards(term)
+            """)
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_flash_cards_status 
                 ON flash_cards(status)
@@ -156,6 +168,33 @@ class Database:
         finally:
             conn.close()
 
+    def _migrate_normalized_terms(self, cursor: sqlite3.Cursor) -> None:
+        """
+        旧数据库补充 normalized_term 列并回填。
+        同一笔记内规范化后重复的旧卡片只有最早的一张获得 normalized_term，其余保持 NULL（不删除数据）。
+        """
+        cursor.execute("PRAGMA table_info(flash_cards)")
+        if "normalized_term" not in {row["name"] for row in cursor.fetchall()}:
+            cursor.execute("ALTER TABLE flash_cards ADD COLUMN normalized_term TEXT")
+        # 同一笔记内按规范化词条去重（NULL 不参与唯一约束）
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_flash_cards_note_normalized
+            ON flash_cards(note_id, normalized_term)
+        """)
+        cursor.execute("""
+            SELECT id, term FROM flash_cards
+            WHERE normalized_term IS NULL
+            ORDER BY created_at
+        """)
+        updated = 0
+        for row in cursor.fetchall():
+            cursor.execute("""
+                UPDATE OR IGNORE flash_cards SET normalized_term = ? WHERE id = ?
+            """, (normalize_term(row["term"]) or None, row["id"]))
+            updated += cursor.rowcount
+        if updated:
+            print(f"[Database] 已回填 {updated} 张闪词卡片的 normalized_term")
+
     def create_note(
         self, title: Optional[str], content: str
     ) -> Note:
@@ -321,23 +360,22 @@ class Database:
         try:
             cursor = conn.cursor()
 
-            # 获取现有的词条，用于去重
-            cursor.execute("""
-                SELECT term FROM flash_cards WHERE note_id = ?
-            """, (note_id,))
-            existing_terms = {row["term"] for row in cursor.fetchall()}
-
             # 插入新词条
-            for term in terms:
-                # 如果已存在相同的词条，跳过（保留原有的学习状态）
-                if term in existing_terms:
+            for raw_term in terms:
+                term = clean_term(raw_term)
+                normalized = normalize_term(term)
+                if not normalized:
                     continue
 
+                # 规范化后已存在相同的词条时由唯一索引拦下，跳过（保留原有的学习状态）
                 card_id = str(uuid4())
                 cursor.execute("""
-                    INSERT INTO flash_cards (id, note_id, term, status, created_at)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (card_id, note_id, term, "notStarted", now_str))
+                    INSERT INTO flash_cards (id, note_id, term, normalized_term, status, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT DO NOTHING
+                """, (card_id, note_id, term, normalized, "notStarted", now_str))
+                if cursor.rowcount == 0:
+                    continue
 
                 # 为新词条创建复习计划（notStarted 状态：4小时后复习）
                 next_review = now + timedelta(hours=4)
@@ -366,6 +404,41 @@ class Database:
 
         return new_cards
 
+    def list_flash_card_terms(self) -> List[str]:
+        """获取所有闪词卡片的词条（去重），用于构建分词词典"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT term FROM flash_cards")
+            return [row["term"] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def get_notes_for_terms(
+        self, terms: List[str], exclude_note_id: Optional[str] = None
+    ) -> Dict[str, List[str]]:
+        """查询哪些笔记已有这些词条的闪词卡片：返回 词条 -> 笔记ID 列表"""
+        result: Dict[str, List[str]] = {}
+        if not terms:
+            return result
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            # SQLite 单条语句的参数个数有上限，分批查询
+            for i in range(0, len(terms), 500):
+                chunk = terms[i : i + 500]
+                placeholders = ",".join("?" for _ in chunk)
+                cursor.execute(f"""
+                    SELECT DISTINCT term, note_id FROM flash_cards
+                    WHERE term IN ({placeholders})
+                """, chunk)
+                for row in cursor.fetchall():
+                    if row["note_id"] != exclude_note_id:
+                        result.setdefault(row["term"], []).append(row["note_id"])
+            return result
+        finally:
+            conn.close()
+
     def get_flash_cards(self, note_id: str) -> List[FlashCard]:
         """获取笔记的所有闪词卡片"""
         conn = self._get_connection()
@@ -404,11 +477,13 @@ class Database:
             now = datetime.now()
             now_str = now.isoformat()
             
-            # 先获取卡片ID
+            # 先获取卡片ID（按规范化词条匹配，"ＡＰＩ" 与 "API" 是同一张卡片）
             cursor.execute("""
                 SELECT id FROM flash_cards 
-                WHERE note_id = ? AND term = ?
-            """, (note_id, term))
+                WHERE note_id = ? AND (term = ? OR normalized_term = ?)
+                ORDER BY term = ? DESC
+                LIMIT 1
+            """, (note_id, term, normalize_term(clean_term(term)), term))
             row = cursor.fetchone()
             if not row:
                 return False
@@ -419,8 +494,8 @@ class Database:
             cursor.execute("""
                 UPDATE flash_cards 
                 SET status = ?, last_reviewed_at = ?
-                WHERE note_id = ? AND term = ?
-            """, (status, now_str, note_id, term))
+                WHERE id = ?
+            """, (status, now_str, card_id))
             
             if cursor.rowcount == 0:
                 return False
@@ -717,6 +792,5 @@ class Database:
 
 
 # 全局数据库实例
-# 数据库文件存储在 backend 目录下
-_db_path = Path(__file__).parent / "notes.db"
-db = Database(str(_db_path))
+# 数据库文件默认存储在 backend 目录下，可通过 SQLITE_DB_PATH 覆盖
+db = Database(sqlite_db_path)
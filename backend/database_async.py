@@ -1,6 +1,13 @@
 """
 PostgreSQL 数据库实现
-用于存储笔记和闪词卡片数据
+用于存储笔记和闪词卡片数据，以及复习计划（review_schedule）与学习历史（learning_history），
+与 SQLite 版本（database.py）的复习与统计功能一致
+
+- review_schedule：每张卡片一行，按 next_review_at 的 B-tree 索引查询到期卡片
+  （行会被原地更新，物理顺序与时间无关，不适合 BRIN）
+- learning_history：按 studied_at 按月（UTC）范围分区，分区由 ensure_learning_history_partition()
+  自动创建（启动时建好当月与下月，写入时分区缺失再补建）；只追加写入，studied_at 用 BRIN 索引。
+  LEARNING_HISTORY_RETENTION_MONTHS 大于 0 时启动时整月删除过期分区
 """
 
 from datetime import datetime, timedelta
@@ -9,7 +16,8 @@ from uuid import uuid4
 import asyncpg
 from contextlib import asynccontextmanager
 
-from config import database_url
+from config import database_url, learning_history_retention_months
+from term_normalizer import clean_term, normalize_term
 
 
 class Note:
@@ -105,16 +113,77 @@ class Database:
                     status TEXT NOT NULL DEFAULT 'notStarted',
                     created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
                     last_reviewed_at TIMESTAMP WITH TIME ZONE,
+                    normalized_term TEXT,
                     FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE,
                     UNIQUE(note_id, term)
                 )
             """)
+            await self._migrate_normalized_terms(conn)
 
             # 创建索引
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_flash_cards_note_id ON flash_cards(note_id)")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_flash_cards_term ON flash_cards(term)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_flash_cards_status ON flash_cards(status)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_notes_created_at ON notes(created_at)")
 
+            # 复习计划表
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS review_schedule (
+                    id TEXT PRIMARY KEY,
+                    card_id TEXT NOT NULL UNIQUE,
+                    next_review_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                    review_count INTEGER NOT NULL DEFAULT 0,
+                    FOREIGN KEY (card_id) REFERENCES flash_cards(id) ON DELETE CASCADE
+                )
+            """)
+            await conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_review_schedule_next_review ON review_schedule(next_review_at)"
+            )
+            await self._backfill_review_schedule(conn)
+
+            # 学习历史表（按月分区）
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS learning_history (
+                    id TEXT NOT NULL,
+                    card_id TEXT NOT NULL,
+                    note_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    duration_seconds INTEGER NOT NULL DEFAULT 0,
+                    studied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+                    PRIMARY KEY (id, studied_at),
+                    FOREIGN KEY (card_id) REFERENCES flash_cards(id) ON DELETE CASCADE,
+                    FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE
+                ) PARTITION BY RANGE (studied_at)
+            """)
+            await conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_learning_history_card_id ON learning_history(card_id)"
+            )
+            await conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_learning_history_studied_at "
+                "ON learning_history USING BRIN (studied_at)"
+            )
+            await conn.execute("""
+                CREATE OR REPLACE FUNCTION ensure_learning_history_partition(ts TIMESTAMP WITH TIME ZONE)
+                RETURNS TEXT AS $$
+                DECLARE
+                    -- 按 UTC 划分月份，分区边界与名称不随会话时区变化
+                    month_start TIMESTAMP WITH TIME ZONE := date_trunc('month', ts AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+                    month_end TIMESTAMP WITH TIME ZONE := (date_trunc('month', ts AT TIME ZONE 'UTC') + INTERVAL '1 month') AT TIME ZONE 'UTC';
+                    partition_name TEXT := 'learning_history_' || to_char(month_start AT TIME ZONE 'UTC', 'YYYY_MM');
+                BEGIN
+                    EXECUTE format(
+                        'CREATE TABLE IF NOT EXISTS %I PARTITION OF learning_history FOR VALUES FROM (%L) TO (%L)',
+                        partition_name, month_start, month_end
+                    );
+                    RETURN partition_name;
+                END;
+                $$ language 'plpgsql'
+            """)
+            await self._ensure_history_partition(conn, "NOW()")
+            await self._ensure_history_partition(conn, "NOW() + INTERVAL '1 month'")
+            if learning_history_retention_months > 0:
+                await self._drop_history_partitions(conn, learning_history_retention_months)
+
             # 创建更新时间触发器函数
             await conn.execute("""
                 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -239,30 +308,161 @@ class Database:
             row = await conn.fetchrow("SELECT COUNT(*) as count FROM notes")
             return row['count']
 
+    async def _migrate_normalized_terms(self, conn) -> None:
+        """
+        旧数据库补充 normalized_term 列并回填。
+        同一笔记内规范化后重复的旧卡片只有最早的一张获得 normalized_term，其余保持 NULL（不删除数据）。
+        """
+        await conn.execute("ALTER TABLE flash_cards ADD COLUMN IF NOT EXISTS normalized_term TEXT")
+        # 同一笔记内按规范化词条去重（NULL 不参与唯一约束）
+        await conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_flash_cards_note_normalized "
+            "ON flash_cards(note_id, normalized_term)"
+        )
+        rows = await conn.fetch(
+            "SELECT id, term FROM flash_cards WHERE normalized_term IS NULL ORDER BY created_at"
+        )
+        updated = 0
+        for row in rows:
+            try:
+                async with conn.transaction():
+                    result = await conn.execute(
+                        "UPDATE flash_cards SET normalized_term = $1 WHERE id = $2",
+                        normalize_term(row['term']) or None, row['id']
+                    )
+                    updated += result != "UPDATE 0"
+            except asyncpg.UniqueViolationError:
+                continue
+        if updated:
+            print(f"[Database] 已回填 {updated} 张闪词卡片的 normalized_term")
+
+    async def _backfill_review_schedule(self, conn) -> None:
+        """
+        为还没有复习计划的旧卡片补充复习计划（可重复执行）。
+        下次复习时间 = 上次复习时间（没有则为创建时间）+ 状态对应的间隔，与 update_flash_card_status 一致，
+        升级前已经到期的卡片仍会出现在复习列表中。
+        """
+        result = await conn.execute(
+            """
+            INSERT INTO review_schedule (id, card_id, next_review_at, review_count)
+            SELECT gen_random_uuid()::text, fc.id,
+                   COALESCE(fc.last_reviewed_at, fc.created_at) + CASE fc.status
+                       WHEN 'needsReview' THEN INTERVAL '1 day'
+                       WHEN 'needsImprove' THEN INTERVAL '3 days'
+                       WHEN 'mastered' THEN INTERVAL '7 days'
+                       ELSE INTERVAL '4 hours'
+                   END,
+                   0
+            FROM flash_cards fc
+            WHERE NOT EXISTS (SELECT 1 FROM review_schedule rs WHERE rs.card_id = fc.id)
+            ON CONFLICT (card_id) DO NOTHING
+            """
+        )
+        backfilled = int(result.split()[-1])
+        if backfilled:
+            print(f"[Database] 已为 {backfilled} 张闪词卡片补充复习计划")
+
+    async def _ensure_history_partition(self, conn, ts_sql: str) -> None:
+        """创建 ts_sql（SQL 表达式）所在月份的学习历史分区；多个进程同时创建时忽略冲突"""
+        try:
+            async with conn.transaction():
+                await conn.execute(f"SELECT ensure_learning_history_partition({ts_sql})")
+        except (asyncpg.DuplicateTableError, asyncpg.UniqueViolationError):
+            pass
+
+    async def _drop_history_partitions(self, conn, retention_months: int) -> None:
+        """整月删除早于保留期的学习历史分区（比逐行 DELETE 便宜得多）"""
+        rows = await conn.fetch(
+            """
+            SELECT c.relname AS name
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'learning_history'::regclass
+              AND c.relname < 'learning_history_' || to_char(
+                  date_trunc('month', NOW() AT TIME ZONE 'UTC') - make_interval(months => $1), 'YYYY_MM'
+              )
+            """,
+            retention_months
+        )
+        for row in rows:
+            await conn.execute(f'DROP TABLE IF EXISTS "{row["name"]}"')
+        if rows:
+            print(f"[Database] 已删除 {len(rows)} 个过期的学习历史分区")
+
+    async def _insert_learning_history(
+        self, conn, card_id: str, note_id: str, status: str, duration_seconds: int
+    ) -> None:
+        """写入一条学习历史（studied_at 为数据库当前时间）；所在月份的分区不存在时先创建"""
+        args = (str(uuid4()), card_id, note_id, status, duration_seconds)
+        sql = """
+            INSERT INTO learning_history (id, card_id, note_id, status, duration_seconds, studied_at)
+            VALUES ($1, $2, $3, $4, $5, NOW())
+        """
+        try:
+            async with conn.transaction():
+                await conn.execute(sql, *args)
+        except asyncpg.CheckViolationError:
+            # 没有对应的分区（通常启动时已建好当月与下月）
+            await self._ensure_history_partition(conn, "NOW()")
+            await conn.execute(sql, *args)
+
     async def create_flash_cards(self, note_id: str, terms: List[str]) -> List[FlashCard]:
-        """创建闪词卡片"""
+        """创建闪词卡片（按规范化词条去重，已存在的词条由唯一索引拦下）"""
         cards = []
         now = datetime.now()
         
         async with self.get_connection() as conn:
             async with conn.transaction():
-                for term in terms:
-                    try:
-                        card_id = str(uuid4())
+                for raw_term in terms:
+                    term = clean_term(raw_term)
+                    normalized = normalize_term(term)
+                    if not normalized:
+                        continue
+                    card_id = await conn.fetchval(
+                        """
+                        INSERT INTO flash_cards (id, note_id, term, normalized_term, status, created_at)
+                        VALUES ($1, $2, $3, $4, $5, $6)
+                        ON CONFLICT DO NOTHING
+                        RETURNING id
+                        """,
+                        str(uuid4()), note_id, term, normalized, "notStarted", now
+                    )
+                    if card_id:
+                        # 为新词条创建复习计划（notStarted 状态：4小时后复习）
                         await conn.execute(
                             """
-                            INSERT INTO flash_cards (id, note_id, term, status, created_at)
-                            VALUES ($1, $2, $3, $4, $5)
-                            ON CONFLICT (note_id, term) DO NOTHING
+                            INSERT INTO review_schedule (id, card_id, next_review_at, review_count)
+                            VALUES ($1, $2, NOW() + INTERVAL '4 hours', 0)
                             """,
-                            card_id, note_id, term, "notStarted", now
+                            str(uuid4()), card_id
                         )
                         cards.append(FlashCard(card_id, note_id, term, "notStarted", now))
-                    except Exception:
-                        pass
         
         return cards
 
+    async def list_flash_card_terms(self) -> List[str]:
+        """获取所有闪词卡片的词条（去重），用于构建分词词典"""
+        async with self.get_connection() as conn:
+            rows = await conn.fetch("SELECT DISTINCT term FROM flash_cards")
+            return [row['term'] for row in rows]
+
+    async def get_notes_for_terms(
+        self, terms: List[str], exclude_note_id: Optional[str] = None
+    ) -> Dict[str, List[str]]:
+        """查询哪些笔记已有这些词条的闪词卡片：返回 词条 -> 笔记ID 列表"""
+        result: Dict[str, List[str]] = {}
+        if not terms:
+            return result
+        async with self.get_connection() as conn:
+            rows = await conn.fetch(
+                "SELECT DISTINCT term, note_id FROM flash_cards WHERE term = ANY($1::text[])",
+                terms,
+            )
+        for row in rows:
+            if row['note_id'] != exclude_note_id:
+                result.setdefault(row['term'], []).append(row['note_id'])
+        return result
+
     async def get_flash_cards(self, note_id: str) -> List[FlashCard]:
         """获取闪词卡片"""
         async with self.get_connection() as conn:
@@ -288,18 +488,74 @@ class Database:
                 for row in rows
             ]
 
-    async def update_flash_card_status(self, card_id: str, status: str) -> bool:
-        """更新闪词卡片状态"""
+    async def find_flash_card_id(self, note_id: str, term: str) -> Optional[str]:
+        """按词条查找笔记中的闪词卡片ID（按规范化词条匹配，"ＡＰＩ" 与 "API" 是同一张卡片）"""
         async with self.get_connection() as conn:
-            result = await conn.execute(
+            return await conn.fetchval(
                 """
-                UPDATE flash_cards 
-                SET status = $1, last_reviewed_at = $2 
-                WHERE id = $3
+                SELECT id FROM flash_cards
+                WHERE note_id = $1 AND (term = $2 OR normalized_term = $3)
+                ORDER BY term = $2 DESC
+                LIMIT 1
                 """,
-                status, datetime.now(), card_id
+                note_id, term, normalize_term(clean_term(term))
             )
-            return result != "UPDATE 0"
+
+    async def update_flash_card_status(self, card_id: str, status: str) -> bool:
+        """更新闪词卡片状态，计算下次复习时间并记录学习历史"""
+        # 根据状态计算下次复习时间（与 SQLite 版本一致）
+        if status == 'needsReview':
+            interval = timedelta(days=1)  # 1天后
+        elif status == 'needsImprove':
+            interval = timedelta(days=3)  # 3天后
+        elif status == 'mastered':
+            interval = timedelta(days=7)  # 7天后
+        else:  # notStarted 或其他状态
+            interval = timedelta(hours=4)  # 4小时后
+
+        async with self.get_connection() as conn:
+            async with conn.transaction():
+                note_id = await conn.fetchval(
+                    """
+                    UPDATE flash_cards
+                    SET status = $1, last_reviewed_at = NOW()
+                    WHERE id = $2
+                    RETURNING note_id
+                    """,
+                    status, card_id
+                )
+                if note_id is None:
+                    return False
+
+                # 更新或创建复习计划
+                await conn.execute(
+                    """
+                    INSERT INTO review_schedule (id, card_id, next_review_at, review_count)
+                    VALUES ($1, $2, NOW() + $3::interval, 0)
+                    ON CONFLICT (card_id) DO UPDATE SET
+                        next_review_at = EXCLUDED.next_review_at,
+                        review_count = review_schedule.review_count + 1
+                    """,
+                    str(uuid4()), card_id, interval
+                )
+
+                # 记录学习历史（默认每次学习耗时60秒）
+                await self._insert_learning_history(conn, card_id, note_id, status, 60)
+            return True
+
+    async def record_learning_history(
+        self, card_id: str, note_id: str, status: str, duration_seconds: int = 0
+    ) -> None:
+        """记录学习历史
+
+        Args:
+            card_id: 闪词卡片ID
+            note_id: 笔记ID
+            status: 学习后的状态
+            duration_seconds: 学习时长（秒），默认为0
+        """
+        async with self.get_connection() as conn:
+            await self._insert_learning_history(conn, card_id, note_id, status, duration_seconds)
 
     async def get_flash_card_progress(self, note_id: str) -> Dict[str, int]:
         """获取闪词学习进度"""
@@ -330,33 +586,151 @@ class Database:
             
             return progress
 
-    async def get_review_cards(self, limit: int = 50) -> List[FlashCard]:
-        """获取需要复习的卡片"""
+    async def get_learning_statistics(self) -> Dict[str, int]:
+        """获取学习统计信息（全局统计）"""
         async with self.get_connection() as conn:
-            rows = await conn.fetch(
+            row = await conn.fetchrow(
+                """
+                SELECT
+                    COUNT(*) FILTER (WHERE status = 'mastered') AS mastered,
+                    COUNT(*) AS total_terms
+                FROM flash_cards
                 """
-                SELECT id, note_id, term, status, created_at, last_reviewed_at 
-                FROM flash_cards 
-                WHERE status IN ('needsReview', 'needsImprove') 
-                   OR (status = 'mastered' AND last_reviewed_at < NOW() - INTERVAL '7 days')
-                   OR (status = 'notStarted' AND created_at < NOW() - INTERVAL '1 day')
-                ORDER BY last_reviewed_at ASC NULLS FIRST, created_at ASC
-                LIMIT $1
-                """,
-                limit
             )
-            
-            return [
-                FlashCard(
-                    row['id'],
-                    row['note_id'],
-                    row['term'],
-                    row['status'],
-                    row['created_at'],
-                    row['last_reviewed_at']
+            total_seconds = await conn.fetchval(
+                "SELECT COALESCE(SUM(duration_seconds), 0) FROM learning_history"
+            )
+            consecutive_days = await self._calculate_consecutive_days(conn)
+
+        return {
+            "mastered": row['mastered'],
+            "totalTerms": row['total_terms'],
+            "consecutiveDays": consecutive_days,
+            "totalMinutes": int(total_seconds / 60),
+        }
+
+    async def _calculate_consecutive_days(self, conn) -> int:
+        """计算连续学习天数
+
+        从今天（今天没有学习时从昨天）往前逐天检查是否有学习记录，遇到没有记录的一天即中断。
+        每天只做一次按 studied_at 的范围探测，只会扫描最近几个月的分区，不读取全部历史。
+        """
+        return await conn.fetchval(
+            """
+            WITH RECURSIVE start_day AS (
+                SELECT CASE
+                    WHEN EXISTS (
+                        SELECT 1 FROM learning_history
+                        WHERE studied_at >= CURRENT_DATE
+                          AND studied_at < CURRENT_DATE + 1
+                    ) THEN CURRENT_DATE
+                    ELSE CURRENT_DATE - 1
+                END AS day
+            ),
+            streak(day) AS (
+                SELECT day FROM start_day
+                WHERE EXISTS (
+                    SELECT 1 FROM learning_history
+                    WHERE studied_at >= start_day.day
+                      AND studied_at < start_day.day + 1
                 )
-                for row in rows
-            ]
+                UNION ALL
+                SELECT streak.day - 1 FROM streak
+                WHERE EXISTS (
+                    SELECT 1 FROM learning_history
+                    WHERE studied_at >= streak.day - 1
+                      AND studied_at < streak.day
+                )
+            )
+            SELECT COUNT(*) FROM streak
+            """
+        )
+
+    async def get_today_review_statistics(self) -> Dict[str, int]:
+        """获取今日复习统计信息（基于复习时间间隔）"""
+        async with self.get_connection() as conn:
+            # 条件：状态为 needsReview 或 needsImprove，且 next_review_at <= 当前时间
+            row = await conn.fetchrow(
+                """
+                SELECT
+                    COUNT(*) AS total,
+                    COUNT(*) FILTER (WHERE fc.status = 'needsReview') AS needs_review,
+                    COUNT(*) FILTER (WHERE fc.status = 'needsImprove') AS needs_improve
+                FROM review_schedule rs
+                INNER JOIN flash_cards fc ON fc.id = rs.card_id
+                WHERE rs.next_review_at <= NOW()
+                  AND fc.status IN ('needsReview', 'needsImprove')
+                """
+            )
+        return {
+            "total": row['total'],
+            "needsReview": row['needs_review'],
+            "needsImprove": row['needs_improve'],
+        }
+
+    async def get_review_flash_cards(self, include_all: bool = False) -> List[FlashCard]:
+        """
+        获取闪词卡片列表（根据复习时间间隔过滤）
+
+        Args:
+            include_all: 如果为True，返回所有状态的词条；如果为False，只返回需要复习的词条（基于时间判断）
+        """
+        async with self.get_connection() as conn:
+            if include_all:
+                rows = await conn.fetch(
+                    """
+                    SELECT fc.id, fc.note_id, fc.term, fc.status, fc.created_at, fc.last_reviewed_at
+                    FROM flash_cards fc
+                    ORDER BY
+                        CASE fc.status
+                            WHEN 'needsReview' THEN 1
+                            WHEN 'needsImprove' THEN 2
+                            WHEN 'notStarted' THEN 3
+                            WHEN 'mastered' THEN 4
+                        END,
+                        fc.created_at ASC
+                    """
+                )
+            else:
+                # 按 next_review_at 索引取出到期的复习计划
+                rows = await conn.fetch(
+                    """
+                    SELECT fc.id, fc.note_id, fc.term, fc.status, fc.created_at, fc.last_reviewed_at
+                    FROM review_schedule rs
+                    INNER JOIN flash_cards fc ON fc.id = rs.card_id
+                    WHERE rs.next_review_at <= NOW()
+                      AND fc.status IN ('needsReview', 'needsImprove')
+                    ORDER BY
+                        CASE fc.status
+                            WHEN 'needsReview' THEN 1
+                            WHEN 'needsImprove' THEN 2
+                        END,
+                        rs.next_review_at ASC
+                    """
+                )
+
+        return [
+            FlashCard(
+                row['id'],
+                row['note_id'],
+                row['term'],
+                row['status'],
+                row['created_at'],
+                row['last_reviewed_at']
+            )
+            for row in rows
+        ]
+
+    async def get_note_titles(self, note_ids: List[str]) -> Dict[str, Optional[str]]:
+        """批量查询笔记标题：返回 笔记ID -> 标题"""
+        if not note_ids:
+            return {}
+        async with self.get_connection() as conn:
+            rows = await conn.fetch(
+                "SELECT id, title FROM notes WHERE id = ANY($1::text[])",
+                list(set(note_ids)),
+            )
+        return {row['id']: row['title'] for row in rows}
 
     async def close(self):
         """关闭连接池"""
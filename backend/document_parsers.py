@@ -0,0 +1,328 @@
+"""
+PPTX / EPUB / HTML 文本解析（逐页、逐章产出）
+
+这几种格式原先不支持，用户只能先导出为 PDF（常常还是图片版，需要整页 OCR）。
+它们本身都带有文本：pptx 与 epub 是 zip 包里的 XML/XHTML，html 就是标记文本，
+直接解析比 OCR 快几个数量级。只用标准库（zipfile、ElementTree、html.parser），不引入新依赖。
+
+- pptx：按演示文稿中的幻灯片顺序，每页产出幻灯片上的文本（含表格）与演讲者备注
+- epub：按 spine 阅读顺序，每章产出正文
+- html：整份文档产出一段；按块读取、增量解析，不需要把整个文件解码到内存
+
+各解析器产出 (序号, 文本, 总数)，与 PDF 的逐页产出一致，由 file_text_extractor 接入缓存与流式进度。
+"""
+
+from __future__ import annotations
+
+import codecs
+import io
+import os
+import posixpath
+import re
+import zipfile
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import unquote
+from xml.etree import ElementTree
+
+try:
+    from .config import upload_max_bytes
+except ImportError:  # pragma: no cover
+    from config import upload_max_bytes
+
+
+Source = Union[bytes, bytearray, memoryview, str, "os.PathLike[str]"]
+# (序号, 文本, 总数)
+Section = Tuple[int, str, int]
+
+_NS = {
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+    "container": "urn:oasis:names:tc:opendocument:xmlns:container",
+    "opf": "http://www.idpf.org/2007/opf",
+}
+_NOTES_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide"
+
+# 增量解析 HTML 时每次读取的字节数
+_HTML_CHUNK = 256 * 1024
+
+
+# ---------- zip 容器 ----------
+
+
+def _open_zip(source: Source) -> zipfile.ZipFile:
+    try:
+        if isinstance(source, (str, os.PathLike)):
+            return zipfile.ZipFile(source)
+        return zipfile.ZipFile(io.BytesIO(source))
+    except zipfile.BadZipFile as exc:
+        raise ValueError("文件已损坏或不是有效的 zip 容器") from exc
+
+
+def _read_member(archive: zipfile.ZipFile, name: str) -> bytes:
+    """读取包内文件；解压后的实际大小超过上传上限时报错（声明的大小可以伪造）"""
+    try:
+        with archive.open(name) as f:
+            data = f.read(upload_max_bytes + 1)
+    except KeyError as exc:
+        raise ValueError(f"文件结构不完整，缺少 {name}") from exc
+    if len(data) > upload_max_bytes:
+        raise ValueError(f"{name} 解压后过大")
+    return data
+
+
+def _parse_xml(archive: zipfile.ZipFile, name: str) -> ElementTree.Element:
+    try:
+        return ElementTree.fromstring(_read_member(archive, name))
+    except ElementTree.ParseError as exc:
+        raise ValueError(f"{name} 不是有效的 XML: {exc}") from exc
+
+
+def _relationships(archive: zipfile.ZipFile, part: str) -> Dict[str, Tuple[str, str]]:
+    """part 的关系表：Id -> (Type, 包内绝对路径)；没有关系文件时为空"""
+    directory, filename = posixpath.split(part)
+    rels_name = posixpath.join(directory, "_rels", filename + ".rels")
+    if rels_name not in archive.NameToInfo:
+        return {}
+    rels = {}
+    for rel in _parse_xml(archive, rels_name).findall("rel:Relationship", _NS):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = posixpath.normpath(posixpath.join(directory, rel.get("Target", "")))
+        rels[rel.get("Id", "")] = (rel.get("Type", ""), target.lstrip("/"))
+    return rels
+
+
+# ---------- PPTX ----------
+
+
+def _drawing_paragraphs(element: ElementTree.Element) -> List[str]:
+    lines = []
+    for paragraph in element.iter(f"{{{_NS['a']}}}p"):
+        parts = []
+        for node in paragraph.iter():
+            if node.tag == f"{{{_NS['a']}}}t" and node.text:
+                parts.append(node.text)
+            elif node.tag == f"{{{_NS['a']}}}br":
+                parts.append("\n")
+        line = "".join(parts).strip()
+        if line:
+            lines.append(line)
+    return lines
+
+
+def _notes_text(notes: ElementTree.Element) -> List[str]:
+    """备注页只取正文占位符（不含页码、幻灯片缩略图等）"""
+    lines = []
+    for shape in notes.iter(f"{{{_NS['p']}}}sp"):
+        placeholder = shape.find("p:nvSpPr/p:nvPr/p:ph", _NS)
+        if placeholder is not None and placeholder.get("type") == "body":
+            lines.extend(_drawing_paragraphs(shape))
+    return lines
+
+
+def iter_pptx_sections(source: Source) -> Iterator[Section]:
+    """按放映顺序逐页产出幻灯片文本与演讲者备注"""
+    with _open_zip(source) as archive:
+        presentation = "ppt/presentation.xml"
+        rels = _relationships(archive, presentation)
+        slide_ids = _parse_xml(archive, presentation).findall("p:sldIdLst/p:sldId", _NS)
+        slides = [rels[sid.get(f"{{{_NS['r']}}}id")][1] for sid in slide_ids if sid.get(f"{{{_NS['r']}}}id") in rels]
+        for index, slide in enumerate(slides):
+            lines = _drawing_paragraphs(_parse_xml(archive, slide))
+            for rel_type, target in _relationships(archive, slide).values():
+                if rel_type == _NOTES_REL_TYPE and target in archive.NameToInfo:
+                    lines.extend(_notes_text(_parse_xml(archive, target)))
+            yield index, "\n".join(lines), len(slides)
+
+
+# ---------- HTML ----------
+
+
+class _HTMLTextExtractor(HTMLParser):
+    """HTML 转纯文本：去掉脚本、样式等不可见内容，块级元素之间换行"""
+
+    _SKIP_TAGS = {"script", "style", "head", "noscript", "template", "svg", "math"}
+    _BLOCK_TAGS = {
+        "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption",
+        "footer", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol",
+        "p", "pre", "section", "table", "td", "th", "tr", "ul",
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._skip_depth = 0
+        self._pre_depth = 0
+        self._lines: List[str] = []
+        self._current: List[str] = []
+
+    def _break(self):
+        line = "".join(self._current)
+        if self._pre_depth == 0:
+            line = re.sub(r"\s+", " ", line)
+        line = line.strip()
+        if line:
+            self._lines.append(line)
+        self._current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self._BLOCK_TAGS:
+            self._break()
+            if tag == "pre":
+                self._pre_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self._BLOCK_TAGS:
+            self._break()
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self._BLOCK_TAGS:
+            self._break()
+            if tag == "pre":
+                self._pre_depth = max(0, self._pre_depth - 1)
+
+    def handle_data(self, data):
+        if self._skip_depth == 0:
+            self._current.append(data)
+
+    def text(self) -> str:
+        self.close()
+        self._break()
+        return "\n".join(self._lines)
+
+
+_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_\-]+)""", re.IGNORECASE)
+
+
+def _sniff_encoding(head: bytes, default: str = "utf-8") -> str:
+    """按 BOM、<meta charset> 判断编码；都没有时用 default"""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    match = _CHARSET_RE.search(head[:4096])
+    if match:
+        name = match.group(1).decode("ascii").lower()
+        # 声明为 gb2312/gbk 的页面里常有超出其字符集的字
+        if name in {"gb2312", "gbk"}:
+            return "gb18030"
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            pass
+    return default
+
+
+def html_to_text(markup: Union[str, bytes], default_encoding: str = "utf-8") -> str:
+    """把 HTML/XHTML 转为纯文本"""
+    if isinstance(markup, bytes):
+        markup = markup.decode(_sniff_encoding(markup, default_encoding), errors="replace")
+    parser = _HTMLTextExtractor()
+    parser.feed(markup)
+    return parser.text()
+
+
+def _iter_blocks(source: Source) -> Iterator[bytes]:
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            while True:
+                block = f.read(_HTML_CHUNK)
+                if not block:
+                    return
+                yield block
+    else:
+        view = memoryview(source)
+        for start in range(0, len(view), _HTML_CHUNK):
+            yield bytes(view[start : start + _HTML_CHUNK])
+
+
+def iter_html_sections(source: Source) -> Iterator[Section]:
+    """整份 HTML 产出一段；按块增量解码与解析"""
+    blocks = _iter_blocks(source)
+    # 编码声明一般在文档开头几 KB 内
+    first = b""
+    for block in blocks:
+        first += block
+        if len(first) >= 4096:
+            break
+    encoding = _sniff_encoding(first)
+    # 没有声明编码且不是合法 UTF-8 时按 GB18030（国内网页另存的常见情况）
+    if encoding == "utf-8":
+        try:
+            first.decode("utf-8")
+        except UnicodeDecodeError as exc:
+            # 只是块末尾截断了多字节字符时仍是 UTF-8
+            if exc.start < len(first) - 3:
+                encoding = "gb18030"
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    parser = _HTMLTextExtractor()
+    parser.feed(decoder.decode(first))
+    for block in blocks:
+        parser.feed(decoder.decode(block))
+    parser.feed(decoder.decode(b"", final=True))
+    yield 0, parser.text(), 1
+
+
+# ---------- EPUB ----------
+
+
+def _epub_spine(archive: zipfile.ZipFile) -> List[str]:
+    """按阅读顺序返回各章节的包内路径"""
+    container = _parse_xml(archive, "META-INF/container.xml")
+    rootfile = container.find("container:rootfiles/container:rootfile", _NS)
+    if rootfile is None or not rootfile.get("full-path"):
+        raise ValueError("EPUB 缺少 OPF 包文件")
+    opf_path = rootfile.get("full-path")
+    opf = _parse_xml(archive, opf_path)
+    base = posixpath.dirname(opf_path)
+
+    manifest = {}
+    for item in opf.findall("opf:manifest/opf:item", _NS):
+        href = unquote(item.get("href", "").split("#", 1)[0])
+        manifest[item.get("id")] = (posixpath.normpath(posixpath.join(base, href)), item.get("media-type", ""))
+    chapters = []
+    for itemref in opf.findall("opf:spine/opf:itemref", _NS):
+        path, media_type = manifest.get(itemref.get("idref"), (None, ""))
+        if path and "html" in media_type and path in archive.NameToInfo:
+            chapters.append(path)
+    return chapters
+
+
+def iter_epub_sections(source: Source) -> Iterator[Section]:
+    """按阅读顺序逐章产出正文"""
+    with _open_zip(source) as archive:
+        chapters = _epub_spine(archive)
+        for index, chapter in enumerate(chapters):
+            yield index, html_to_text(_read_member(archive, chapter)), len(chapters)
+
+
+# 扩展名 -> 逐段解析器
+SECTION_PARSERS = {
+    "pptx": iter_pptx_sections,
+    "epub": iter_epub_sections,
+    "html": iter_html_sections,
+    "htm": iter_html_sections,
+    "xhtml": iter_html_sections,
+}
+
+
+def iter_document_sections(ext: str, source: Source) -> Optional[Iterator[Section]]:
+    """ext 有对应的解析器时返回逐段产出的迭代器，否则返回 None"""
+    parser = SECTION_PARSERS.get(ext)
+    return parser(source) if parser is not None else None
+
+
+__all__ = [
+    "SECTION_PARSERS",
+    "html_to_text",
+    "iter_document_sections",
+    "iter_epub_sections",
+    "iter_html_sections",
+    "iter_pptx_sections",
+]
@@ -0,0 +1,172 @@
+"""
+文本提取结果缓存（按内容寻址）
+
+同一份讲义、课程大纲会被许多学生重复上传，每次都重新解析、OCR 代价很高。
+这里以内容的 SHA-256 为键把提取结果存成磁盘上的文本文件：
+
+- document：整份上传文件的提取结果，键为 文件内容哈希 + 影响结果的参数（类型、OCR 后端、DPI 等）
+- ocr_page：PDF 扫描页的 OCR 结果，键为渲染后位图的像素哈希，文档不同但页面相同也能命中
+
+容量按 EXTRACTION_CACHE_MAX_BYTES 限制，超出后按最近使用时间（文件 mtime，命中时更新）淘汰最旧的条目。
+缓存文件可被多个进程（API 进程与 PDF/OCR 工作进程）共享：写入采用临时文件 + 原子替换，
+淘汰时容忍其他进程已删除的文件。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Optional, Union
+
+try:
+    from .config import extraction_cache_dir, extraction_cache_max_bytes
+except ImportError:  # pragma: no cover
+    from config import extraction_cache_dir, extraction_cache_max_bytes
+
+
+# 提取逻辑变化导致结果不同时递增，使旧缓存失效
+CACHE_VERSION = 3
+
+# 淘汰时清理到容量上限的比例，避免每次写入都扫描目录
+_EVICT_TARGET = 0.9
+
+
+def digest_bytes(data) -> str:
+    """缓冲区对象（bytes、memoryview、mmap 等）的 SHA-256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def digest_source(source: Union[bytes, bytearray, memoryview, str, "os.PathLike[str]"]) -> str:
+    """文件内容（bytes 或文件路径）的 SHA-256"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    return digest_bytes(source)
+
+
+def cache_key(digest: str, *params) -> str:
+    """内容哈希加上影响结果的参数"""
+    suffix = "|".join(str(p) for p in (CACHE_VERSION, *params))
+    return f"{digest}-{hashlib.sha256(suffix.encode('utf-8')).hexdigest()[:16]}"
+
+
+class ExtractionCache:
+    """磁盘上按 LRU 淘汰、容量受限的文本缓存"""
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = directory or extraction_cache_dir
+        self.max_bytes = extraction_cache_max_bytes if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        # 缓存目录的大致总大小（首次写入时扫描得到，之后按写入累加）
+        self._total_bytes: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.directory, kind, key[:2], key + ".txt")
+
+    def get(self, kind: str, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        path = self._path(kind, key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            # 更新最近使用时间
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, UnicodeDecodeError) as exc:
+            print(f"[ExtractionCache] 读取失败: {exc}")
+            return None
+        return text
+
+    def put(self, kind: str, key: str, text: str) -> None:
+        if not self.enabled:
+            return
+        data = text.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(kind, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+        except OSError as exc:
+            print(f"[ExtractionCache] 写入失败: {exc}")
+            return
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total()
+            else:
+                self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".txt") or name.startswith("."):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                yield os.path.join(root, name), stat.st_size, stat.st_mtime
+
+    def _scan_total(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self) -> None:
+        """按最近使用时间删除最旧的条目，直到低于容量上限；调用方需持有锁"""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * _EVICT_TARGET
+        removed = 0
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total_bytes = total
+        print(f"[ExtractionCache] 淘汰 {removed} 个条目，当前 {total / 1024 / 1024:.1f}MB")
+
+
+_cache: Optional[ExtractionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """返回进程内共享的提取结果缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ExtractionCache()
+    return _cache
+
+
+__all__ = [
+    "CACHE_VERSION",
+    "ExtractionCache",
+    "cache_key",
+    "digest_bytes",
+    "digest_source",
+    "get_extraction_cache",
+]
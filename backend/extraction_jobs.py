@@ -0,0 +1,182 @@
+"""
+异步文本提取任务的处理函数（由 job_queue 的 worker 执行）
+
+任务 payload：
+- file：{"filename", "path", "max_terms"}，path 为上传时落盘的临时文件
+- batch：{"uploads": [[文件名, 路径], ...], "max_terms"}
+
+处理过程中通过 report 写入进度：页数/文件数，以及最多每 PARTIAL_UPDATE_INTERVAL 秒一次的
+部分文本与规则抽取的初步词语。任务可能被重试，所以处理函数不删除上传的临时文件，
+由 discard_job_files 在任务最终完成或失败后统一删除。
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from .batch_extractor import BatchItem, expand_uploads, is_archive, iter_batch_texts, join_batch_texts
+    from .file_text_extractor import iter_text_from_upload, join_chunks
+    from .metrics import time_stage
+    from .note_terms_extractor import extract_terms_from_long_note, extract_terms_from_note, preview_terms_from_note
+    from .pdf_extractor import count_pdf_pages
+    from .upload_spool import discard_upload
+except ImportError:  # pragma: no cover
+    from batch_extractor import BatchItem, expand_uploads, is_archive, iter_batch_texts, join_batch_texts
+    from file_text_extractor import iter_text_from_upload, join_chunks
+    from metrics import time_stage
+    from note_terms_extractor import extract_terms_from_long_note, extract_terms_from_note, preview_terms_from_note
+    from pdf_extractor import count_pdf_pages
+    from upload_spool import discard_upload
+
+
+# 处理中刷新部分文本与初步词语的最短间隔（秒）
+PARTIAL_UPDATE_INTERVAL = 2.0
+
+# 成本估算的基准：一个 5MB 或 10 页的文件约为 1
+ASYNC_FILE_SIZE_THRESHOLD = 5 * 1024 * 1024  # 5MB
+ASYNC_PAGE_COUNT_THRESHOLD = 10  # 10页
+
+Report = Callable[..., None]
+
+
+def estimate_job_cost(items: List[BatchItem]) -> float:
+    """
+    按文件大小与页数估算任务的处理成本（用于调度排序，越小越先处理）。
+    PDF 读取页数（只解析目录结构），其他文件按 1 页计；zip 只按大小估算。
+    """
+    cost = 0.0
+    for filename, path in items:
+        size_cost = os.path.getsize(path) / ASYNC_FILE_SIZE_THRESHOLD
+        if is_archive(filename):
+            cost += size_cost
+            continue
+        pages = count_pdf_pages(path) if filename.lower().endswith(".pdf") else None
+        cost += max(size_cost, (pages or 1) / ASYNC_PAGE_COUNT_THRESHOLD)
+    return cost
+
+
+def run_file_job(payload: Dict[str, Any], report: Report) -> Dict[str, Any]:
+    """单个文件：逐页提取文本并汇报进度，再抽取词语"""
+    filename = payload.get("filename") or "unknown"
+    max_terms = payload["max_terms"]
+    report(message="正在提取文本...", pages_done=0, partial=False)
+
+    pages: Dict[int, Optional[str]] = {}
+    last_update = 0.0
+    with time_stage("text_extraction"):
+        chunks = iter_text_from_upload(filename, payload["path"])
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration as stop:
+                result = stop.value
+                break
+            pages[chunk.index] = chunk.text
+            update: Dict[str, Any] = {
+                "pages_done": chunk.done,
+                "pages_total": chunk.total,
+                "message": f"正在提取文本（{chunk.done}/{chunk.total} 页）...",
+            }
+            now = time.monotonic()
+            if chunk.done < chunk.total and now - last_update >= PARTIAL_UPDATE_INTERVAL:
+                partial = join_chunks(pages)
+                update["text"] = partial
+                update["terms"] = preview_terms_from_note(partial, max_terms)
+                update["partial"] = True
+                last_update = time.monotonic()
+            report(**update)
+
+    # 文本已完整，初步词语按全文刷新，不再标记为部分结果
+    report(
+        message="正在提取术语...",
+        text=result.text,
+        terms=preview_terms_from_note(result.text, max_terms),
+        partial=False,
+        truncated_by=result.truncated_by,
+    )
+    with time_stage("term_extraction"):
+        terms = extract_terms_from_note(result.text, max_terms)
+    return {"message": "处理完成", "partial": False, "text": result.text, "terms": terms}
+
+
+def run_batch_job(payload: Dict[str, Any], report: Report) -> Dict[str, Any]:
+    """批量上传：展开 zip 并并行提取各文件，对按上传顺序拼接的全文做一次（分块的）词语抽取"""
+    uploads: List[BatchItem] = [(name, path) for name, path in payload["uploads"]]
+    max_terms = payload["max_terms"]
+    report(message="正在展开文件...", files_done=0, failed_files=[], partial=False)
+
+    uploaded = {path for _, path in uploads}
+    items: List[BatchItem] = []
+    try:
+        with time_stage("text_extraction"):
+            # 原 zip 保留到任务结束，重试时重新展开
+            items = expand_uploads(uploads, discard_archives=False)
+            report(files_total=len(items), message=f"正在提取文本（0/{len(items)} 个文件）...")
+            results = []
+            failed: List[str] = []
+            last_update = 0.0
+            for result in iter_batch_texts(items):
+                results.append(result)
+                if result.error is not None:
+                    failed.append(result.filename)
+                update: Dict[str, Any] = {
+                    "files_done": len(results),
+                    "failed_files": list(failed),
+                    "message": f"正在提取文本（{len(results)}/{len(items)} 个文件）...",
+                }
+                now = time.monotonic()
+                if len(results) < len(items) and now - last_update >= PARTIAL_UPDATE_INTERVAL:
+                    partial = join_batch_texts(results)
+                    update["text"] = partial
+                    update["terms"] = preview_terms_from_note(partial, max_terms)
+                    update["partial"] = True
+                    last_update = time.monotonic()
+                report(**update)
+    finally:
+        # 只删除从 zip 中展开的临时文件
+        for _, path in items:
+            if path not in uploaded:
+                discard_upload(path)
+
+    text = join_batch_texts(results)
+    if not text:
+        raise ValueError("所有文件都未能提取到文本")
+
+    report(message="正在提取术语...", text=text, terms=preview_terms_from_note(text, max_terms), partial=False)
+    with time_stage("term_extraction"):
+        terms = extract_terms_from_long_note(text, max_terms)
+    return {
+        "message": "处理完成" + (f"，{len(failed)} 个文件提取失败" if failed else ""),
+        "partial": False,
+        "text": text,
+        "terms": terms,
+    }
+
+
+JOB_HANDLERS = {
+    "file": run_file_job,
+    "batch": run_batch_job,
+}
+
+
+def discard_job_files(payload: Dict[str, Any]) -> None:
+    """删除任务上传的临时文件（任务最终完成、失败或被删除后调用）"""
+    if payload.get("path"):
+        discard_upload(payload["path"])
+    for _, path in payload.get("uploads") or []:
+        discard_upload(path)
+
+
+__all__ = [
+    "ASYNC_FILE_SIZE_THRESHOLD",
+    "ASYNC_PAGE_COUNT_THRESHOLD",
+    "JOB_HANDLERS",
+    "PARTIAL_UPDATE_INTERVAL",
+    "discard_job_files",
+    "estimate_job_cost",
+    "run_batch_job",
+    "run_file_job",
+]
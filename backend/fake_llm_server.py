@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容的假 LLM 服务
+
+用于压测与离线联调：实现 /v1/chat/completions（流式与非流式）和 /v1/models，
+不消耗真实 token、不访问外网。根据 system prompt 识别调用方，返回与
+system_prompt.py / NOTE_TERMS_SYSTEM_PROMPT / TERMS_GENERATION_PROMPT 约定格式一致的 JSON。
+
+延迟分布、错误率均可配置（命令行参数或环境变量）：
+
+- FAKE_LLM_LATENCY: 延迟分布，例如
+    fixed:0.3            固定 0.3 秒
+    uniform:0.1,0.8      0.1~0.8 秒均匀分布
+    normal:0.5,0.1       均值 0.5、标准差 0.1（截断到 >=0）
+    lognormal:-0.7,0.5   对数正态分布（mu, sigma），长尾更接近真实 LLM
+- FAKE_LLM_ERROR_RATE: 返回错误的概率（0~1）
+- FAKE_LLM_ERROR_STATUS: 错误时的 HTTP 状态码，默认 500（可设为 429 模拟限流）
+- FAKE_LLM_STREAM_CHUNK_DELAY: 流式响应每个分片之间的间隔（秒）
+
+用法：
+    python fake_llm_server.py --port 9000 --latency lognormal:-0.7,0.5 --error-rate 0.01
+    # 然后让后端指向它：
+    BASE_URL=http://127.0.0.1:9000/v1 API_KEY=fake uvicorn server:app
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+try:
+    from .system_prompt import curious_student_agent_system_prompt, simple_explanation_system_prompt
+except ImportError:  # pragma: no cover
+    from system_prompt import curious_student_agent_system_prompt, simple_explanation_system_prompt
+
+
+# 用 system prompt 的开头识别调用方（避免导入 note_terms_extractor / terms_generator 而触发 LLM 初始化）
+_CURIOUS_MARKER = curious_student_agent_system_prompt.strip()[:40]
+_EXPLAINER_MARKER = simple_explanation_system_prompt.strip()[:40]
+_NOTE_TERMS_MARKER = "你会收到一段用户笔记"
+_TERMS_GENERATOR_MARKER = "你是一位专业的教育内容生成助手"
+
+_TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z0-9_\-]{2,30}|[\u4e00-\u9fff]{2,4}")
+_ANGLE_WORD_RE = re.compile(r"<([^<>]{1,30})>")
+
+
+@dataclass
+class LatencyModel:
+    """延迟分布"""
+
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        kind, _, params = spec.partition(":")
+        values = [float(v) for v in params.split(",") if v.strip()] if params else []
+        kind = kind.strip().lower()
+        if kind not in {"fixed", "uniform", "normal", "lognormal"}:
+            raise ValueError(f"未知的延迟分布: {spec}")
+        values += [0.0] * (2 - len(values))
+        return cls(kind, values[0], values[1])
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(self.a, self.b))
+        if self.kind == "lognormal":
+            return rng.lognormvariate(self.a, self.b)
+        return max(0.0, self.a)
+
+
+@dataclass
+class FakeLLMConfig:
+    latency: LatencyModel
+    error_rate: float = 0.0
+    error_status: int = 500
+    stream_chunk_delay: float = 0.0
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMConfig":
+        seed = os.getenv("FAKE_LLM_SEED")
+        return cls(
+            latency=LatencyModel.parse(os.getenv("FAKE_LLM_LATENCY", "fixed:0")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            error_status=int(os.getenv("FAKE_LLM_ERROR_STATUS", "500")),
+            stream_chunk_delay=float(os.getenv("FAKE_LLM_STREAM_CHUNK_DELAY", "0")),
+            seed=int(seed) if seed else None,
+        )
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+def _pick_terms(text: str, limit: int) -> List[str]:
+    """从输入文本中挑选看起来像术语的片段，保证输出与输入相关且稳定"""
+    seen: List[str] = []
+    for token in _TOKEN_RE.findall(text):
+        if token not in seen:
+            seen.append(token)
+        if len(seen) >= limit:
+            break
+    return seen or ["概念"]
+
+
+def build_reply(messages: List[Dict[str, Any]]) -> str:
+    """根据 system prompt 识别调用方并生成对应格式的回复"""
+    system = "\n".join(_message_text(m) for m in messages if m.get("role") == "system")
+    user = "\n".join(_message_text(m) for m in messages if m.get("role") != "system")
+    last_user = next(
+        (_message_text(m) for m in reversed(messages) if m.get("role") == "user"), user
+    )
+
+    if _NOTE_TERMS_MARKER in system:
+        match = re.search(r"最多返回\s*(\d+)", last_user)
+        limit = int(match.group(1)) if match else 30
+        note = last_user.split("笔记：", 1)[-1]
+        return json.dumps({"terms": _pick_terms(note, min(limit, 30))}, ensure_ascii=False)
+
+    if _TERMS_GENERATOR_MARKER in system:
+        topic = last_user.rsplit("主题：", 1)[-1].strip() or "通用"
+        terms = [f"{topic}概念{i}" for i in range(1, 13)]
+        return "```json\n" + json.dumps({"terms": terms}, ensure_ascii=False) + "\n```"
+
+    if system.strip().startswith(_CURIOUS_MARKER):
+        words = _pick_terms(last_user, 5)[:5]
+        payload = {"status": "confused", "words": [f"<{w}>" for w in words]}
+        return "```json\n" + json.dumps(payload, ensure_ascii=False) + "\n```"
+
+    if system.strip().startswith(_EXPLAINER_MARKER):
+        words = _ANGLE_WORD_RE.findall(last_user) or _pick_terms(last_user, 3)
+        explanations = [
+            {
+                "word": w,
+                "simple_explanation": f"{w}就像搭积木时的一块小积木，和其他积木拼在一起才能发挥作用。",
+                "analogy": "搭积木",
+                "key_point": f"{w}是整体中的一部分",
+            }
+            for w in words
+        ]
+        return json.dumps({"explanations": explanations}, ensure_ascii=False)
+
+    return "好的。"
+
+
+def _estimate_tokens(text: str) -> int:
+    # 粗略估算：中文约 1 字 1 token，英文约 4 字符 1 token
+    han = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    return max(1, han + (len(text) - han) // 4)
+
+
+def create_app(config: Optional[FakeLLMConfig] = None) -> FastAPI:
+    config = config or FakeLLMConfig.from_env()
+    rng = random.Random(config.seed)
+    app = FastAPI(title="Fake LLM Service")
+    app.state.config = config
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "fake-model", "object": "model", "owned_by": "local"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        model_name = body.get("model") or "fake-model"
+
+        await asyncio.sleep(config.latency.sample(rng))
+        if config.error_rate and rng.random() < config.error_rate:
+            return JSONResponse(
+                status_code=config.error_status,
+                content={"error": {"message": "fake llm injected error", "type": "server_error"}},
+            )
+
+        reply = build_reply(messages)
+        prompt_tokens = sum(_estimate_tokens(_message_text(m)) for m in messages)
+        completion_tokens = _estimate_tokens(reply)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model_name,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        async def event_stream():
+            def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra) -> str:
+                data = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model_name,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                    **extra,
+                }
+                return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+            yield chunk({"role": "assistant", "content": ""})
+            for i in range(0, len(reply), 16):
+                if config.stream_chunk_delay:
+                    await asyncio.sleep(config.stream_chunk_delay)
+                yield chunk({"content": reply[i : i + 16]})
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                data = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model_name,
+                    "choices": [],
+                    "usage": usage,
+                }
+                yield f"data: {json.dumps(data)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return app
+
+
+app = create_app()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容假 LLM 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default=os.getenv("FAKE_LLM_LATENCY", "fixed:0"))
+    parser.add_argument("--error-rate", type=float, default=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")))
+    parser.add_argument("--error-status", type=int, default=int(os.getenv("FAKE_LLM_ERROR_STATUS", "500")))
+    parser.add_argument(
+        "--stream-chunk-delay", type=float, default=float(os.getenv("FAKE_LLM_STREAM_CHUNK_DELAY", "0"))
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = FakeLLMConfig(
+        latency=LatencyModel.parse(args.latency),
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        stream_chunk_delay=args.stream_chunk_delay,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
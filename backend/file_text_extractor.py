@@ -5,22 +5,75 @@
 - .txt / .md 等纯文本
 - .pdf
 - .docx（Word 新格式）
+- .pptx（幻灯片文本与演讲者备注）、.epub、.html（见 document_parsers）
 - 图片 (jpg, jpeg, png, bmp, webp) - 使用 OCR
 
 说明：
 - 传统 .doc 属于二进制格式，默认不支持（需要额外系统依赖/转换工具）。
-- 图片OCR使用EasyOCR，支持中英文识别
+- 图片OCR使用EasyOCR，支持中英文识别；在预加载模型的 OCR 工作进程池中执行（见 ocr_pool）
 - 可配置使用Tesseract（需安装系统依赖），速度更快
 
 环境变量：
 - OCR_BACKEND: "easyocr" (默认) 或 "tesseract"
+
+输入既可以是 bytes，也可以是文件路径（上传时落盘的临时文件）：
+PDF/docx 按路径交给解析库，图片与纯文本通过只读 mmap 读取，不再额外复制一份到内存。
+PDF 按页分片，由多个工作进程并行提取（见 pdf_extractor）；pptx/epub 逐页、逐章解析。
+
+PDF、docx、pptx、epub、html 与图片的完整提取结果按内容哈希缓存在磁盘上（见 extraction_cache），
+按页保存，命中时再按本次的页数与字符预算截取；扫描页的 OCR 结果另按页面位图哈希缓存。
 """
 
 from __future__ import annotations
 
 import io
+import json
+import mmap
 import os
-from typing import Optional
+from contextlib import contextmanager
+from typing import Callable, Dict, Generator, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+try:
+    from .config import (
+        extract_max_bytes,
+        extract_max_chars,
+        extract_max_ocr_seconds,
+        ocr_job_timeout,
+        pdf_max_pages,
+        pdf_ocr_dpi,
+    )
+    from .document_parsers import SECTION_PARSERS, iter_document_sections
+    from .extraction_cache import cache_key, digest_bytes, digest_source, get_extraction_cache
+    from .metrics import record_cache
+    from .ocr_pool import OcrBudgetExceeded, ocr_pool_enabled, run_ocr_job
+    from .ocr_preprocess import merge_tile_texts, preprocess_for_ocr, tile_image
+    from .pdf_extractor import iter_pdf_pages
+except ImportError:  # pragma: no cover
+    from config import (
+        extract_max_bytes,
+        extract_max_chars,
+        extract_max_ocr_seconds,
+        ocr_job_timeout,
+        pdf_max_pages,
+        pdf_ocr_dpi,
+    )
+    from document_parsers import SECTION_PARSERS, iter_document_sections
+    from extraction_cache import cache_key, digest_bytes, digest_source, get_extraction_cache
+    from metrics import record_cache
+    from ocr_pool import OcrBudgetExceeded, ocr_pool_enabled, run_ocr_job
+    from ocr_preprocess import merge_tile_texts, preprocess_for_ocr, tile_image
+    from pdf_extractor import iter_pdf_pages
+
+# 文件内容：bytes 等缓冲区对象，或文件路径
+Source = Union[bytes, bytearray, memoryview, str, "os.PathLike[str]"]
+
+
+# 图片类型（使用 OCR）
+_IMAGE_TYPES = {"jpg", "jpeg", "png", "bmp", "webp"}
+# 纯文本类型（没有扩展名时也按纯文本）
+_PLAIN_TEXT_TYPES = {"txt", "md", "markdown", "log", ""}
+# 解析代价高、结果需要缓存的类型
+_CACHED_TYPES = {"pdf", "docx"} | set(SECTION_PARSERS) | _IMAGE_TYPES
 
 
 # 缓存EasyOCR Reader实例，避免重复初始化
@@ -68,41 +121,29 @@ def _get_easyocr_reader():
     return _easyocr_reader
 
 
+def _load_ocr_backend() -> None:
+    """预先加载配置的OCR后端（OCR 工作进程启动时调用，EasyOCR 模型加载较慢）"""
+    if _get_ocr_backend() == "tesseract" and _is_tesseract_available():
+        return
+    _get_easyocr_reader()
+
+
 def _preprocess_image_for_ocr(img):
-    """预处理图片以提高OCR准确率"""
+    """预处理图片以提高OCR准确率：按文字高度缩小，按噪声/模糊/对比度决定是否去噪、锐化、增强（见 ocr_preprocess）"""
     try:
-        import numpy as np
-        import cv2
-        
-        # 转换为灰度图
-        if len(img.shape) == 3:
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = img.copy()
-        
-        # 应用CLAHE增强对比度
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(gray)
-        
-        # 轻度去噪
-        denoised = cv2.fastNlMeansDenoising(enhanced, None, 10, 7, 21)
-        
-        return denoised
+        return preprocess_for_ocr(img)
     except Exception:
         return img
 
 
 def _ocr_with_tesseract(img) -> str:
-    """使用Tesseract进行OCR"""
+    """使用Tesseract进行OCR（img 为预处理后的图片）"""
     try:
         import pytesseract
         from PIL import Image
         
-        # 预处理图片
-        processed = _preprocess_image_for_ocr(img)
-        
         # 转换为PIL Image
-        pil_image = Image.fromarray(processed)
+        pil_image = Image.fromarray(img)
         
         # 使用Tesseract进行OCR（中英文混合）
         text = pytesseract.image_to_string(
@@ -116,114 +157,543 @@ def _ocr_with_tesseract(img) -> str:
         raise ValueError(f"Tesseract OCR失败: {e}")
 
 
-def _ocr_with_easyocr(img) -> str:
-    """使用EasyOCR进行OCR"""
+def _ocr_with_easyocr(images: List) -> List[str]:
+    """使用EasyOCR批量识别；尺寸相同的图片（如同一张长图的各块）用 readtext_batched 一起推理"""
     reader = _get_easyocr_reader()
-    results = reader.readtext(img, detail=0)
-    text_list = [str(r) for r in results if str(r).strip()]
-    return "\n".join(text_list)
+    groups: Dict[tuple, List[int]] = {}
+    for i, img in enumerate(images):
+        groups.setdefault(img.shape, []).append(i)
+
+    texts = [""] * len(images)
+    for indices in groups.values():
+        if len(indices) == 1:
+            batches = [reader.readtext(images[indices[0]], detail=0)]
+        else:
+            batches = reader.readtext_batched([images[i] for i in indices], detail=0)
+        for i, results in zip(indices, batches):
+            texts[i] = "\n".join(str(r) for r in results if str(r).strip())
+    return texts
+
+
+def _ocr_images(images: List) -> List[str]:
+    """批量OCR：逐张预处理，过长的图片分块，按配置的后端识别后再按图片合并"""
+    tiles, owners = [], []
+    for i, img in enumerate(images):
+        for tile in tile_image(_preprocess_image_for_ocr(img)):
+            tiles.append(tile)
+            owners.append(i)
+
+    if _get_ocr_backend() == "tesseract" and _is_tesseract_available():
+        tile_texts = [_ocr_with_tesseract(tile) for tile in tiles]
+    else:
+        # 未配置或Tesseract不可用时使用EasyOCR
+        tile_texts = _ocr_with_easyocr(tiles)
 
+    parts: List[List[str]] = [[] for _ in images]
+    for owner, text in zip(owners, tile_texts):
+        parts[owner].append(text)
+    return [merge_tile_texts(texts) for texts in parts]
 
-def _ocr_image(img) -> str:
-    """根据配置选择OCR后端"""
-    backend = _get_ocr_backend()
-    
-    if backend == "tesseract":
-        if not _is_tesseract_available():
-            # 回退到EasyOCR
-            return _ocr_with_easyocr(img)
-        return _ocr_with_tesseract(img)
-    else:
-        return _ocr_with_easyocr(img)
 
+def _ocr_pdf_pages(pages: List, page_nums: List[int], dpi: int = 200) -> List[Tuple[Optional[str], bool]]:
+    """
+    把一组没有文本层的PDF页面（扫描件）渲染为灰度位图后一起OCR（同尺寸的页批量推理）。
 
-def _ocr_pdf_page(page, page_num: int = 0) -> str:
-    """从PDF页面提取图片并进行OCR"""
+    Returns:
+        每页的 (识别出的文本, 是否命中页面OCR缓存)；识别失败时文本为 None（与超时的页一样，整份结果不写入缓存）
+    """
+    results: List[Tuple[Optional[str], bool]] = [(None, False)] * len(pages)
     try:
         import numpy as np
-        import cv2
-        
-        # 尝试提取页面中的图片
-        images = page.images
-        if not images:
-            return ""
-        
-        all_text: list[str] = []
-        
-        for i, image in enumerate(images):
-            try:
-                # image 可能是PIL Image或bytes
-                if hasattr(image, 'tobytes'):
-                    # PIL Image
-                    img_bytes = image.tobytes()
-                elif isinstance(image, bytes):
-                    img_bytes = image
-                else:
-                    continue
-                
-                nparr = np.frombuffer(img_bytes, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                
-                if img is not None:
-                    # 使用配置的OCR后端
-                    page_text = _ocr_image(img)
-                    if page_text.strip():
-                        all_text.append(page_text)
-            except Exception:
+        import fitz
+
+        cache = get_extraction_cache()
+        pending = []  # (序号, 缓存键, 位图)
+        pixmaps = []  # 保持 pixmap 存活，numpy 视图引用其缓冲区
+        for i, page in enumerate(pages):
+            pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+            key = cache_key(digest_bytes(pix.samples_mv), pix.width, pix.height, _get_ocr_backend())
+            cached = cache.get("ocr_page", key)
+            if cached is not None:
+                results[i] = (cached, True)
                 continue
-        
-        return "\n".join(all_text)
-    except Exception:
-        return ""
+            # 直接在 pixmap 的像素缓冲区上构造 numpy 视图，不复制
+            img = np.ndarray(
+                (pix.height, pix.width),
+                dtype=np.uint8,
+                buffer=pix.samples_mv,
+                strides=(pix.stride, 1),
+            )
+            pixmaps.append(pix)
+            pending.append((i, key, img))
+
+        if pending:
+            texts = _ocr_images([img for _, _, img in pending])
+            for (i, key, _), text in zip(pending, texts):
+                cache.put("ocr_page", key, text)
+                results[i] = (text, False)
+    except Exception as exc:  # noqa: BLE001
+        print(f"[OCR] PDF第 {', '.join(str(n + 1) for n in page_nums)} 页识别失败: {exc}")
+    return results
+
+
+def _decode_image(source: Source):
+    """解码图片文件（bytes 或路径）"""
+    try:
+        import numpy as np
+        import cv2
+    except Exception as exc:  # noqa: BLE001
+        raise ValueError("缺少 OCR 依赖 (opencv/numpy)") from exc
+
+    # 直接在缓冲区（bytes 或 mmap）上构造 numpy 视图供 cv2 解码，不复制
+    with _open_buffer(source) as buf:
+        nparr = np.frombuffer(buf, np.uint8)
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR) if len(nparr) else None
+        # 释放对 mmap 的引用，否则无法关闭映射
+        del nparr
+    if img is None:
+        raise ValueError("无法解析图片文件")
+    return img
+
+
+def _ocr_image_source(source: Source) -> str:
+    """解码图片文件（bytes 或路径）并进行OCR；也作为 OCR 工作进程的任务入口"""
+    return _ocr_images([_decode_image(source)])[0]
+
+
+def _ocr_image_sources(sources: List[Source]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    解码多张图片后一起OCR（同尺寸的图片与分块批量推理）；也作为 OCR 工作进程的任务入口。
+
+    Returns:
+        每张图片的 (文本, 失败原因)；无法解码的图片文本为 None
+    """
+    images = []
+    errors: List[Optional[str]] = []
+    for source in sources:
+        try:
+            images.append(_decode_image(source))
+            errors.append(None)
+        except ValueError as exc:
+            images.append(None)
+            errors.append(str(exc))
+    decoded = [img for img in images if img is not None]
+    texts = iter(_ocr_images(decoded) if decoded else [])
+    return [(None, error) if img is None else (next(texts), None) for img, error in zip(images, errors)]
 
 
-def extract_text_from_upload(filename: Optional[str], raw: bytes) -> str:
-    ext = _get_extension(filename)
+def _is_path(source: Source) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+@contextmanager
+def _open_buffer(source: Source) -> Iterator[Union[bytes, bytearray, memoryview, mmap.mmap]]:
+    """缓冲区对象原样返回；文件路径映射为只读 mmap（空文件返回 b""）"""
+    if not _is_path(source):
+        yield source
+        return
+    with open(source, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+class TextChunk(NamedTuple):
+    """流式提取产出的一段文本"""
+
+    # 页码（从 0 开始）；不分页的文件只有一段
+    index: int
+    # 该页文本；超时被跳过时为 None
+    text: Optional[str]
+    # 已完成的段数 / 总段数（命中缓存时整份产出一段，为处理的页数）
+    done: int
+    total: int
+
+
+class ExtractionBudget(NamedTuple):
+    """文本提取预算（0 表示不限制），超出后提前停止"""
+
+    # 文件字节数：纯文本只读取前 max_bytes 字节，其他类型超出时拒绝
+    max_bytes: int = 0
+    # 页数（PDF 页、pptx 幻灯片、epub 章节）
+    max_pages: int = 0
+    # 提取的字符数：按页码顺序累计达到后不再提取后续页
+    max_chars: int = 0
+    # 扫描页与图片 OCR 的总时长（秒）
+    max_ocr_seconds: float = 0
+
+
+def default_budget() -> ExtractionBudget:
+    return ExtractionBudget(extract_max_bytes, pdf_max_pages, extract_max_chars, extract_max_ocr_seconds)
+
+
+class ExtractionResult(NamedTuple):
+    """提取结果"""
+
+    text: str
+    # 实际处理的页/段数（从第 1 页起），以及文档的总页/段数
+    pages_processed: Optional[int]
+    pages_total: Optional[int]
+    # 提前停止时触发的预算（ExtractionBudget 的字段名），完整提取时为 None
+    truncated_by: Optional[str] = None
+
+
+def join_chunks(pages: Dict[int, Optional[str]]) -> str:
+    """按页码顺序拼接已提取的各页文本（用于提取过程中的部分结果）"""
+    return "\n\n".join(pages[i] for i in sorted(pages) if pages[i] and pages[i].strip()).strip()
+
 
-    if ext in {"txt", "md", "markdown", "log"} or not ext:
+def _source_size(source: Source) -> int:
+    return os.path.getsize(source) if _is_path(source) else memoryview(source).nbytes
+
+
+def _check_size(ext: str, source: Source, budget: ExtractionBudget) -> None:
+    """非纯文本文件超过字节预算时报错（纯文本只读取前 max_bytes 字节）"""
+    if budget.max_bytes and ext not in _PLAIN_TEXT_TYPES:
+        size = _source_size(source)
+        if size > budget.max_bytes:
+            raise ValueError(
+                f"文件过大（{size / 1024 / 1024:.1f}MB），超过提取上限 {budget.max_bytes / 1024 / 1024:.1f}MB"
+            )
+
+
+def _document_cache_key(ext: str, source: Source) -> str:
+    """整份文件提取结果的缓存键：文件内容哈希加上影响结果的参数"""
+    return cache_key(digest_source(source), ext, _get_ocr_backend(), pdf_ocr_dpi)
+
+
+def _get_cached_pages(key: str) -> Optional[List[str]]:
+    """缓存中整份文件的各页文本（不分页的类型只有一段）"""
+    cached = get_extraction_cache().get("document", key)
+    record_cache("extracted_text", hit=cached is not None)
+    return None if cached is None else json.loads(cached)
+
+
+def _put_cached_pages(key: str, pages: List[str]) -> None:
+    get_extraction_cache().put("document", key, json.dumps(pages, ensure_ascii=False))
+
+
+def is_image(filename: Optional[str]) -> bool:
+    """是否为需要 OCR 的图片文件"""
+    return _get_extension(filename) in _IMAGE_TYPES
+
+
+def extract_image_texts(
+    items: List[Tuple[str, Source]],
+    budget: Optional[ExtractionBudget] = None,
+) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    批量识别多张图片（例如一次上传的一组课堂照片）：先逐张查缓存，
+    未命中的图片合并为一个 OCR 任务，同尺寸的图片与分块一起批量推理。
+
+    Args:
+        items: (原始文件名, 文件内容或路径) 列表
+        budget: 提取预算，默认取自配置
+
+    Returns:
+        每张图片的 (文本, 失败原因)；失败的图片文本为 None
+    """
+    budget = default_budget() if budget is None else budget
+    cache_enabled = get_extraction_cache().enabled
+    results: List[Tuple[Optional[str], Optional[str]]] = [(None, None)] * len(items)
+    keys: List[Optional[str]] = [None] * len(items)
+    todo: List[int] = []
+    for i, (filename, source) in enumerate(items):
+        ext = _get_extension(filename)
         try:
-            return raw.decode("utf-8")
-        except UnicodeDecodeError:
-            return raw.decode("latin-1")
+            _check_size(ext, source, budget)
+        except ValueError as exc:
+            results[i] = (None, str(exc))
+            continue
+        if cache_enabled:
+            keys[i] = _document_cache_key(ext, source)
+            cached = _get_cached_pages(keys[i])
+            if cached is not None:
+                results[i] = (cached[0], None)
+                continue
+        todo.append(i)
 
-    if ext == "pdf":
+    def store(ocr: List[Tuple[Optional[str], Optional[str]]]) -> None:
+        for i, (text, _) in zip(todo, ocr):
+            if text is not None and keys[i] is not None:
+                _put_cached_pages(keys[i], [text])
+
+    if todo:
+        sources = [items[i][1] if _is_path(items[i][1]) else bytes(items[i][1]) for i in todo]
         try:
-            import fitz
+            if ocr_pool_enabled():
+                # 单任务超时按图片数放大；超过时长预算时不再等待，识别完成后照常写入缓存
+                ocr = run_ocr_job(
+                    _ocr_image_sources,
+                    sources,
+                    timeout=ocr_job_timeout * len(sources),
+                    budget=budget.max_ocr_seconds,
+                    on_late=store,
+                )
+            else:
+                ocr = _ocr_image_sources(sources)
+            store(ocr)
         except Exception as exc:  # noqa: BLE001
-            raise ValueError("缺少 PDF 解析依赖 PyMuPDF，请运行: pip install PyMuPDF") from exc
+            ocr = [(None, f"图片OCR失败: {exc}")] * len(todo)
+        for i, result in zip(todo, ocr):
+            results[i] = result
+
+    if budget.max_chars:
+        results = [(text[: budget.max_chars] if text else text, error) for text, error in results]
+    return results
+
+
+def iter_text_from_upload(
+    filename: Optional[str],
+    source: Source,
+    budget: Optional[ExtractionBudget] = None,
+) -> Generator[TextChunk, None, ExtractionResult]:
+    """
+    流式提取文本：PDF 每完成一页产出一段（并行时按完成顺序），pptx 每页、epub 每章产出一段，
+    其他类型整份产出一段。
+    生成器的返回值（StopIteration.value）为 ExtractionResult。
+
+    Args:
+        filename: 原始文件名（用于判断类型）
+        source: 文件内容（bytes）或文件路径
+        budget: 提取预算，默认取自配置（见 default_budget）
+
+    Raises:
+        ValueError: 不支持的类型、解析失败、没有提取到文本，或非纯文本文件超过字节预算
+    """
+    budget = default_budget() if budget is None else budget
+    ext = _get_extension(filename)
+    _check_size(ext, source, budget)
+
+    # 先查缓存：键为文件内容哈希加上影响结果的参数；只缓存完整（未触发预算）的结果，
+    # 按页保存，命中时按本次的预算截取
+    paged = ext == "pdf" or ext in SECTION_PARSERS
+    key = None
+    if ext in _CACHED_TYPES and get_extraction_cache().enabled:
+        key = _document_cache_key(ext, source)
+        cached = _get_cached_pages(key)
+        if cached is not None:
+            pages_total = len(cached)
+            processed = min(pages_total, budget.max_pages) if paged and budget.max_pages else pages_total
+            truncated_by = "max_pages" if processed < pages_total else None
+            text = join_chunks(dict(enumerate(cached[:processed]))) if paged else cached[0]
+            if budget.max_chars and len(text) > budget.max_chars:
+                text, truncated_by = text[: budget.max_chars], truncated_by or "max_chars"
+            yield TextChunk(0, text, processed, processed)
+            return ExtractionResult(text, processed, pages_total, truncated_by)
 
+    if ext == "pdf":
+        chunks = _iter_pdf_chunks(source, budget)
+    elif paged:
+        chunks = _iter_section_chunks(ext, source, budget)
+    else:
+        chunks = _iter_whole_document(ext, source, budget, key)
+
+    pages: Dict[int, Optional[str]] = {}
+    truncated_by: Optional[str] = None
+    pages_total: Optional[int] = None
+    # 从第 1 页起连续完成的页数及其字符数（按完成顺序产出时用于字符预算）
+    prefix, prefix_chars = 0, 0
+    try:
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration as stop:
+                truncated_by, pages_total = stop.value
+                break
+            pages[chunk.index] = chunk.text
+            pages_total = chunk.total
+            yield chunk
+            while prefix in pages:
+                prefix_chars += len(pages[prefix] or "")
+                prefix += 1
+            if budget.max_chars and prefix_chars >= budget.max_chars and len(pages) < chunk.total:
+                print(f"[Extract] 前 {prefix} 页已超过 {budget.max_chars} 字符预算，停止提取剩余页")
+                pages = {i: pages[i] for i in range(prefix)}
+                truncated_by = "max_chars"
+                break
+    finally:
+        # 提前停止时取消还没开始的页
+        chunks.close()
+
+    if paged:
+        text = join_chunks(pages)
+        if not text:
+            raise ValueError(_EMPTY_PDF_MESSAGE if ext == "pdf" else f"无法从 .{ext} 文件中提取到文本内容")
+    else:
+        text = pages.get(0) or ""
+    if budget.max_chars and len(text) > budget.max_chars:
+        text = text[: budget.max_chars]
+        truncated_by = truncated_by or "max_chars"
+
+    # 有页面超时被跳过、或触发了预算时结果不完整，不写入缓存
+    if key is not None and truncated_by is None and all(t is not None for t in pages.values()):
+        _put_cached_pages(key, [pages[i] for i in sorted(pages)] if paged else [text])
+    return ExtractionResult(text, len(pages), pages_total, truncated_by)
+
+
+def extract_upload_text(
+    filename: Optional[str],
+    source: Source,
+    budget: Optional[ExtractionBudget] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> ExtractionResult:
+    """
+    从上传文件中提取文本，返回文本以及实际处理的范围、触发的预算。
+
+    Args:
+        filename: 原始文件名（用于判断类型）
+        source: 文件内容（bytes）或文件路径
+        budget: 提取预算，默认取自配置
+        progress: 每完成一页（不分页的文件为整份）调用一次 progress(已完成页数, 总页数)
+    """
+    chunks = iter_text_from_upload(filename, source, budget)
+    while True:
         try:
-            doc = fitz.open(stream=raw, filetype="pdf")
-            parts = []
-            has_text = False
-            
-            for page_num, page in enumerate(doc):
-                text = page.get_text() or ""
-                if text.strip():
-                    has_text = True
-                    parts.append(text)
-                else:
-                    page_text = _ocr_pdf_page(page, page_num)
-                    if page_text.strip():
-                        has_text = True
-                        parts.append(page_text)
-            
-            doc.close()
-            result_text = "\n\n".join(parts).strip()
-            
-            if not result_text:
-                raise ValueError(
-                    "无法从PDF中提取到文本内容。这可能是因为："
-                    "1. PDF是扫描件（没有文本层），"
-                    "2. PDF使用了特殊的编码方式。"
-                    "建议：将PDF转为图片后重新上传，或使用文字版PDF。"
-                )
-            
-            return result_text
-        except Exception as exc:
-            if isinstance(exc, ValueError):
-                raise
-            raise ValueError(f"PDF解析失败: {exc}") from exc
+            chunk = next(chunks)
+        except StopIteration as stop:
+            return stop.value
+        if progress is not None:
+            progress(chunk.done, chunk.total)
+
+
+def extract_text_from_upload(
+    filename: Optional[str],
+    source: Source,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> str:
+    """
+    从上传文件中提取文本（按配置的预算截断）。
+
+    Args:
+        filename: 原始文件名（用于判断类型）
+        source: 文件内容（bytes）或文件路径
+        progress: 每完成一页（不分页的文件为整份）调用一次 progress(已完成页数, 总页数)
+    """
+    return extract_upload_text(filename, source, progress=progress).text
+
+
+# 分段产出的生成器返回 (提前停止的原因, 文档总页/段数)
+_ChunkStream = Generator[TextChunk, None, Tuple[Optional[str], int]]
+
+_EMPTY_PDF_MESSAGE = (
+    "无法从PDF中提取到文本内容。这可能是因为："
+    "1. PDF是扫描件（没有文本层），"
+    "2. PDF使用了特殊的编码方式。"
+    "建议：将PDF转为图片后重新上传，或使用文字版PDF。"
+)
+
+
+def _iter_pdf_chunks(source: Source, budget: ExtractionBudget) -> _ChunkStream:
+    """逐页产出PDF文本；有页面超时被跳过时该页文本为 None"""
+    try:
+        import fitz
+    except Exception as exc:  # noqa: BLE001
+        raise ValueError("缺少 PDF 解析依赖 PyMuPDF，请运行: pip install PyMuPDF") from exc
+
+    try:
+        # 按页分片，多进程并行提取（见 pdf_extractor）
+        pages = iter_pdf_pages(source, max_pages=budget.max_pages, max_ocr_seconds=budget.max_ocr_seconds)
+        done = 0
+        try:
+            while True:
+                try:
+                    page_num, text, page_count = next(pages)
+                except StopIteration as stop:
+                    return stop.value
+                done += 1
+                yield TextChunk(page_num, text, done, page_count)
+        finally:
+            pages.close()
+    except ValueError:
+        raise
+    except Exception as exc:
+        raise ValueError(f"PDF解析失败: {exc}") from exc
+
+
+def _iter_section_chunks(ext: str, source: Source, budget: ExtractionBudget) -> _ChunkStream:
+    """逐页/逐章产出 pptx、epub、html 的文本"""
+    total = 0
+    sections = iter_document_sections(ext, source)
+    try:
+        for index, text, total in sections:
+            if budget.max_pages and index >= budget.max_pages:
+                print(f"[Extract] 共 {total} 页/章，超过上限，只提取前 {budget.max_pages} 页/章")
+                return "max_pages", total
+            yield TextChunk(index, text, index + 1, min(total, budget.max_pages or total))
+    except ValueError:
+        raise
+    except Exception as exc:
+        raise ValueError(f"{ext.upper()} 解析失败: {exc}") from exc
+    finally:
+        sections.close()
+    return None, total
+
+
+def _iter_whole_document(ext: str, source: Source, budget: ExtractionBudget, key: Optional[str]) -> _ChunkStream:
+    """不分页的类型整份产出一段；key 为整份结果的缓存键"""
+    truncated_by = None
+    if ext in _IMAGE_TYPES:
+        text, truncated_by = _ocr_upload_image(source, budget, key)
+    else:
+        if ext in _PLAIN_TEXT_TYPES and budget.max_bytes and _source_size(source) > budget.max_bytes:
+            truncated_by = "max_bytes"
+        text = _extract_text(ext, source, budget)
+    yield TextChunk(0, text, 1, 1)
+    return truncated_by, 1
+
+
+def _decode_text(buf, max_bytes: int = 0) -> str:
+    """按 UTF-8 解码（失败时按 latin-1）；只取前 max_bytes 字节时丢弃被截断的末尾字符"""
+    with memoryview(buf) as view:
+        truncated = bool(max_bytes) and view.nbytes > max_bytes
+        data = view[:max_bytes] if truncated else view
+        try:
+            return str(data, "utf-8")
+        except UnicodeDecodeError as exc:
+            if truncated and exc.reason == "unexpected end of data":
+                return str(data[: exc.start], "utf-8")
+            return str(data, "latin-1")
+        finally:
+            data.release()
+
+
+def _ocr_upload_image(source: Source, budget: ExtractionBudget, key: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    识别上传的图片，返回 (文本, 触发的预算)。
+
+    在预加载了模型的 OCR 工作进程中解码并识别；路径直接传递，缓冲区复制为 bytes。
+    超过 OCR 时长预算时不再等待，本次结果为空（truncated_by="max_ocr_seconds"）；
+    任务不放弃、工作进程也不替换，识别完成后写入缓存，再次上传时直接命中。
+    """
+    if not ocr_pool_enabled():
+        return _ocr_image_source(source), None
+
+    def on_late(text: str) -> None:
+        if key is not None:
+            _put_cached_pages(key, [text])
+
+    try:
+        text = run_ocr_job(
+            _ocr_image_source,
+            source if _is_path(source) else bytes(source),
+            budget=budget.max_ocr_seconds,
+            on_late=on_late,
+        )
+    except OcrBudgetExceeded:
+        return "", "max_ocr_seconds"
+    except TimeoutError as exc:
+        raise ValueError(str(exc)) from exc
+    return text, None
+
+
+def _extract_text(ext: str, source: Source, budget: ExtractionBudget) -> str:
+    """按类型提取文本（PDF、pptx/epub/html 与图片以外的类型）"""
+    if ext in _PLAIN_TEXT_TYPES:
+        with _open_buffer(source) as buf:
+            return _decode_text(buf, budget.max_bytes)
 
     if ext == "docx":
         try:
@@ -231,33 +701,25 @@ def extract_text_from_upload(filename: Optional[str], raw: bytes) -> str:
         except Exception as exc:  # noqa: BLE001
             raise ValueError("缺少 Word(docx) 解析依赖 python-docx") from exc
 
-        doc = docx.Document(io.BytesIO(raw))
+        doc = docx.Document(os.fspath(source) if _is_path(source) else io.BytesIO(source))
         parts = [p.text for p in doc.paragraphs if p.text and p.text.strip()]
         return "\n".join(parts).strip()
 
     if ext == "doc":
         raise ValueError("暂不支持 .doc（请另存为 .docx 后上传）")
 
-    if ext in {"jpg", "jpeg", "png", "bmp", "webp"}:
-        try:
-            import numpy as np
-            import cv2
-        except Exception as exc:  # noqa: BLE001
-            raise ValueError("缺少 OCR 依赖 (opencv/numpy)") from exc
-        
-        # 将 bytes 转为 numpy array 以供 cv2 使用
-        nparr = np.frombuffer(raw, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if img is None:
-            raise ValueError("无法解析图片文件")
-
-        # 使用配置的OCR后端
-        text = _ocr_image(img)
-        return text
-
     raise ValueError(f"不支持的文件类型: .{ext}")
 
 
-__all__ = ["extract_text_from_upload"]
-
-
+__all__ = [
+    "ExtractionBudget",
+    "ExtractionResult",
+    "TextChunk",
+    "default_budget",
+    "extract_image_texts",
+    "extract_text_from_upload",
+    "extract_upload_text",
+    "is_image",
+    "iter_text_from_upload",
+    "join_chunks",
+]
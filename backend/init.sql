@@ -23,15 +23,67 @@ CREATE TABLE IF NOT EXISTS flash_cards (
     status TEXT NOT NULL DEFAULT 'notStarted',
     created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
     last_reviewed_at TIMESTAMP WITH TIME ZONE,
+    normalized_term TEXT,
     CONSTRAINT fk_note FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE,
     CONSTRAINT unique_note_term UNIQUE(note_id, term)
 );
 
 -- 创建索引
 CREATE INDEX IF NOT EXISTS idx_flash_cards_note_id ON flash_cards(note_id);
+CREATE INDEX IF NOT EXISTS idx_flash_cards_term ON flash_cards(term);
+-- 同一笔记内按规范化词条去重（见 term_normalizer.py）
+CREATE UNIQUE INDEX IF NOT EXISTS idx_flash_cards_note_normalized ON flash_cards(note_id, normalized_term);
 CREATE INDEX IF NOT EXISTS idx_flash_cards_status ON flash_cards(status);
 CREATE INDEX IF NOT EXISTS idx_notes_created_at ON notes(created_at);
 
+-- 创建review_schedule表（复习计划，每张卡片一行）
+CREATE TABLE IF NOT EXISTS review_schedule (
+    id TEXT PRIMARY KEY,
+    card_id TEXT NOT NULL UNIQUE,
+    next_review_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    review_count INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY (card_id) REFERENCES flash_cards(id) ON DELETE CASCADE
+);
+-- 行会被原地更新，物理顺序与时间无关，用 B-tree 而不是 BRIN
+CREATE INDEX IF NOT EXISTS idx_review_schedule_next_review ON review_schedule(next_review_at);
+
+-- 创建learning_history表（学习历史，按月范围分区）
+CREATE TABLE IF NOT EXISTS learning_history (
+    id TEXT NOT NULL,
+    card_id TEXT NOT NULL,
+    note_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    duration_seconds INTEGER NOT NULL DEFAULT 0,
+    studied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, studied_at),
+    FOREIGN KEY (card_id) REFERENCES flash_cards(id) ON DELETE CASCADE,
+    FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE
+) PARTITION BY RANGE (studied_at);
+CREATE INDEX IF NOT EXISTS idx_learning_history_card_id ON learning_history(card_id);
+-- 只追加写入，studied_at 与物理顺序一致，BRIN 索引很小
+CREATE INDEX IF NOT EXISTS idx_learning_history_studied_at ON learning_history USING BRIN (studied_at);
+
+-- 创建 ts 所在月份（UTC）的学习历史分区（database_async.py 启动时与写入缺分区时调用）
+CREATE OR REPLACE FUNCTION ensure_learning_history_partition(ts TIMESTAMP WITH TIME ZONE)
+RETURNS TEXT AS $$
+DECLARE
+    -- 按 UTC 划分月份，分区边界与名称不随会话时区变化
+    month_start TIMESTAMP WITH TIME ZONE := date_trunc('month', ts AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+    month_end TIMESTAMP WITH TIME ZONE := (date_trunc('month', ts AT TIME ZONE 'UTC') + INTERVAL '1 month') AT TIME ZONE 'UTC';
+    partition_name TEXT := 'learning_history_' || to_char(month_start AT TIME ZONE 'UTC', 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF learning_history FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, month_end
+    );
+    RETURN partition_name;
+END;
+$$ language 'plpgsql';
+
+-- 创建当月与下月分区
+SELECT ensure_learning_history_partition(NOW());
+SELECT ensure_learning_history_partition(NOW() + INTERVAL '1 month');
+
 -- 创建更新时间触发器函数
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
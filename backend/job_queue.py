@@ -0,0 +1,823 @@
+"""
+持久化任务队列（异步文本提取任务）
+
+原先异步任务保存在 server_async 的模块级字典里，用 asyncio.create_task 直接在 API 进程中执行：
+重启后任务丢失、多个 uvicorn worker 之间互相看不到任务，也没有并发上限。这里改为数据库中的任务表：
+
+- 默认 SQLite（JOB_QUEUE_DB_PATH，WAL 模式，多进程共享）；JOB_QUEUE_DB_URL 设为 postgresql:// 时使用 Postgres
+- 任务状态：pending → processing → completed / failed；进度（页数、消息、文本字数等）以 JSON 保存在
+  state 列，全文与词语（包括处理中的部分结果）单独保存在 result 列，任何 API 进程都能读取；
+  列表只读取 state 列，按页查询的开销与文档大小无关
+- 租约：worker 领取任务时写入 lease_owner 与租约到期时间，处理期间定期续约；
+  worker 崩溃后租约过期，任务被其他 worker 重新领取
+- 重试：处理失败（ValueError 视为输入问题，不重试）时按 JOB_RETRY_BACKOFF_SECONDS × 2^(n-1) 延后重试，
+  超过 JOB_MAX_ATTEMPTS 次后标记为失败
+- worker：JobWorker 循环领取并执行任务。API 进程内默认运行 JOB_INPROCESS_WORKERS 个线程；
+  设为 0 并单独运行 `python job_worker.py` 时，OCR/LLM 提取可以与 Web 层分开扩容
+- 调度：领取时优先选择当前处理中任务最少的客户端（按客户端公平排队），同一梯队内按预估成本
+  从小到大，成本随等待时间按 JOB_COST_AGING_SECONDS 递减，避免大文件一直排不上；
+  active_counts 供 API 层做准入控制（队列过长时返回 429）
+- 通知：JobEvents 按任务订阅变化。同一进程内的 worker 写入进度、完成或失败时立即通知；
+  其他进程（独立 worker 或其他 API 进程）的改动由一个后台线程每 JOB_EVENT_POLL_INTERVAL 秒
+  用一条查询检查所有被订阅任务的 updated_at 发现，查询开销与订阅者数量无关
+- 容量：客户端通常不会删除任务，结束的任务（completed/failed）超过 JOB_RESULT_TTL_SECONDS 后清除，
+  并按最近访问时间（LRU）淘汰，使结束任务数不超过 JOB_MAX_FINISHED、结果总大小不超过 JOB_MAX_RESULT_BYTES；
+  超过 JOB_RESULT_OFFLOAD_BYTES 的结果（全文与词语）gzip 压缩后转存到 JOB_RESULT_DIR，表中只保留元数据
+
+SQLite 与 Postgres 共用同一套 SQL（UPDATE ... RETURNING 领取任务，条件更新防止重复领取）。
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+try:
+    from .config import (
+        job_cost_aging_seconds,
+        job_event_poll_interval,
+        job_lease_seconds,
+        job_max_attempts,
+        job_poll_interval,
+        job_queue_db_path,
+        job_queue_db_url,
+        job_max_finished,
+        job_max_result_bytes,
+        job_result_dir,
+        job_result_offload_bytes,
+        job_result_ttl_seconds,
+        job_retry_backoff_seconds,
+    )
+except ImportError:  # pragma: no cover
+    from config import (
+        job_cost_aging_seconds,
+        job_event_poll_interval,
+        job_lease_seconds,
+        job_max_attempts,
+        job_poll_interval,
+        job_queue_db_path,
+        job_queue_db_url,
+        job_max_finished,
+        job_max_result_bytes,
+        job_result_dir,
+        job_result_offload_bytes,
+        job_result_ttl_seconds,
+        job_retry_backoff_seconds,
+    )
+
+
+PENDING = "pending"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+FINISHED = (COMPLETED, FAILED)
+
+# 转存到磁盘的结果字段
+_OFFLOAD_FIELDS = ("text", "terms")
+# 两次清理过期任务的最短间隔（秒）
+_PURGE_INTERVAL = 60.0
+
+# 任务处理函数：handler(payload, report) -> 完成时写入 state 的字段；
+# report(**fields) 写入进度（同时续约）
+JobHandler = Callable[[Dict[str, Any], Callable[..., None]], Dict[str, Any]]
+
+_CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS extraction_jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        client TEXT NOT NULL DEFAULT '',
+        cost DOUBLE PRECISION NOT NULL DEFAULT 0,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL,
+        state TEXT NOT NULL,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        available_at DOUBLE PRECISION NOT NULL,
+        lease_owner TEXT,
+        lease_expires_at DOUBLE PRECISION,
+        created_at DOUBLE PRECISION NOT NULL,
+        updated_at DOUBLE PRECISION NOT NULL,
+        completed_at DOUBLE PRECISION,
+        accessed_at DOUBLE PRECISION,
+        result TEXT,
+        result_bytes INTEGER NOT NULL DEFAULT 0,
+        result_path TEXT
+    )
+"""
+
+# 旧版本创建的表缺少的列：(列名, 定义, 回填旧记录的 SQL)。
+# CREATE TABLE IF NOT EXISTS 不会修改已有的表，启动时检查并补充
+_MIGRATED_COLUMNS = (
+    # 调度用的提交者与预估成本；旧任务按同一客户端、成本 0 处理
+    ("client", "TEXT NOT NULL DEFAULT ''", None),
+    ("cost", "DOUBLE PRECISION NOT NULL DEFAULT 0", None),
+    (
+        "accessed_at",
+        "DOUBLE PRECISION",
+        "UPDATE extraction_jobs SET accessed_at = COALESCE(completed_at, updated_at) WHERE accessed_at IS NULL",
+    ),
+    ("result_bytes", "INTEGER NOT NULL DEFAULT 0", "UPDATE extraction_jobs SET result_bytes = LENGTH(state)"),
+    ("result_path", "TEXT", None),
+    # 旧记录的全文与词语仍在 state 列中，读取时照常合并
+    ("result", "TEXT", None),
+)
+
+# 索引可能用到补充的列，在补充列之后创建
+_CREATE_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS idx_extraction_jobs_created ON extraction_jobs (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_extraction_jobs_client ON extraction_jobs (status, client)",
+    "CREATE INDEX IF NOT EXISTS idx_extraction_jobs_status ON extraction_jobs (status, available_at)",
+    "CREATE INDEX IF NOT EXISTS idx_extraction_jobs_accessed ON extraction_jobs (status, accessed_at)",
+)
+
+_COLUMNS = (
+    "id, kind, payload, status, state, error, attempts, max_attempts, "
+    "lease_owner, created_at, updated_at, completed_at, result_path"
+)
+# 查询完整记录时额外读取的结果列
+_RESULT_COLUMNS = f"{_COLUMNS}, result"
+
+
+class LeaseLost(Exception):
+    """任务租约已过期并被其他 worker 接手（或任务已被删除），当前 worker 应停止处理"""
+
+
+def _sqlite_executor(db_path: str):
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    # 多个进程同时写入时等待而不是直接报错
+    conn.execute("PRAGMA busy_timeout = 5000")
+    lock = threading.Lock()
+
+    def execute(sql: str, params: Sequence[Any]) -> List[tuple]:
+        with lock:
+            return conn.execute(sql, tuple(params)).fetchall()
+
+    execute.dialect = "sqlite"
+    return execute
+
+
+def _postgres_executor(url: str):
+    try:
+        from psycopg2.pool import ThreadedConnectionPool
+    except ImportError as exc:
+        raise RuntimeError("JOB_QUEUE_DB_URL 指向 Postgres，但未安装 psycopg2") from exc
+    pool = ThreadedConnectionPool(1, 8, url)
+
+    def execute(sql: str, params: Sequence[Any]) -> List[tuple]:
+        conn = pool.getconn()
+        try:
+            with conn, conn.cursor() as cursor:
+                cursor.execute(sql.replace("?", "%s"), tuple(params))
+                return cursor.fetchall() if cursor.description else []
+        finally:
+            pool.putconn(conn)
+
+    execute.dialect = "postgres"
+    return execute
+
+
+def _table_columns(execute: Callable[[str, Sequence[Any]], List[tuple]]) -> set:
+    """任务表现有的列名"""
+    if getattr(execute, "dialect", "sqlite") == "postgres":
+        rows = execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = ?",
+            ("extraction_jobs",),
+        )
+    else:
+        rows = execute("SELECT name FROM pragma_table_info('extraction_jobs')", ())
+    return {name for (name,) in rows}
+
+
+def _split_state(state: Dict[str, Any]) -> tuple[str, Optional[str]]:
+    """把任务状态拆成 (元数据 JSON, 全文与词语 JSON)；元数据中记录文本字数与词语数"""
+    meta = {key: value for key, value in state.items() if key not in _OFFLOAD_FIELDS}
+    result = {key: state[key] for key in _OFFLOAD_FIELDS if state.get(key) is not None}
+    meta["text_chars"] = len(state.get("text") or "")
+    meta["term_count"] = len(state.get("terms") or [])
+    return json.dumps(meta), json.dumps(result, ensure_ascii=False) if result else None
+
+
+def _write_result(result_dir: str, job_id: str, result: Dict[str, Any]) -> str:
+    os.makedirs(result_dir, exist_ok=True)
+    path = os.path.join(result_dir, f"{job_id}.json.gz")
+    tmp_path = f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as out:
+        json.dump(result, out, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _read_result(path: str) -> Dict[str, Any]:
+    with gzip.open(path, "rt", encoding="utf-8") as src:
+        return json.load(src)
+
+
+def _remove_result(path: Optional[str]) -> None:
+    if path:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+class JobEvents:
+    """
+    任务变化的订阅与通知（进程内）。
+
+    subscribe(job_id, callback) 后，任务状态、进度或结果变化（或任务被删除）时调用 callback()；
+    callback 可能在任意线程中被调用，应当只做轻量的唤醒操作。
+    """
+
+    def __init__(self, queue: "JobQueue", poll_interval: float = job_event_poll_interval):
+        self._queue = queue
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Dict[int, Callable[[], None]]] = {}
+        # 每个被订阅任务最近一次看到的 updated_at（任务不存在时为 None）
+        self._seen: Dict[str, Optional[float]] = {}
+        self._next_token = 0
+        self._watcher: Optional[threading.Thread] = None
+
+    def subscribe(self, job_id: str, callback: Callable[[], None]) -> Callable[[], None]:
+        """订阅任务变化，返回取消订阅的函数"""
+        # 在锁外查询，避免数据库查询阻塞其他订阅与通知；查询之后、登记之前的变化会在下次检查时通知
+        updated_at = self._updated_at([job_id]).get(job_id)
+        with self._lock:
+            token = self._next_token
+            self._next_token += 1
+            if job_id not in self._subscribers:
+                self._subscribers[job_id] = {}
+                self._seen[job_id] = updated_at
+            self._subscribers[job_id][token] = callback
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = threading.Thread(target=self._watch, name="job-events", daemon=True)
+                self._watcher.start()
+
+        def unsubscribe():
+            with self._lock:
+                callbacks = self._subscribers.get(job_id)
+                if callbacks is not None:
+                    callbacks.pop(token, None)
+                    if not callbacks:
+                        del self._subscribers[job_id]
+                        self._seen.pop(job_id, None)
+
+        return unsubscribe
+
+    def notify(self, job_id: str) -> None:
+        with self._lock:
+            callbacks = list(self._subscribers.get(job_id, {}).values())
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as exc:  # noqa: BLE001
+                print(f"[JobQueue] 任务 {job_id} 通知失败: {exc}")
+
+    def _updated_at(self, job_ids: List[str]) -> Dict[str, float]:
+        rows = self._queue._execute(
+            f"SELECT id, updated_at FROM extraction_jobs WHERE id IN ({', '.join('?' for _ in job_ids)})",
+            job_ids,
+        )
+        return dict(rows)
+
+    def poll(self) -> int:
+        """检查被订阅的任务是否被其他进程修改，通知发生变化的任务；返回通知的任务数"""
+        with self._lock:
+            seen = dict(self._seen)
+        if not seen:
+            return 0
+        current = self._updated_at(list(seen))
+        changed = [job_id for job_id, updated_at in seen.items() if current.get(job_id) != updated_at]
+        with self._lock:
+            for job_id in changed:
+                if job_id in self._seen:
+                    self._seen[job_id] = current.get(job_id)
+        for job_id in changed:
+            self.notify(job_id)
+        return len(changed)
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if not self._subscribers:
+                    # 没有订阅者时退出，下次订阅时重新启动
+                    self._watcher = None
+                    return
+            try:
+                self.poll()
+            except Exception as exc:  # noqa: BLE001
+                print(f"[JobQueue] 检查任务变化失败: {exc}")
+
+
+class JobQueue:
+    """数据库中的任务表"""
+
+    def __init__(
+        self,
+        execute: Callable[[str, Sequence[Any]], List[tuple]],
+        lease_seconds: float = job_lease_seconds,
+        max_attempts: int = job_max_attempts,
+        retry_backoff: float = job_retry_backoff_seconds,
+        result_dir: str = job_result_dir,
+        offload_bytes: int = job_result_offload_bytes,
+        result_ttl: float = job_result_ttl_seconds,
+        max_finished: int = job_max_finished,
+        max_result_bytes: int = job_max_result_bytes,
+        cost_aging: float = job_cost_aging_seconds,
+    ):
+        self._execute = execute
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.result_dir = result_dir
+        self.offload_bytes = offload_bytes
+        self.result_ttl = result_ttl
+        self.max_finished = max_finished
+        self.max_result_bytes = max_result_bytes
+        self.cost_aging = cost_aging
+        self._execute(_CREATE_TABLE_SQL, ())
+        self._migrate_columns()
+        for sql in _CREATE_INDEX_SQL:
+            self._execute(sql, ())
+        self.events = JobEvents(self)
+
+    def _migrate_columns(self) -> None:
+        """旧版本创建的任务表补充缺少的列并回填旧记录"""
+        existing = _table_columns(self._execute)
+        for name, definition, backfill in _MIGRATED_COLUMNS:
+            if name in existing:
+                continue
+            try:
+                self._execute(f"ALTER TABLE extraction_jobs ADD COLUMN {name} {definition}", ())
+            except Exception:
+                # 其他进程同时补充了该列
+                if name in _table_columns(self._execute):
+                    continue
+                raise
+            if backfill:
+                self._execute(backfill, ())
+            print(f"[JobQueue] 任务表已补充 {name} 列")
+
+    # ---------- API 侧 ----------
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        state: Optional[Dict[str, Any]] = None,
+        client: str = "",
+        cost: float = 0.0,
+    ) -> str:
+        """
+        加入任务。client 标识提交者（按客户端公平调度），cost 为预估处理成本（越小越先处理）
+        """
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        self._execute(
+            "INSERT INTO extraction_jobs (id, kind, client, cost, payload, status, state, max_attempts, "
+            "available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, client, cost, json.dumps(payload), PENDING, json.dumps(state or {}),
+             self.max_attempts, now, now, now),
+        )
+        return job_id
+
+    def active_counts(self, client: str = "") -> tuple[int, int]:
+        """(排队中与处理中的任务总数, 其中该客户端的任务数)，用于准入控制"""
+        rows = self._execute(
+            "SELECT COUNT(*), COALESCE(SUM(CASE WHEN client = ? THEN 1 ELSE 0 END), 0) "
+            "FROM extraction_jobs WHERE status IN (?, ?)",
+            (client, PENDING, PROCESSING),
+        )
+        total, own = rows[0]
+        return int(total), int(own)
+
+    @staticmethod
+    def _to_dict(row: tuple) -> Dict[str, Any]:
+        """行转为任务记录；行中带有 result 列时同时合并全文与词语（包括转存到磁盘的结果）"""
+        (job_id, kind, payload, status, state, error, attempts, max_attempts,
+         lease_owner, created_at, updated_at, completed_at, result_path) = row[:13]
+        job = json.loads(state)
+        if len(row) > 13:
+            if row[13]:
+                job.update(json.loads(row[13]))
+            if result_path:
+                job.update(_read_result(result_path))
+        job.update(
+            task_id=job_id,
+            kind=kind,
+            payload=json.loads(payload),
+            status=status,
+            error=error,
+            attempts=attempts,
+            max_attempts=max_attempts,
+            worker=lease_owner,
+            created_at=created_at,
+            updated_at=updated_at,
+            completed_at=completed_at,
+        )
+        return job
+
+    def get(self, job_id: str, with_results: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        任务记录：state 中的字段加上状态、错误、尝试次数、时间等；with_results 时包括全文与词语
+        （含转存到磁盘的结果）。读取结束的任务会刷新其访问时间（LRU 淘汰依据）。
+        """
+        columns = _RESULT_COLUMNS if with_results else _COLUMNS
+        rows = self._execute(
+            f"UPDATE extraction_jobs SET accessed_at = ? WHERE id = ? AND status IN (?, ?) RETURNING {columns}",
+            (time.time(), job_id, *FINISHED),
+        ) or self._execute(f"SELECT {columns} FROM extraction_jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        try:
+            return self._to_dict(rows[0])
+        except OSError:
+            # 结果文件已被清理（任务同时被淘汰）
+            return None
+
+    def list_jobs(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        statuses: Optional[Sequence[str]] = None,
+        created_after: Optional[float] = None,
+        created_before: Optional[float] = None,
+        with_results: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        按创建时间倒序分页列出任务，可按状态与创建时间（Unix 时间戳，左闭右开）过滤。
+        默认只读取元数据（不含全文与词语），with_results 时读取完整结果。
+        """
+        conditions: List[str] = []
+        params: List[Any] = []
+        if statuses:
+            conditions.append(f"status IN ({', '.join('?' for _ in statuses)})")
+            params.extend(statuses)
+        if created_after is not None:
+            conditions.append("created_at >= ?")
+            params.append(created_after)
+        if created_before is not None:
+            conditions.append("created_at < ?")
+            params.append(created_before)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._execute(
+            f"SELECT {_RESULT_COLUMNS if with_results else _COLUMNS} FROM extraction_jobs{where} "
+            "ORDER BY created_at DESC, id LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        )
+        jobs = []
+        for row in rows:
+            try:
+                jobs.append(self._to_dict(row))
+            except OSError:
+                continue
+        return jobs
+
+    def delete(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """删除不在处理中的任务，返回被删除的任务；任务正在处理时不删除，返回 None"""
+        rows = self._execute(
+            f"DELETE FROM extraction_jobs WHERE id = ? AND status <> ? RETURNING {_COLUMNS}",
+            (job_id, PROCESSING),
+        )
+        if not rows:
+            return None
+        job = self._to_dict(rows[0])
+        _remove_result(rows[0][-1])
+        self.events.notify(job_id)
+        return job
+
+    def purge(self, now: Optional[float] = None) -> int:
+        """
+        清理结束的任务：超过 TTL 的全部删除，其余按最近访问时间淘汰到
+        数量与结果总大小的上限以内（0 表示不限制）。返回删除的任务数。
+        """
+        now = time.time() if now is None else now
+        removed = []
+        if self.result_ttl > 0:
+            removed += self._execute(
+                "DELETE FROM extraction_jobs WHERE status IN (?, ?) AND completed_at < ? RETURNING id, result_path",
+                (*FINISHED, now - self.result_ttl),
+            )
+        if self.max_finished > 0 or self.max_result_bytes > 0:
+            rows = self._execute(
+                "SELECT id, result_bytes FROM extraction_jobs WHERE status IN (?, ?) "
+                "ORDER BY accessed_at DESC, id",
+                FINISHED,
+            )
+            kept_bytes = 0
+            evict = []
+            for index, (job_id, result_bytes) in enumerate(rows):
+                kept_bytes += result_bytes
+                if (0 < self.max_finished <= index) or (0 < self.max_result_bytes < kept_bytes):
+                    evict.append(job_id)
+            for start in range(0, len(evict), 500):
+                batch = evict[start:start + 500]
+                removed += self._execute(
+                    f"DELETE FROM extraction_jobs WHERE id IN ({', '.join('?' for _ in batch)}) "
+                    "AND status IN (?, ?) RETURNING id, result_path",
+                    (*batch, *FINISHED),
+                )
+        for _, result_path in removed:
+            _remove_result(result_path)
+        if removed:
+            print(f"[JobQueue] 清理了 {len(removed)} 个已结束的任务")
+        return len(removed)
+
+    # ---------- worker 侧 ----------
+
+    def claim(self, owner: str, kinds: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        领取一个到期的待处理任务，或租约已过期的处理中任务（原 worker 崩溃）；没有时返回 None。
+        """
+        now = time.time()
+        kind_filter = ""
+        params: List[Any] = [PENDING, now, PROCESSING, now]
+        if kinds:
+            kind_filter = f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        ready = (
+            "((status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at < ?))"
+            " AND attempts < max_attempts" + kind_filter
+        )
+        # 处理中任务最少的客户端优先；同一梯队按（随等待时间递减的）预估成本，再按先来后到
+        aging = f" - (? - available_at) / {float(self.cost_aging)}" if self.cost_aging > 0 else ""
+        order_params = [PROCESSING, now] if aging else [PROCESSING]
+        for _ in range(3):
+            rows = self._execute(
+                f"""
+                UPDATE extraction_jobs
+                SET status = ?, lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1, updated_at = ?
+                WHERE id = (
+                    SELECT id FROM extraction_jobs AS candidate WHERE {ready}
+                    ORDER BY (
+                        SELECT COUNT(*) FROM extraction_jobs AS running
+                        WHERE running.status = ? AND running.client = candidate.client
+                    ), cost{aging}, available_at
+                    LIMIT 1
+                )
+                AND {ready}
+                RETURNING {_COLUMNS}
+                """,
+                [PROCESSING, owner, now + self.lease_seconds, now, *params, *order_params, *params],
+            )
+            if rows:
+                job = self._to_dict(rows[0])
+                self.events.notify(job["task_id"])
+                return job
+            # 没有到期任务，或与其他 worker 争抢同一任务失败：再确认一次是否还有可领取的任务
+            if not self._execute(f"SELECT 1 FROM extraction_jobs WHERE {ready} LIMIT 1", params):
+                return None
+        return None
+
+    def fail_exhausted(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        租约过期且已用完重试次数的任务（worker 崩溃或卡住）标记为失败，
+        返回这些任务的 payload，由调用方释放任务占用的临时文件
+        """
+        now = time.time() if now is None else now
+        rows = self._execute(
+            "UPDATE extraction_jobs SET status = ?, error = COALESCE(error, ?), lease_owner = NULL, "
+            "completed_at = ?, updated_at = ?, accessed_at = ? "
+            "WHERE status = ? AND lease_expires_at < ? AND attempts >= max_attempts RETURNING id, payload",
+            (FAILED, "任务处理超时（worker 无响应）", now, now, now, PROCESSING, now),
+        )
+        for job_id, _ in rows:
+            self.events.notify(job_id)
+        return [json.loads(payload) for _, payload in rows]
+
+    def _update_owned(
+        self, job_id: str, owner: str, assignments: str, params: Sequence[Any], notify: bool = True
+    ) -> None:
+        """
+        更新当前 worker 持有租约的任务。notify=False（单纯续约）时不更新 updated_at，
+        订阅者（包括其他进程中按 updated_at 检查变化的订阅者）不会被唤醒
+        """
+        if notify:
+            assignments, params = f"{assignments}, updated_at = ?", (*params, time.time())
+        rows = self._execute(
+            f"UPDATE extraction_jobs SET {assignments} "
+            "WHERE id = ? AND status = ? AND lease_owner = ? RETURNING id",
+            (*params, job_id, PROCESSING, owner),
+        )
+        if not rows:
+            raise LeaseLost(job_id)
+        if notify:
+            self.events.notify(job_id)
+
+    def heartbeat(self, job_id: str, owner: str, state: Optional[Dict[str, Any]] = None) -> None:
+        """续约；传入 state 时同时写入进度（并通知订阅者）。租约已失效时抛出 LeaseLost"""
+        expires = time.time() + self.lease_seconds
+        if state is None:
+            self._update_owned(job_id, owner, "lease_expires_at = ?", (expires,), notify=False)
+        else:
+            self._update_owned(job_id, owner, "lease_expires_at = ?, state = ?, result = ?", (expires, *_split_state(state)))
+
+    def _finish(self, job_id: str, owner: str, status: str, error: Optional[str], state: Dict[str, Any]) -> None:
+        """
+        标记任务结束。结果超过 offload_bytes 时把全文与词语压缩写入 result_dir，
+        state 列只保留进度等元数据。
+        """
+        meta, result = _split_state(state)
+        result_path = None
+        result_bytes = len(meta) + len((result or "").encode("utf-8"))
+        if result and 0 < self.offload_bytes < len(result):
+            result_path = _write_result(self.result_dir, job_id, json.loads(result))
+            result = None
+            result_bytes = len(meta) + os.path.getsize(result_path)
+        now = time.time()
+        try:
+            self._update_owned(
+                job_id, owner,
+                "status = ?, state = ?, result = ?, error = ?, lease_owner = NULL, lease_expires_at = NULL, "
+                "completed_at = ?, accessed_at = ?, result_bytes = ?, result_path = ?",
+                (status, meta, result, error, now, now, result_bytes, result_path),
+            )
+        except LeaseLost:
+            _remove_result(result_path)
+            raise
+
+    def complete(self, job_id: str, owner: str, state: Dict[str, Any]) -> None:
+        self._finish(job_id, owner, COMPLETED, None, state)
+
+    def fail(self, job_id: str, owner: str, attempts: int, error: str, state: Dict[str, Any], retry: bool) -> bool:
+        """处理失败：还有重试次数且 retry 时延后重新排队（返回 True），否则标记为失败"""
+        if retry and attempts < self.max_attempts:
+            delay = self.retry_backoff * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+            self._update_owned(
+                job_id, owner,
+                "status = ?, state = ?, result = ?, error = ?, lease_owner = NULL, lease_expires_at = NULL, "
+                "available_at = ?",
+                (PENDING, *_split_state(state), error, time.time() + delay),
+            )
+            return True
+        self._finish(job_id, owner, FAILED, error, state)
+        return False
+
+
+class JobWorker:
+    """
+    循环领取并执行任务。
+
+    处理期间后台线程每 1/3 租约时长续约一次；handler 通过 report 写入的进度会合并进 state。
+    任务最终完成或失败（不再重试，包括原 worker 崩溃后租约过期的任务）后调用 cleanup(payload)
+    释放任务占用的临时文件等。
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, JobHandler],
+        cleanup: Optional[Callable[[Dict[str, Any]], None]] = None,
+        worker_id: Optional[str] = None,
+        poll_interval: float = job_poll_interval,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.cleanup = cleanup
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.poll_interval = poll_interval
+        self._last_purge = 0.0
+
+    def run_once(self) -> bool:
+        """领取并处理一个任务；没有任务时返回 False"""
+        # 原 worker 崩溃且不再重试的任务由这里标记为失败并清理
+        for payload in self.queue.fail_exhausted():
+            if self.cleanup is not None:
+                self.cleanup(payload)
+        job = self.queue.claim(self.worker_id, list(self.handlers))
+        if job is None:
+            return False
+        self._process(job)
+        return True
+
+    def _process(self, job: Dict[str, Any]) -> None:
+        job_id, payload, attempts = job["task_id"], job["payload"], job["attempts"]
+        state = {
+            key: value
+            for key, value in job.items()
+            if key not in {"task_id", "kind", "payload", "status", "error", "attempts", "max_attempts",
+                           "worker", "created_at", "updated_at", "completed_at"}
+        }
+        lost = threading.Event()
+        stop = threading.Event()
+
+        def report(**fields):
+            if lost.is_set():
+                raise LeaseLost(job_id)
+            state.update(fields)
+            try:
+                self.queue.heartbeat(job_id, self.worker_id, state)
+            except LeaseLost:
+                lost.set()
+                raise
+
+        def keep_alive():
+            while not stop.wait(self.queue.lease_seconds / 3):
+                try:
+                    self.queue.heartbeat(job_id, self.worker_id)
+                except LeaseLost:
+                    lost.set()
+                    return
+                except Exception as exc:  # noqa: BLE001
+                    print(f"[JobQueue] 任务 {job_id} 续约失败: {exc}")
+
+        heartbeat = threading.Thread(target=keep_alive, name=f"job-heartbeat-{job_id}", daemon=True)
+        heartbeat.start()
+        finished = True
+        try:
+            result = self.handlers[job["kind"]](payload, report)
+            state.update(result or {})
+            self.queue.complete(job_id, self.worker_id, state)
+        except LeaseLost:
+            # 任务已被其他 worker 接手，由对方负责清理
+            finished = False
+            print(f"[JobQueue] 任务 {job_id} 租约已失效，停止处理")
+        except Exception as exc:  # noqa: BLE001
+            print(f"[JobQueue] 任务 {job_id} 第 {attempts} 次处理失败: {exc}")
+            # ValueError 是文件本身的问题（类型不支持、没有文本、超过预算等），重试也不会成功
+            retry = not isinstance(exc, ValueError) and attempts < self.queue.max_attempts
+            state["message"] = "处理失败，稍后重试" if retry else "处理失败"
+            try:
+                finished = not self.queue.fail(job_id, self.worker_id, attempts, str(exc), state, retry=retry)
+            except LeaseLost:
+                finished = False
+        finally:
+            stop.set()
+            heartbeat.join()
+            if finished and self.cleanup is not None:
+                self.cleanup(payload)
+
+    def run(self, stop: threading.Event) -> None:
+        """循环处理任务直到 stop 被设置；空闲时定期清理已结束的任务"""
+        while not stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+                if time.monotonic() - self._last_purge >= _PURGE_INTERVAL:
+                    self._last_purge = time.monotonic()
+                    self.queue.purge()
+            except Exception as exc:  # noqa: BLE001
+                print(f"[JobQueue] worker {self.worker_id} 出错: {exc}")
+            stop.wait(self.poll_interval)
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """返回进程内共享的任务队列（首次使用时创建表）"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                if job_queue_db_url.startswith(("postgres://", "postgresql://")):
+                    _queue = JobQueue(_postgres_executor(job_queue_db_url))
+                else:
+                    _queue = JobQueue(_sqlite_executor(job_queue_db_path))
+    return _queue
+
+
+def start_workers(
+    count: int,
+    handlers: Dict[str, JobHandler],
+    cleanup: Optional[Callable[[Dict[str, Any]], None]] = None,
+    queue: Optional[JobQueue] = None,
+) -> tuple[threading.Event, List[threading.Thread]]:
+    """启动 count 个 worker 线程，返回 (停止事件, 线程列表)"""
+    queue = queue or get_job_queue()
+    stop = threading.Event()
+    threads = []
+    for i in range(count):
+        worker = JobWorker(queue, handlers, cleanup)
+        thread = threading.Thread(target=worker.run, args=(stop,), name=f"job-worker-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return stop, threads
+
+
+__all__ = [
+    "COMPLETED",
+    "FAILED",
+    "FINISHED",
+    "JobEvents",
+    "JobQueue",
+    "JobWorker",
+    "LeaseLost",
+    "PENDING",
+    "PROCESSING",
+    "get_job_queue",
+    "start_workers",
+]
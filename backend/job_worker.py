@@ -0,0 +1,53 @@
+"""
+独立运行的异步提取任务 worker
+
+与 API 进程共享 JOB_QUEUE_DB_PATH（或 JOB_QUEUE_DB_URL）和 UPLOAD_SPOOL_DIR，
+可以在 API 进程设置 JOB_INPROCESS_WORKERS=0 后单独扩容 OCR/LLM 提取：
+
+    python job_worker.py --concurrency 4
+
+收到 SIGTERM/SIGINT 后不再领取新任务，等待处理中的任务结束后退出。
+"""
+
+import argparse
+import signal
+
+try:
+    from .extraction_jobs import JOB_HANDLERS, discard_job_files
+    from .job_queue import get_job_queue, start_workers
+    from .ocr_pool import shutdown_ocr_pool
+    from .pdf_extractor import shutdown_pdf_pool
+except ImportError:  # pragma: no cover
+    from extraction_jobs import JOB_HANDLERS, discard_job_files
+    from job_queue import get_job_queue, start_workers
+    from ocr_pool import shutdown_ocr_pool
+    from pdf_extractor import shutdown_pdf_pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description="异步文本提取任务 worker")
+    parser.add_argument("--concurrency", type=int, default=2, help="同时处理的任务数")
+    args = parser.parse_args()
+
+    get_job_queue()
+    stop, threads = start_workers(max(1, args.concurrency), JOB_HANDLERS, discard_job_files)
+    print(f"[JobWorker] 已启动 {len(threads)} 个 worker")
+
+    def handle_signal(signum, frame):
+        print("[JobWorker] 收到退出信号，等待处理中的任务结束...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    # 主线程等待信号；join 不带超时时收不到 SIGINT
+    while not stop.wait(1.0):
+        pass
+    for thread in threads:
+        thread.join()
+    shutdown_pdf_pool()
+    shutdown_ocr_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,192 @@
+import time
 from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence, Tuple
 
+import httpx
+from langchain_core.messages import BaseMessage
 from langchain_openai import ChatOpenAI
 
 try:
-    from .config import api_key, base_url, model
+    from .config import (
+        api_key,
+        base_url,
+        llm_http2,
+        llm_http_connect_timeout,
+        llm_http_keepalive_expiry,
+        llm_http_max_connections,
+        llm_http_max_keepalive,
+        llm_http_read_timeout,
+        model,
+    )
+    from .metrics import record_llm_call, registry
 except ImportError:
-    from config import api_key, base_url, model
+    from config import (
+        api_key,
+        base_url,
+        llm_http2,
+        llm_http_connect_timeout,
+        llm_http_keepalive_expiry,
+        llm_http_max_connections,
+        llm_http_max_keepalive,
+        llm_http_read_timeout,
+        model,
+    )
+    from metrics import record_llm_call, registry
 
 
-@lru_cache(maxsize=1)
-def get_default_llm() -> ChatOpenAI:
+_http_requests = registry.counter("llm_http_requests_total", "LLM HTTP 请求次数（按连接池）")
+_http_connection_events = registry.counter(
+    "llm_http_connection_events_total",
+    "LLM HTTP 连接事件（新建 TCP 连接 / TLS 握手），与请求数对比可得连接复用率",
+)
+
+# httpcore trace 事件 -> 指标中的事件名
+_TRACE_EVENTS = {
+    "connection.connect_tcp.complete": "tcp_connect",
+    "connection.start_tls.complete": "tls_handshake",
+}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _pool_label(url: str, model_name: str) -> str:
+    return f"{model_name}@{httpx.URL(url).host}"
+
+
+def _make_sync_hooks(pool: str) -> Dict[str, list]:
+    def trace(event: str, info: Dict[str, Any]) -> None:
+        name = _TRACE_EVENTS.get(event)
+        if name:
+            registry.inc(_http_connection_events, {"pool": pool, "event": name})
+
+    def on_request(request: httpx.Request) -> None:
+        request.extensions["trace"] = trace
+        registry.inc(_http_requests, {"pool": pool, "client": "sync"})
+
+    return {"request": [on_request]}
+
+
+def _make_async_hooks(pool: str) -> Dict[str, list]:
+    async def trace(event: str, info: Dict[str, Any]) -> None:
+        name = _TRACE_EVENTS.get(event)
+        if name:
+            registry.inc(_http_connection_events, {"pool": pool, "event": name})
+
+    async def on_request(request: httpx.Request) -> None:
+        request.extensions["trace"] = trace
+        registry.inc(_http_requests, {"pool": pool, "client": "async"})
+
+    return {"request": [on_request]}
+
+
+@lru_cache(maxsize=None)
+def get_http_clients(url: str, model_name: str) -> Tuple[httpx.Client, httpx.AsyncClient]:
     """
-    返回一个按照配置文件初始化的 ChatOpenAI 实例。
-    使用 lru_cache 确保全局仅创建一次,避免重复握手。
+    返回某个 model/base_url 专用的同步与异步 httpx 客户端。
+
+    客户端在进程内共享，连接池上限、keepalive 与超时均来自配置，
+    保证 invoke/ainvoke 复用已建立的连接，避免每次请求重新 TLS 握手。
+    """
+    limits = httpx.Limits(
+        max_connections=llm_http_max_connections,
+        max_keepalive_connections=llm_http_max_keepalive,
+        keepalive_expiry=llm_http_keepalive_expiry,
+    )
+    timeout = httpx.Timeout(
+        connect=llm_http_connect_timeout,
+        read=llm_http_read_timeout,
+        write=llm_http_read_timeout,
+        pool=llm_http_connect_timeout,
+    )
+    http2 = llm_http2 and _http2_available()
+    pool = _pool_label(url, model_name)
+    sync_client = httpx.Client(
+        limits=limits,
+        timeout=timeout,
+        http2=http2,
+        event_hooks=_make_sync_hooks(pool),
+    )
+    async_client = httpx.AsyncClient(
+        limits=limits,
+        timeout=timeout,
+        http2=http2,
+        event_hooks=_make_async_hooks(pool),
+    )
+    return sync_client, async_client
+
+
+@lru_cache(maxsize=None)
+def get_llm(model_name: Optional[str] = None, url: Optional[str] = None) -> ChatOpenAI:
+    """
+    返回指定模型/服务地址的 ChatOpenAI 实例（按参数缓存）。
+
+    同一 model/base_url 共享一组 HTTP 连接池。
     """
     if not api_key:
         raise ValueError("API_KEY 未设置，无法调用 LLM。请在 backend/.env 配置 API_KEY。")
+    model_name = model_name or model
+    url = url or base_url
+    sync_client, async_client = get_http_clients(url, model_name)
     return ChatOpenAI(
         api_key=api_key,
-        base_url=base_url,
-        model=model,
+        base_url=url,
+        model=model_name,
+        http_client=sync_client,
+        http_async_client=async_client,
     )
 
 
-__all__ = ["get_default_llm"]
+def get_default_llm() -> ChatOpenAI:
+    """
+    返回一个按照配置文件初始化的 ChatOpenAI 实例。
+    实例与底层 HTTP 连接池全局共享,避免重复握手。
+    """
+    return get_llm(model, base_url)
+
+
+def get_http_connection_stats() -> Dict[str, Dict[str, float]]:
+    """
+    按连接池汇总 LLM HTTP 连接复用情况：
+
+    - requests: 请求数
+    - tcp_connects / tls_handshakes: 新建连接与 TLS 握手次数
+    - reuse_ratio: 复用已有连接的请求占比
+    """
+    stats: Dict[str, Dict[str, float]] = {}
+    for key, value in registry.snapshot(_http_requests).items():
+        labels = dict(key)
+        entry = stats.setdefault(labels["pool"], {"requests": 0, "tcp_connects": 0, "tls_handshakes": 0})
+        entry["requests"] += value
+    for key, value in registry.snapshot(_http_connection_events).items():
+        labels = dict(key)
+        entry = stats.setdefault(labels["pool"], {"requests": 0, "tcp_connects": 0, "tls_handshakes": 0})
+        entry["tcp_connects" if labels["event"] == "tcp_connect" else "tls_handshakes"] += value
+    for entry in stats.values():
+        requests = entry["requests"]
+        entry["reuse_ratio"] = (requests - entry["tcp_connects"]) / requests if requests else 0.0
+    return stats
+
+
+def invoke_llm(llm: ChatOpenAI, messages: Sequence[BaseMessage], call_site: str) -> Any:
+    """
+    调用 LLM 并记录指标（耗时、token 用量、错误类型）。
+
+    所有 llm.invoke 调用点都应通过此函数，call_site 用于区分调用来源。
+    """
+    start = time.perf_counter()
+    try:
+        response = llm.invoke(list(messages))
+    except Exception as exc:
+        record_llm_call(call_site, time.perf_counter() - start, error=exc)
+        raise
+    record_llm_call(call_site, time.perf_counter() - start, response=response)
+    return response
+
 
+__all__ = ["get_default_llm", "get_http_clients", "get_http_connection_stats", "get_llm", "invoke_llm"]
@@ -0,0 +1,272 @@
+"""
+运行时指标采集
+
+- LLM 调用：按调用点记录耗时直方图、token 用量、估算费用与错误类型
+- 缓存命中 / 未命中、规则兜底次数
+- 文本提取等处理阶段耗时
+- HTTP 路由耗时
+
+所有指标保存在进程内，以 Prometheus 文本格式（0.0.4）导出，供 /metrics 接口使用。
+多 worker 部署时每个进程各自导出，由 Prometheus 按实例聚合。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from .config import llm_completion_price_per_1k, llm_prompt_price_per_1k
+except ImportError:  # pragma: no cover
+    from config import llm_completion_price_per_1k, llm_prompt_price_per_1k
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# LLM 调用通常在秒级，HTTP/阶段耗时跨度更大
+LLM_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key)
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, labels: Dict[str, str], amount: float = 1.0) -> None:
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class _Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [每个桶的计数..., 总和, 总数]
+        self.values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, labels: Dict[str, str], value: float) -> None:
+        key = _label_key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = [0.0] * (len(self.buckets) + 2)
+            self.values[key] = state
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, state in sorted(self.values.items()):
+            for i, bound in enumerate(self.buckets):
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {_format_value(state[i])}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {_format_value(state[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """线程安全的进程内指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {}
+
+    def counter(self, name: str, help_text: str) -> _Counter:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = _Counter(name, help_text)
+                self._metrics[name] = metric
+            return metric
+
+    def histogram(
+        self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS
+    ) -> _Histogram:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = _Histogram(name, help_text, buckets)
+                self._metrics[name] = metric
+            return metric
+
+    def inc(self, counter: _Counter, labels: Dict[str, str], amount: float = 1.0) -> None:
+        with self._lock:
+            counter.inc(labels, amount)
+
+    def observe(self, histogram: _Histogram, labels: Dict[str, str], value: float) -> None:
+        with self._lock:
+            histogram.observe(labels, value)
+
+    def snapshot(self, metric: Any) -> Dict[LabelKey, Any]:
+        """返回某个指标当前值的拷贝"""
+        with self._lock:
+            return {key: (list(value) if isinstance(value, list) else value) for key, value in metric.values.items()}
+
+    def render(self) -> str:
+        with self._lock:
+            lines: List[str] = []
+            for name in sorted(self._metrics):
+                lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """清空所有指标（测试用）"""
+        with self._lock:
+            for metric in self._metrics.values():
+                metric.values.clear()
+
+
+registry = MetricsRegistry()
+
+_llm_latency = registry.histogram(
+    "llm_request_duration_seconds", "LLM 调用耗时（按调用点）", LLM_LATENCY_BUCKETS
+)
+_llm_requests = registry.counter("llm_requests_total", "LLM 调用次数（按调用点与结果）")
+_llm_errors = registry.counter("llm_errors_total", "LLM 调用异常次数（按调用点与异常类型）")
+_llm_tokens = registry.counter("llm_tokens_total", "LLM token 用量（按调用点与 prompt/completion）")
+_llm_cost = registry.counter("llm_cost_total", "按配置单价估算的 LLM 费用")
+_cache_requests = registry.counter("cache_requests_total", "缓存查询次数（按缓存名与命中结果）")
+_fallbacks = registry.counter("heuristic_fallbacks_total", "LLM 不可用时走规则兜底的次数")
+_stage_latency = registry.histogram("stage_duration_seconds", "处理阶段耗时（文本提取、OCR 等）")
+_http_latency = registry.histogram("http_request_duration_seconds", "HTTP 请求耗时（按路由模板）")
+_http_requests = registry.counter("http_requests_total", "HTTP 请求次数（按路由模板与状态码）")
+
+
+def _extract_token_usage(response: Any) -> Tuple[int, int]:
+    """从 LangChain 响应中读取 prompt/completion token 数"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens")
+    completion_tokens = usage.get("output_tokens")
+    if prompt_tokens is None or completion_tokens is None:
+        metadata = getattr(response, "response_metadata", None) or {}
+        token_usage = metadata.get("token_usage") or metadata.get("usage") or {}
+        prompt_tokens = token_usage.get("prompt_tokens", prompt_tokens)
+        completion_tokens = token_usage.get("completion_tokens", completion_tokens)
+    return int(prompt_tokens or 0), int(completion_tokens or 0)
+
+
+def record_llm_call(
+    call_site: str,
+    seconds: float,
+    response: Any = None,
+    error: Optional[BaseException] = None,
+) -> None:
+    """记录一次 LLM 调用的耗时、token 用量、费用与错误"""
+    labels = {"call_site": call_site}
+    registry.observe(_llm_latency, labels, seconds)
+    if error is not None:
+        registry.inc(_llm_requests, {**labels, "outcome": "error"})
+        registry.inc(_llm_errors, {**labels, "error": type(error).__name__})
+        return
+
+    registry.inc(_llm_requests, {**labels, "outcome": "success"})
+    prompt_tokens, completion_tokens = _extract_token_usage(response)
+    if prompt_tokens:
+        registry.inc(_llm_tokens, {**labels, "kind": "prompt"}, prompt_tokens)
+    if completion_tokens:
+        registry.inc(_llm_tokens, {**labels, "kind": "completion"}, completion_tokens)
+    cost = (
+        prompt_tokens / 1000.0 * llm_prompt_price_per_1k
+        + completion_tokens / 1000.0 * llm_completion_price_per_1k
+    )
+    if cost:
+        registry.inc(_llm_cost, labels, cost)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """记录一次缓存查询结果"""
+    registry.inc(_cache_requests, {"cache": cache, "result": "hit" if hit else "miss"})
+
+
+def record_fallback(call_site: str, reason: str) -> None:
+    """记录一次规则兜底"""
+    registry.inc(_fallbacks, {"call_site": call_site, "reason": reason})
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    """统计一个处理阶段的耗时（异常同样计入）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(_stage_latency, {"stage": stage}, time.perf_counter() - start)
+
+
+async def http_metrics_middleware(request, call_next):
+    """
+    FastAPI/Starlette HTTP 中间件：按路由模板记录请求耗时。
+
+    使用路由模板（如 /notes/{note_id}）而不是原始路径作为标签，避免标签基数爆炸。
+    """
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", None) or "<unmatched>"
+        labels = {"method": request.method, "route": route_path}
+        registry.observe(_http_latency, labels, time.perf_counter() - start)
+        registry.inc(_http_requests, {**labels, "status": str(status_code)})
+
+
+def render_metrics() -> str:
+    """以 Prometheus 文本格式导出全部指标"""
+    return registry.render()
+
+
+__all__ = [
+    "PROMETHEUS_CONTENT_TYPE",
+    "http_metrics_middleware",
+    "record_cache",
+    "record_fallback",
+    "record_llm_call",
+    "registry",
+    "render_metrics",
+    "time_stage",
+]
@@ -5,7 +5,7 @@
 
 import asyncio
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
 from uuid import uuid4
 
@@ -65,6 +65,52 @@ async def migrate_sqlite_to_postgresql():
             )
         
         print(f"迁移了 {len(cards)} 条闪词卡片记录")
+
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = {row['name'] for row in cursor.fetchall()}
+
+        # 迁移review_schedule表（旧版本 SQLite 可能没有该表）
+        if "review_schedule" in tables:
+            print("开始迁移review_schedule表...")
+            cursor.execute("SELECT * FROM review_schedule")
+            schedules = cursor.fetchall()
+            for schedule in schedules:
+                await pg_conn.execute(
+                    """
+                    INSERT INTO review_schedule (id, card_id, next_review_at, review_count)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (card_id) DO NOTHING
+                    """,
+                    schedule['id'], schedule['card_id'],
+                    datetime.fromisoformat(schedule['next_review_at']), schedule['review_count']
+                )
+            print(f"迁移了 {len(schedules)} 条复习计划记录")
+
+        # 迁移learning_history表：先创建历史数据涉及的每个月份分区
+        if "learning_history" in tables:
+            print("开始迁移learning_history表...")
+            cursor.execute("SELECT * FROM learning_history")
+            histories = cursor.fetchall()
+            studied = [datetime.fromisoformat(history['studied_at']) for history in histories]
+            # 分区按 UTC 月份划分；没有时区的时间与写入时一样按 UTC 处理，每个月份取一条记录的时间创建分区
+            months = {}
+            for ts in studied:
+                utc = ts.astimezone(timezone.utc) if ts.tzinfo else ts
+                months.setdefault((utc.year, utc.month), ts)
+            for _, ts in sorted(months.items()):
+                await pg_conn.execute("SELECT ensure_learning_history_partition($1)", ts)
+            for history, studied_at in zip(histories, studied):
+                await pg_conn.execute(
+                    """
+                    INSERT INTO learning_history
+                    (id, card_id, note_id, status, duration_seconds, studied_at)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                    ON CONFLICT (id, studied_at) DO NOTHING
+                    """,
+                    history['id'], history['card_id'], history['note_id'],
+                    history['status'], history['duration_seconds'], studied_at
+                )
+            print(f"迁移了 {len(histories)} 条学习历史记录")
         
         sqlite_conn.close()
         print("数据迁移完成！")
@@ -9,14 +9,26 @@ from __future__ import annotations
 import json
 import re
 from collections import Counter
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
 
+import numpy as np
 from langchain_core.messages import HumanMessage, SystemMessage
 
 try:
-    from .llm import get_default_llm
+    from .config import note_terms_chunk_chars
+    from .corpus_index import get_corpus_index
+    from .llm import get_default_llm, invoke_llm
+    from .metrics import record_fallback
+    from .term_matcher import hash_spans
+    from .word_segmenter import KIND_BASE, KIND_TERM, get_segmenter
 except ImportError:  # pragma: no cover
-    from llm import get_default_llm
+    from config import note_terms_chunk_chars
+    from corpus_index import get_corpus_index
+    from llm import get_default_llm, invoke_llm
+    from metrics import record_fallback
+    from term_matcher import hash_spans
+    from word_segmenter import KIND_BASE, KIND_TERM, get_segmenter
 
 
 NOTE_TERMS_SYSTEM_PROMPT = """你是一位学习助理。你会收到一段用户笔记，请从中提取“最值得学习/记忆”的核心词语或概念，输出一个去重后的列表。
@@ -33,6 +45,32 @@ NOTE_TERMS_SYSTEM_PROMPT = """你是一位学习助理。你会收到一段用
 
 
 _JSON_BLOCK_RE = re.compile(r"```json\s*(\{.*?\})\s*```", re.DOTALL | re.IGNORECASE)
+# 英文/数字/下划线 token
+_ENGLISH_TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z0-9_\-]{1,30}")
+
+_ENGLISH_STOPWORDS = frozenset(
+    {
+        "the", "and", "or", "to", "of", "in", "on", "for", "with", "is",
+        "are", "was", "were", "be", "this", "that", "it", "as", "by", "from",
+    }
+)
+_CHINESE_STOPWORDS = frozenset(
+    {
+        "我们", "你们", "他们", "这个", "那个", "这些", "那些", "然后", "因此", "所以",
+        "因为", "但是", "如果", "就是", "以及", "可以", "进行", "一个", "一种", "是否",
+        "本身", "同时", "通过", "问题", "方法", "结果",
+    }
+)
+
+# 提示词中最多列出的已学词条数
+_MAX_KNOWN_IN_PROMPT = 50
+
+# 长文本分块抽取时同时进行的 LLM 调用数
+_MAX_CHUNK_CALLS = 4
+
+# BM25 参数
+_BM25_K1 = 1.2
+_BM25_B = 0.75
 
 
 def _extract_json(text: str) -> Optional[str]:
@@ -51,120 +89,146 @@ def _extract_json(text: str) -> Optional[str]:
     return None
 
 
+def _count_candidates(text: str) -> Tuple[Counter, set[str]]:
+    """
+    统计候选词出现次数，并给出其中属于词典学习术语的词。
+
+    英文由预编译的正则一次扫描得到；中文由分词器对全文做一次向量化切分，
+    候选过滤与去重计数都在 numpy 数组上完成，Python 层只处理不重复的词。
+    """
+    counts: Counter = Counter()
+    for token, freq in Counter(_ENGLISH_TOKEN_RE.findall(text)).items():
+        if len(token) > 2 and token.lower() not in _ENGLISH_STOPWORDS:
+            counts[token] = freq
+
+    # 中文按词典分词：基础词（常用词、虚词）不作为候选，单字与过长的未登录片段也跳过
+    starts, lengths, kinds = get_segmenter().segment_spans(text)
+    keep = (lengths >= 2) & (kinds != KIND_BASE) & ((kinds == KIND_TERM) | (lengths <= 8))
+    starts, kinds = starts[keep], kinds[keep]
+    ends = starts + lengths[keep]
+    _, first, freqs = np.unique(hash_spans(text, starts, ends), return_index=True, return_counts=True)
+    known_terms: set[str] = set()
+    for i, freq in zip(first.tolist(), freqs.tolist()):
+        token = text[starts[i] : ends[i]]
+        if token in _CHINESE_STOPWORDS:
+            continue
+        counts[token] = freq
+        if kinds[i] == KIND_TERM:
+            known_terms.add(token)
+    return counts, known_terms
+
+
+def _candidate_terms(text: str) -> List[str]:
+    """候选词（含重复），用于语料索引"""
+    return list(_count_candidates(text)[0].elements())
+
+
+def _index_key(term: str) -> str:
+    """语料索引中的词：英文不区分大小写"""
+    return term.lower() if term.isascii() else term
+
+
+def index_note(note_id: str, note_text: str) -> None:
+    """新建/修改笔记后更新语料索引"""
+    terms = _candidate_terms(note_text.strip())
+    get_corpus_index().set_note(note_id, [_index_key(t) for t in terms])
+
+
+def unindex_note(note_id: str) -> None:
+    """删除笔记后更新语料索引"""
+    get_corpus_index().remove_note(note_id)
+
+
+def ensure_corpus_index(load_notes: Callable[[], Iterable[Tuple[str, str]]]) -> None:
+    """
+    服务启动时调用：磁盘上没有索引时，用全部笔记 (note_id, content) 重建。
+    """
+    index = get_corpus_index()
+    if index.loaded:
+        return
+    index.rebuild(
+        {
+            note_id: [_index_key(t) for t in _candidate_terms(content.strip())]
+            for note_id, content in load_notes()
+        }
+    )
+    print(f"[CorpusIndex] 已用 {index.note_count} 篇笔记重建语料索引")
+
+
 def _heuristic_extract_terms(note_text: str, max_terms: int = 30) -> List[str]:
     text = note_text.strip()
     if not text:
         return []
 
-    # 英文/数字/下划线 token
-    english_tokens = re.findall(r"[A-Za-z][A-Za-z0-9_\-]{1,30}", text)
-    # 中文连续 token（不做分词，先取 2-8 字）
-    chinese_tokens = re.findall(r"[\u4e00-\u9fff]{2,8}", text)
-
-    english_stop = {
-        "the",
-        "and",
-        "or",
-        "to",
-        "of",
-        "in",
-        "on",
-        "for",
-        "with",
-        "is",
-        "are",
-        "was",
-        "were",
-        "be",
-        "this",
-        "that",
-        "it",
-        "as",
-        "by",
-        "from",
-    }
-    chinese_stop = {
-        "我们",
-        "你们",
-        "他们",
-        "这个",
-        "那个",
-        "这些",
-        "那些",
-        "然后",
-        "因此",
-        "所以",
-        "因为",
-        "但是",
-        "如果",
-        "就是",
-        "以及",
-        "可以",
-        "进行",
-        "一个",
-        "一种",
-        "是否",
-        "本身",
-        "同时",
-        "通过",
-        "问题",
-        "方法",
-        "结果",
-    }
-
-    normalized: List[str] = []
-    for t in english_tokens:
-        low = t.lower()
-        if low in english_stop:
-            continue
-        if len(t) <= 2:
-            continue
-        normalized.append(t)
-    for t in chinese_tokens:
-        if t in chinese_stop:
-            continue
-        normalized.append(t)
-
-    if not normalized:
+    counts, known_terms = _count_candidates(text)
+    if not counts:
         return []
 
-    counts = Counter(normalized)
+    index = get_corpus_index()
+    doc_len = sum(counts.values())
+    avg_len = index.average_length or doc_len
+    # BM25 篇幅归一化项对同一篇笔记是常数
+    norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * doc_len / avg_len)
+    use_idf = index.note_count > 0
 
-    def score(term: str) -> float:
-        freq = counts[term]
-        length_bonus = min(len(term), 12) / 12.0
+    scored = []
+    for term, freq in counts.items():
+        # 候选词要么是纯 ASCII 的英文 token，要么是中文分词结果
+        is_english = term.isascii()
+        key = term.lower() if is_english else term
+        # BM25：词频饱和 + 篇幅归一化；逆文档频率压低在大多数笔记中都出现的泛用词
+        score = freq * (_BM25_K1 + 1) / (freq + norm)
+        if use_idf:
+            score *= index.idf(key)
+        score *= 1.0 + min(len(term), 12) / 12.0
         # 偏好中文与含大写的缩写/专有名词
-        is_chinese = bool(re.search(r"[\u4e00-\u9fff]", term))
-        has_upper = any(ch.isupper() for ch in term)
-        type_bonus = (0.25 if is_chinese else 0.0) + (0.15 if has_upper else 0.0)
-        return freq * (1.0 + length_bonus) + type_bonus
-
-    sorted_terms = sorted(counts.keys(), key=score, reverse=True)
+        if is_english:
+            if key != term:
+                score += 0.15
+        else:
+            score += 0.25
+            # 词典中已有的学习术语（预设词库、闪词卡片）优先
+            if term in known_terms:
+                score += 0.5
+        scored.append((score, term, key))
+    scored.sort(key=lambda item: item[0], reverse=True)
 
     # 去重（英文不区分大小写）
     out: List[str] = []
     seen_lower: set[str] = set()
-    for t in sorted_terms:
-        key = t.lower() if re.fullmatch(r"[A-Za-z0-9_\-]+", t) else t
+    for _, term, key in scored:
         if key in seen_lower:
             continue
         seen_lower.add(key)
-        out.append(t)
+        out.append(term)
         if len(out) >= max_terms:
             break
     return out
 
 
-def extract_terms_from_note(note_text: str, max_terms: int = 30) -> List[str]:
+def preview_terms_from_note(note_text: str, max_terms: int = 30) -> List[str]:
+    """只用规则抽取的初步词语（不调用 LLM），用于长文档还在提取时先给出预览"""
+    return _heuristic_extract_terms(note_text, max_terms=max_terms)
+
+
+def extract_terms_from_note(
+    note_text: str,
+    max_terms: int = 30,
+    known_terms: Optional[Iterable[str]] = None,
+) -> List[str]:
     """
     从笔记内容中抽取待学习词语。
 
     - LLM 可用：用 LLM 抽取更贴近“学习重点”的词语
     - LLM 不可用：使用规则兜底抽取
+
+    known_terms 为笔记中出现的、用户已经有闪词卡片的词条：不再让 LLM 重复抽取，结果中也会剔除。
     """
     text = note_text.strip()
     if not text:
         return []
+    known = [t for t in (known_terms or ()) if t]
+    skip = set(known)
 
     # 1) 先尝试 LLM
     try:
@@ -176,10 +240,15 @@ def extract_terms_from_note(note_text: str, max_terms: int = 30) -> List[str]:
                     f"请从下面笔记中提取核心词语/概念。\n\n"
                     f"笔记：\n{text}\n\n"
                     f"最多返回 {max_terms} 个词语。"
+                    + (
+                        f"\n\n以下词语用户已经学过，不要输出：{'、'.join(known[:_MAX_KNOWN_IN_PROMPT])}"
+                        if known
+                        else ""
+                    )
                 )
             ),
         ]
-        response = llm.invoke(messages)
+        response = invoke_llm(llm, messages, call_site="note_terms")
         content = str(getattr(response, "content", "")).strip()
         json_str = _extract_json(content)
         if json_str:
@@ -191,7 +260,7 @@ def extract_terms_from_note(note_text: str, max_terms: int = 30) -> List[str]:
                 uniq: List[str] = []
                 seen: set[str] = set()
                 for t in terms:
-                    if t in seen:
+                    if t in seen or t in skip:
                         continue
                     seen.add(t)
                     uniq.append(t)
@@ -199,14 +268,80 @@ def extract_terms_from_note(note_text: str, max_terms: int = 30) -> List[str]:
                         break
                 if uniq:
                     return uniq
+        record_fallback("note_terms", reason="empty_result")
     except Exception:
         # 任何 LLM 错误都直接走兜底，不影响服务可用性
-        pass
+        record_fallback("note_terms", reason="llm_error")
 
     # 2) 规则兜底
-    return _heuristic_extract_terms(text, max_terms=max_terms)
+    if not skip:
+        return _heuristic_extract_terms(text, max_terms=max_terms)
+    terms = _heuristic_extract_terms(text, max_terms=max_terms + len(skip))
+    return [t for t in terms if t not in skip][:max_terms]
+
+
+def split_note_chunks(note_text: str, chunk_chars: int) -> List[str]:
+    """按段落把长文本切成不超过 chunk_chars 个字符的块；单个段落过长时硬切"""
+    text = note_text.strip()
+    if chunk_chars <= 0 or len(text) <= chunk_chars:
+        return [text] if text else []
+    chunks: List[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + 2 + len(paragraph) <= chunk_chars:
+            current += "\n\n" + paragraph
+            continue
+        if current:
+            chunks.append(current)
+        while len(paragraph) > chunk_chars:
+            chunks.append(paragraph[:chunk_chars])
+            paragraph = paragraph[chunk_chars:]
+        current = paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def extract_terms_from_long_note(
+    note_text: str,
+    max_terms: int = 30,
+    known_terms: Optional[Iterable[str]] = None,
+    chunk_chars: Optional[int] = None,
+) -> List[str]:
+    """
+    长文本（例如批量上传的多份讲义拼接而成）分块抽取词语后合并。
+
+    不超过 NOTE_TERMS_CHUNK_CHARS 时与 extract_terms_from_note 相同；否则各块分别抽取
+    （并发调用 LLM），按各块中的排名累计得分（排名越靠前得分越高，多个块都出现的词优先）取前 max_terms 个。
+    """
+    chunk_chars = note_terms_chunk_chars if chunk_chars is None else chunk_chars
+    chunks = split_note_chunks(note_text, chunk_chars)
+    if len(chunks) <= 1:
+        return extract_terms_from_note(note_text, max_terms, known_terms)
+
+    known = list(known_terms or ())
+    with ThreadPoolExecutor(max_workers=min(_MAX_CHUNK_CALLS, len(chunks))) as executor:
+        results = list(executor.map(lambda chunk: extract_terms_from_note(chunk, max_terms, known), chunks))
+
+    scores: dict[str, float] = {}
+    for terms in results:
+        for rank, term in enumerate(terms):
+            scores[term] = scores.get(term, 0.0) + 1.0 - rank / max(len(terms), 1)
+    # 同分时保持首次出现的顺序（sorted 是稳定排序）
+    return sorted(scores, key=lambda term: scores[term], reverse=True)[:max_terms]
 
 
-__all__ = ["extract_terms_from_note"]
+__all__ = [
+    "ensure_corpus_index",
+    "extract_terms_from_long_note",
+    "extract_terms_from_note",
+    "index_note",
+    "preview_terms_from_note",
+    "split_note_chunks",
+    "unindex_note",
+]
 
 
@@ -0,0 +1,201 @@
+"""
+OCR 工作进程池
+
+EasyOCR 模型加载需要数秒到十余秒，原先在第一次识别图片时才在进程内创建全局 Reader，
+第一个用户要等模型加载；多个线程共用同一个 Reader，识别实际上是串行的。
+
+这里改为专用的进程池：
+- 每个工作进程启动时加载一次 OCR 模型（EasyOCR Reader 或检查 Tesseract），之后的任务直接识别
+- 应用启动时可在后台预先拉起全部工作进程（OCR_WARMUP），第一个请求不再等待模型加载
+- 提交数量受 OCR_QUEUE_SIZE 限制，队列满时提交方阻塞等待
+- 单个任务超时（OCR_JOB_TIMEOUT_SECONDS）从工作进程开始执行时计时，排队等待的时间不计入；
+  超时后放弃该任务，只替换卡住的工作进程（见 process_pool）
+- 调用方的 OCR 时长预算（EXTRACT_MAX_OCR_SECONDS）用完时只是不再等待，任务继续在后台执行，
+  不替换工作进程；识别完成后结果交给调用方的回调（例如写入缓存）
+- 每个进程处理 OCR_MAX_JOBS_PER_WORKER 个任务后替换为新进程，回收累积的内存
+
+OCR_WORKERS=0 时不使用进程池，在调用方进程内识别。
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Any, Callable, Optional
+
+try:
+    from .config import ocr_job_timeout, ocr_max_jobs_per_worker, ocr_queue_size, ocr_workers
+    from .process_pool import WatchedProcessPool
+except ImportError:  # pragma: no cover
+    from config import ocr_job_timeout, ocr_max_jobs_per_worker, ocr_queue_size, ocr_workers
+    from process_pool import WatchedProcessPool
+
+
+def _init_worker() -> None:
+    """工作进程启动时加载 OCR 模型"""
+    try:
+        from .file_text_extractor import _load_ocr_backend
+    except ImportError:  # pragma: no cover
+        from file_text_extractor import _load_ocr_backend
+    try:
+        _load_ocr_backend()
+    except Exception as exc:  # noqa: BLE001
+        # 模型加载失败时进程照常工作，具体任务会报告错误
+        print(f"[OCR] 工作进程 {os.getpid()} 加载 OCR 模型失败: {exc}")
+
+
+class OcrBudgetExceeded(Exception):
+    """等待超过调用方的时长预算；任务没有放弃，继续在后台执行"""
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+_pool: Optional[WatchedProcessPool] = None
+_pool_lock = threading.Lock()
+
+
+def ocr_pool_enabled() -> bool:
+    return ocr_workers > 0
+
+
+def get_ocr_pool() -> WatchedProcessPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 服务进程里有其他线程，不用 fork；max_tasks_per_child 也要求非 fork 启动方式
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _pool = WatchedProcessPool(
+                ocr_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                max_tasks_per_child=ocr_max_jobs_per_worker or None,
+                # 正在运行与排队的任务数上限
+                max_pending=max(1, ocr_workers) + max(0, ocr_queue_size),
+                name="OCR",
+            )
+        return _pool
+
+
+def shutdown_ocr_pool() -> None:
+    """应用关闭时释放工作进程"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def submit_ocr_job(fn: Callable[..., Any], *args: Any) -> Future:
+    """
+    把任务提交到 OCR 进程池；fn 需为模块级函数。
+
+    Raises:
+        TimeoutError: 队列已满，且在单任务超时时间内没有空位
+    """
+    try:
+        return get_ocr_pool().submit(fn, *args, slot_timeout=ocr_job_timeout if ocr_job_timeout > 0 else None)
+    except TimeoutError:
+        raise TimeoutError("OCR 任务排队超时，请稍后重试") from None
+
+
+def _finish_in_background(
+    pool: WatchedProcessPool, future: Future, timeout: float, on_late: Optional[Callable[[Any], None]]
+) -> None:
+    """调用方不再等待的任务：仍按单任务超时放弃卡住的任务，完成后把结果交给 on_late"""
+
+    def finish():
+        try:
+            result = pool.result(future, timeout=timeout)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[OCR] 超出时长预算的任务未完成: {exc or type(exc).__name__}")
+            return
+        if on_late is not None:
+            on_late(result)
+
+    threading.Thread(target=finish, name="ocr-late", daemon=True).start()
+
+
+def run_ocr_job(
+    fn: Callable[..., Any],
+    *args: Any,
+    timeout: Optional[float] = None,
+    budget: Optional[float] = None,
+    on_late: Optional[Callable[[Any], None]] = None,
+) -> Any:
+    """
+    在 OCR 进程池中执行任务并等待结果。
+
+    Args:
+        timeout: 从任务开始执行时计时，排在其他任务后面等待的时间不计入
+        budget: 调用方最多等待的秒数（从提交时计时），为 None 或 0 时不限
+        on_late: 超出 budget 的任务在后台完成后，以结果调用
+
+    Raises:
+        TimeoutError: 任务超时（此时放弃该任务，只替换卡住的工作进程）
+        OcrBudgetExceeded: 超出 budget 仍未完成（任务继续在后台执行）
+    """
+    timeout = ocr_job_timeout if timeout is None else timeout
+    pool = get_ocr_pool()
+    future = submit_ocr_job(fn, *args)
+    try:
+        if budget:
+            try:
+                return future.result(timeout=budget)
+            except FuturesTimeoutError:
+                if future.done():
+                    raise
+            started = pool.started_at(future)
+            if timeout <= 0 or started is None or time.monotonic() - started < timeout:
+                print(f"[OCR] 超过时长预算 {budget:.0f}s，任务在后台继续执行")
+                _finish_in_background(pool, future, timeout, on_late)
+                raise OcrBudgetExceeded(f"OCR 超过时长预算（{budget:.0f}s）")
+        return pool.result(future, timeout=timeout)
+    except FuturesTimeoutError:
+        if future.done():
+            raise
+        print(f"[OCR] 任务开始后超过 {timeout:.0f}s 未完成，已放弃")
+        raise TimeoutError(f"OCR 识别超时（{timeout:.0f}s）") from None
+
+
+def warmup_ocr_pool(background: bool = True) -> Optional[threading.Thread]:
+    """
+    预先启动全部工作进程并加载模型。
+
+    每次提交在没有空闲进程时都会新建进程，同时提交 OCR_WORKERS 个空任务即可拉起全部进程；
+    初始化（加载模型）完成后空任务才会返回。
+    """
+    if not ocr_pool_enabled():
+        return None
+
+    def warmup():
+        try:
+            pool = get_ocr_pool()
+            pids = {f.result() for f in [pool.submit(_ping) for _ in range(ocr_workers)]}
+            print(f"[OCR] 工作进程已就绪: {len(pids)} 个")
+        except Exception as exc:  # noqa: BLE001
+            print(f"[OCR] 工作进程预热失败: {exc}")
+
+    if not background:
+        warmup()
+        return None
+    thread = threading.Thread(target=warmup, name="ocr-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+__all__ = [
+    "OcrBudgetExceeded",
+    "get_ocr_pool",
+    "ocr_pool_enabled",
+    "run_ocr_job",
+    "shutdown_ocr_pool",
+    "submit_ocr_job",
+    "warmup_ocr_pool",
+]
@@ -0,0 +1,169 @@
+"""
+OCR 前的自适应图片预处理
+
+原先对每张图片都在原始分辨率上做 CLAHE 和 cv2.fastNlMeansDenoising（非常慢），
+清晰的 4000×3000 手机截图两者都不需要。这里先缩放、再按图片质量决定做哪些处理：
+
+1. 灰度化
+2. 缩放：在缩略图上二值化、统计连通域高度估计文字高度，把图片缩小到文字高度约为
+   OCR_TARGET_TEXT_HEIGHT 像素（只缩小不放大）；之后的步骤都在缩小后的图上进行
+3. 质量估计（均为一次卷积或分位数计算）：
+   - 噪声：Immerkær 快速噪声估计，超过阈值才做非局部均值去噪
+   - 模糊：拉普拉斯方差，过低时做反锐化掩模
+   - 对比度：1%~99% 分位灰度范围，过窄时做 CLAHE
+4. 分块：缩放后仍然很长的图片（长截图）按高度切成有重叠的等尺寸块，
+   便于 EasyOCR readtext_batched 批量推理；识别结果按块顺序合并，去掉重叠处重复的行
+"""
+
+from __future__ import annotations
+
+import math
+from typing import List, Optional
+
+import numpy as np
+
+try:
+    from .config import ocr_target_text_height
+except ImportError:  # pragma: no cover
+    from config import ocr_target_text_height
+
+
+# 估计文字高度所用缩略图的长边
+_THUMB_SIDE = 1024
+# 估计不出文字高度时长边的上限
+_MAX_SIDE = 4096
+# 噪声标准差超过该值才去噪
+_NOISE_SIGMA_THRESHOLD = 8.0
+# 拉普拉斯方差低于该值视为模糊
+_BLUR_VARIANCE_THRESHOLD = 50.0
+# 1%~99% 分位灰度范围低于该值视为低对比度
+_LOW_CONTRAST_RANGE = 100.0
+# 分块：块高度与重叠高度
+TILE_HEIGHT = 2048
+TILE_OVERLAP = 128
+
+_NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+
+def estimate_text_height(gray: np.ndarray) -> Optional[float]:
+    """估计文字高度（像素）；连通域太少（不像文字）时返回 None"""
+    import cv2
+
+    h, w = gray.shape
+    scale = min(1.0, _THUMB_SIDE / max(h, w))
+    thumb = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    _, binary = cv2.threshold(thumb, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    # 深色背景、浅色文字时反转
+    if cv2.countNonZero(binary) > binary.size // 2:
+        binary = cv2.bitwise_not(binary)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    plausible = (heights >= 3) & (heights < thumb.shape[0] / 4) & (widths < thumb.shape[1] / 4)
+    if plausible.sum() < 10:
+        return None
+    # 汉字常被拆成几个笔画连通域，取偏上的分位数
+    return float(np.percentile(heights[plausible], 75)) / scale
+
+
+def estimate_noise(gray: np.ndarray) -> float:
+    """Immerkær 快速噪声估计（高斯噪声标准差）"""
+    import cv2
+
+    h, w = gray.shape
+    if h < 3 or w < 3:
+        return 0.0
+    response = cv2.filter2D(gray.astype(np.float32), -1, _NOISE_KERNEL)
+    return float(np.abs(response[1:-1, 1:-1]).sum() * math.sqrt(math.pi / 2) / (6 * (w - 2) * (h - 2)))
+
+
+def estimate_blur(gray: np.ndarray) -> float:
+    """拉普拉斯方差，越小越模糊"""
+    import cv2
+
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def preprocess_for_ocr(img: np.ndarray, steps: Optional[List[str]] = None) -> np.ndarray:
+    """
+    自适应预处理，返回灰度图。
+
+    Args:
+        steps: 传入列表时记录实际执行的步骤（缩放、去噪、锐化、CLAHE），用于日志与测试
+    """
+    import cv2
+
+    steps = steps if steps is not None else []
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+    h, w = gray.shape
+    text_height = estimate_text_height(gray)
+    if text_height is not None:
+        scale = ocr_target_text_height / text_height
+    else:
+        scale = _MAX_SIDE / max(h, w)
+    if scale < 0.9:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        steps.append(f"resize:{scale:.2f}")
+
+    sigma = estimate_noise(gray)
+    if sigma > _NOISE_SIGMA_THRESHOLD:
+        gray = cv2.fastNlMeansDenoising(
+            gray, None, h=min(30.0, 1.2 * sigma), templateWindowSize=7, searchWindowSize=15
+        )
+        steps.append("denoise")
+    elif estimate_blur(gray) < _BLUR_VARIANCE_THRESHOLD:
+        blurred = cv2.GaussianBlur(gray, (0, 0), 2.0)
+        gray = cv2.addWeighted(gray, 1.5, blurred, -0.5, 0)
+        steps.append("sharpen")
+
+    low, high = np.percentile(gray[::4, ::4], (1, 99))
+    if high - low < _LOW_CONTRAST_RANGE:
+        gray = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+        steps.append("clahe")
+
+    return gray
+
+
+def tile_image(gray: np.ndarray, tile_height: int = TILE_HEIGHT, overlap: int = TILE_OVERLAP) -> List[np.ndarray]:
+    """
+    按高度切成有重叠的块；不超过一块时原样返回。
+    最后一块用白色补齐到相同尺寸，方便批量推理。
+    """
+    h = gray.shape[0]
+    if h <= tile_height:
+        return [gray]
+    step = tile_height - overlap
+    tiles = []
+    for top in range(0, h - overlap, step):
+        tile = gray[top : top + tile_height]
+        if tile.shape[0] < tile_height:
+            pad = np.full((tile_height - tile.shape[0],) + gray.shape[1:], 255, dtype=gray.dtype)
+            tile = np.vstack([tile, pad])
+        tiles.append(tile)
+    return tiles
+
+
+def merge_tile_texts(texts: List[str], max_overlap_lines: int = 3) -> str:
+    """按顺序合并各块的识别结果，去掉相邻块重叠区域重复识别出的行"""
+    lines: List[str] = []
+    for text in texts:
+        new_lines = [line for line in text.splitlines() if line.strip()]
+        for k in range(min(max_overlap_lines, len(lines), len(new_lines)), 0, -1):
+            if lines[-k:] == new_lines[:k]:
+                new_lines = new_lines[k:]
+                break
+        lines.extend(new_lines)
+    return "\n".join(lines)
+
+
+__all__ = [
+    "TILE_HEIGHT",
+    "TILE_OVERLAP",
+    "estimate_blur",
+    "estimate_noise",
+    "estimate_text_height",
+    "merge_tile_texts",
+    "preprocess_for_ocr",
+    "tile_image",
+]
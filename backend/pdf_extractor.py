@@ -0,0 +1,350 @@
+"""
+PDF 按页并行提取
+
+逐页提取文本（以及扫描页的 OCR）是 CPU 密集型操作，放在线程池里受 GIL 限制只能用满一个核。
+这里把页码切成若干分片交给工作进程池，各工作进程按文件路径自行打开文档
+（PyMuPDF 按需读取页面，不会把整份文件复制到每个进程），最后按页码顺序合并。
+
+- 页数不超过一个分片或 PDF_WORKERS=1 时在当前进程内顺序提取，省去进程间开销
+- 没有文本层的扫描页按 PDF_OCR_DPI 渲染为灰度位图，像素缓冲区直接交给 OCR，
+  每 OCR_BATCH_SIZE 页一个任务交给 OCR 工作进程池（见 ocr_pool）并行识别，
+  任务内同尺寸的页批量推理；页数少时减小每批页数，保证各工作进程都有任务
+- PDF_MAX_PAGES：最多提取的页数，超出部分忽略
+- EXTRACT_MAX_OCR_SECONDS：扫描页 OCR 的总时长预算，用完后不再识别剩余的扫描页
+- PDF_PAGE_TIMEOUT_SECONDS：单页超时。工作进程内用 SIGALRM 中断超时的页并跳过；
+  若卡在 C 扩展里无法中断，分片从开始执行起超过总时限（页数 + 1 页余量）后按超时处理，
+  只替换卡住的工作进程（见 process_pool），不影响其他请求的分片
+"""
+
+from __future__ import annotations
+
+import math
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from typing import Callable, Dict, Generator, Iterator, List, Optional, Tuple, Union
+
+try:
+    from .config import (
+        extract_max_ocr_seconds,
+        ocr_batch_size,
+        pdf_max_pages,
+        pdf_ocr_dpi,
+        pdf_page_timeout,
+        pdf_pages_per_shard,
+        pdf_workers,
+        upload_spool_dir,
+    )
+    from .metrics import record_cache
+    from .ocr_pool import get_ocr_pool, ocr_pool_enabled
+    from .process_pool import WatchedProcessPool
+except ImportError:  # pragma: no cover
+    from config import (
+        extract_max_ocr_seconds,
+        ocr_batch_size,
+        pdf_max_pages,
+        pdf_ocr_dpi,
+        pdf_page_timeout,
+        pdf_pages_per_shard,
+        pdf_workers,
+        upload_spool_dir,
+    )
+    from metrics import record_cache
+    from ocr_pool import get_ocr_pool, ocr_pool_enabled
+    from process_pool import WatchedProcessPool
+
+
+# (页码, 文本, 是否命中页面 OCR 缓存)；超时的页文本为 None，没有查缓存时命中结果为 None
+PageText = Tuple[int, Optional[str], Optional[bool]]
+
+
+class _PageTimeout(BaseException):
+    """单页超时（继承 BaseException，避免被 OCR 代码里的 except Exception 吞掉）"""
+
+
+@contextmanager
+def _page_alarm(seconds: float):
+    """在主线程中为单页设置定时中断；其他线程或不支持 SIGALRM 的平台上不限时"""
+    if (
+        seconds <= 0
+        or not hasattr(signal, "SIGALRM")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise _PageTimeout()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _open_document(source):
+    import fitz
+
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(os.fspath(source), filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _process_pages(doc, page_nums: List[int], mode: str, dpi: int, page_timeout: float) -> List[PageText]:
+    """
+    mode="text" 逐页读取文本层；mode="ocr" 把这组页面渲染为位图后一起 OCR。
+    """
+    if mode == "ocr":
+        return _process_ocr_pages(doc, page_nums, dpi, page_timeout)
+    results: List[PageText] = []
+    for page_num in page_nums:
+        try:
+            with _page_alarm(page_timeout):
+                text = doc[page_num].get_text() or ""
+        except _PageTimeout:
+            print(f"[PDF] 第 {page_num + 1} 页提取超时，已跳过")
+            text = None
+        results.append((page_num, text, None))
+    return results
+
+
+def _process_ocr_pages(doc, page_nums: List[int], dpi: int, page_timeout: float) -> List[PageText]:
+    """一组扫描页批量 OCR；时限为单页超时乘以页数，超时时整组跳过"""
+    try:
+        from .file_text_extractor import _ocr_pdf_pages
+    except ImportError:  # pragma: no cover
+        from file_text_extractor import _ocr_pdf_pages
+    try:
+        with _page_alarm(page_timeout * len(page_nums)):
+            ocr = _ocr_pdf_pages([doc[page_num] for page_num in page_nums], page_nums, dpi)
+    except _PageTimeout:
+        print(f"[PDF] 第 {', '.join(str(n + 1) for n in page_nums)} 页OCR超时，已跳过")
+        return [(page_num, None, None) for page_num in page_nums]
+    return [(page_num, text, cache_hit) for page_num, (text, cache_hit) in zip(page_nums, ocr)]
+
+
+def _process_shard(path: str, page_nums: List[int], mode: str, dpi: int, page_timeout: float) -> List[PageText]:
+    """工作进程入口：打开文档并处理一组页"""
+    with _open_document(path) as doc:
+        return _process_pages(doc, page_nums, mode, dpi, page_timeout)
+
+
+# ---------- 进程池 ----------
+
+# 按工作进程数区分的进程池；正在使用的进程池不会因为其他请求指定了不同的进程数而被关闭
+_pools: Dict[int, WatchedProcessPool] = {}
+_pool_lock = threading.Lock()
+
+# 检查分片是否卡住的间隔（秒）
+_STALL_POLL_INTERVAL = 0.5
+
+
+def _get_pool(workers: int) -> WatchedProcessPool:
+    with _pool_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # 服务进程里有其他线程（事件循环、数据库连接池），不用 fork 直接复制进程
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+            pool = _pools[workers] = WatchedProcessPool(workers, mp_context=context, name="PDF")
+        return pool
+
+
+def shutdown_pdf_pool() -> None:
+    """应用关闭时释放工作进程"""
+    with _pool_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True)
+
+
+def _run_parallel(
+    pool: WatchedProcessPool,
+    path: str,
+    shards: List[List[int]],
+    mode: str,
+    dpi: int,
+    page_timeout: float,
+) -> Iterator[List[PageText]]:
+    """把分片交给进程池，按完成顺序产出各分片的结果"""
+    pending = {pool.submit(_process_shard, path, shard, mode, dpi, page_timeout): shard for shard in shards}
+    try:
+        while pending:
+            done, _ = wait(
+                pending,
+                timeout=_STALL_POLL_INTERVAL if page_timeout > 0 else None,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                del pending[future]
+                yield future.result()
+            if page_timeout <= 0:
+                continue
+            # 分片从开始执行起计时（排队时间不算），超时说明工作进程卡在无法中断的代码里
+            now = time.monotonic()
+            for future, shard in list(pending.items()):
+                started = pool.started_at(future)
+                if started is None or future.done() or now - started <= page_timeout * (len(shard) + 1):
+                    continue
+                print(f"[PDF] 第 {shard[0] + 1}-{shard[-1] + 1} 页提取超时，已跳过")
+                del pending[future]
+                pool.abandon(future)
+                # 未完成的页按超时处理
+                yield [(page_num, None, None) for page_num in shard]
+    finally:
+        # 调用方提前停止迭代时取消还没开始的分片
+        for future in pending:
+            future.cancel()
+
+
+def _ocr_shards(page_nums: List[int], workers: int) -> List[List[int]]:
+    """扫描页按 OCR_BATCH_SIZE 分批；页数少时减小每批页数，让每个工作进程都分到任务"""
+    if not page_nums:
+        return []
+    if ocr_pool_enabled():
+        parallelism = get_ocr_pool().max_workers
+    else:
+        parallelism = max(1, workers)
+    size = max(1, min(ocr_batch_size, math.ceil(len(page_nums) / parallelism)))
+    return [page_nums[start : start + size] for start in range(0, len(page_nums), size)]
+
+
+def iter_pdf_pages(
+    source: Union[bytes, bytearray, memoryview, str, "os.PathLike[str]"],
+    *,
+    workers: Optional[int] = None,
+    pages_per_shard: Optional[int] = None,
+    max_pages: Optional[int] = None,
+    page_timeout: Optional[float] = None,
+    ocr_dpi: Optional[int] = None,
+    max_ocr_seconds: Optional[float] = None,
+) -> Generator[Tuple[int, Optional[str], int], None, Tuple[Optional[str], int]]:
+    """
+    逐页产出 (页码, 文本, 要提取的页数)，顺序为完成顺序（并行时不一定按页码）。
+    没有内容的页文本为空字符串，超时被跳过的页为 None。
+    生成器的返回值为 (提前停止的原因, 文档总页数)，原因为 "max_pages"（页数超过上限）、
+    "max_ocr_seconds"（OCR 时长预算用完，剩余扫描页未产出）或 None。
+
+    先按分片读取各页文本层；没有文本层的页（扫描件）再渲染为位图分批做 OCR，
+    页数少的扫描讲义按工作进程数拆小批次，也能用满多个核。
+
+    Args:
+        source: PDF 文件路径或内容；需要并行时内容先写入临时文件供工作进程打开
+        workers / pages_per_shard / max_pages / page_timeout / ocr_dpi / max_ocr_seconds: 默认取自配置，
+            max_pages 与 max_ocr_seconds 为 0 时不限制
+    """
+    workers = pdf_workers if workers is None else workers
+    pages_per_shard = max(1, pdf_pages_per_shard if pages_per_shard is None else pages_per_shard)
+    max_pages = pdf_max_pages if max_pages is None else max_pages
+    page_timeout = pdf_page_timeout if page_timeout is None else page_timeout
+    ocr_dpi = pdf_ocr_dpi if ocr_dpi is None else ocr_dpi
+    max_ocr_seconds = extract_max_ocr_seconds if max_ocr_seconds is None else max_ocr_seconds
+
+    temp_path: Optional[str] = None
+
+    def shared_path() -> str:
+        nonlocal temp_path
+        if isinstance(source, (str, os.PathLike)):
+            return os.fspath(source)
+        if temp_path is None:
+            fd, temp_path = tempfile.mkstemp(prefix="pdf-", suffix=".pdf", dir=upload_spool_dir)
+            with os.fdopen(fd, "wb") as f:
+                f.write(source)
+        return temp_path
+
+    cutoff: Optional[str] = None
+    try:
+        with _open_document(source) as doc:
+            page_count = document_pages = doc.page_count
+            if max_pages and page_count > max_pages:
+                print(f"[PDF] 共 {page_count} 页，超过上限，只提取前 {max_pages} 页")
+                page_count = max_pages
+                cutoff = "max_pages"
+
+            def run(shards: List[List[int]], mode: str) -> Iterator[List[PageText]]:
+                if mode == "ocr" and shards and ocr_pool_enabled():
+                    # 扫描页交给预加载了 OCR 模型的工作进程
+                    return _run_parallel(get_ocr_pool(), shared_path(), shards, mode, ocr_dpi, page_timeout)
+                if workers > 1 and len(shards) > 1:
+                    return _run_parallel(_get_pool(workers), shared_path(), shards, mode, ocr_dpi, page_timeout)
+                return (_process_pages(doc, shard, mode, ocr_dpi, page_timeout) for shard in shards)
+
+            needs_ocr: List[int] = []
+            text_shards = [
+                list(range(start, min(start + pages_per_shard, page_count)))
+                for start in range(0, page_count, pages_per_shard)
+            ]
+            for results in run(text_shards, "text"):
+                for page_num, text, _ in results:
+                    if text is not None and not text.strip():
+                        needs_ocr.append(page_num)
+                    else:
+                        yield page_num, text, page_count
+
+            if needs_ocr:
+                print(f"[PDF] {len(needs_ocr)} 页没有文本层，渲染后 OCR（{ocr_dpi} DPI）")
+            deadline = time.monotonic() + max_ocr_seconds if max_ocr_seconds > 0 else None
+            remaining = len(needs_ocr)
+            ocr_results = run(_ocr_shards(sorted(needs_ocr), workers), "ocr")
+            try:
+                for results in ocr_results:
+                    for page_num, text, cache_hit in results:
+                        if cache_hit is not None:
+                            # 在主进程里统计，工作进程中的指标不会汇总
+                            record_cache("ocr_page", hit=cache_hit)
+                        remaining -= 1
+                        yield page_num, text, page_count
+                    if remaining and deadline is not None and time.monotonic() > deadline:
+                        print(f"[PDF] OCR 超过时长预算 {max_ocr_seconds:.0f}s，剩余 {remaining} 页未识别")
+                        return "max_ocr_seconds", document_pages
+            finally:
+                # 提前停止时取消还没开始的 OCR 任务
+                ocr_results.close()
+    finally:
+        if temp_path is not None:
+            os.unlink(temp_path)
+    return cutoff, document_pages
+
+
+def count_pdf_pages(source: Union[bytes, bytearray, memoryview, str, "os.PathLike[str]"]) -> Optional[int]:
+    """PDF 总页数（只读取目录结构，不解析页面内容）；无法打开时返回 None"""
+    try:
+        with _open_document(source) as doc:
+            return doc.page_count
+    except Exception:  # noqa: BLE001
+        return None
+
+
+def extract_pdf_pages(
+    source: Union[bytes, bytearray, memoryview, str, "os.PathLike[str]"],
+    *,
+    progress: Optional[Callable[[int, int], None]] = None,
+    **options,
+) -> List[Optional[str]]:
+    """
+    按页码顺序返回各页文本（没有内容的页为空字符串，超时被跳过的页为 None）。
+
+    Args:
+        progress: 每完成一页调用一次 progress(已完成页数, 总页数)
+        options: 见 iter_pdf_pages
+    """
+    texts: List[Optional[str]] = []
+    for pages_done, (page_num, text, page_count) in enumerate(iter_pdf_pages(source, **options), start=1):
+        if not texts:
+            texts = [""] * page_count
+        texts[page_num] = text
+        if progress is not None:
+            progress(pages_done, page_count)
+    return texts
+
+
+__all__ = ["count_pdf_pages", "extract_pdf_pages", "iter_pdf_pages", "shutdown_pdf_pool"]
@@ -0,0 +1,287 @@
+"""
+可观测任务开始时间、只隔离卡住任务的进程池
+
+PDF 分页提取与 OCR 的进程池由所有请求共享，直接用 ProcessPoolExecutor 有两个问题：
+- future 只能从提交开始计时，排在繁忙进程池后面等待的时间也算进超时
+- 卡住的工作进程只能连同整个进程池一起终止，其他请求处理中的任务都会失败（BrokenProcessPool）
+
+WatchedProcessPool 在 ProcessPoolExecutor 外加了一层：
+- 工作进程开始执行任务时通过队列通知主进程，started_at() 返回任务实际开始的时间，
+  result(future, timeout) 从开始执行时计时
+- abandon(future) 放弃卡住的任务：当前 executor 不再接收新任务（之后的任务交给新建的 executor），
+  等它上其他已经开始的任务都结束后，再终止其中的进程（此时只剩卡住的进程在运行）
+- executor 被终止或工作进程崩溃时，还没开始执行的任务自动重新提交到新的 executor
+"""
+
+from __future__ import annotations
+
+import itertools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+
+# 等待任务开始执行时检查的间隔（秒）
+_START_POLL_INTERVAL = 0.2
+
+# 工作进程内：任务开始时通知主进程的队列
+_events = None
+
+
+def _init_worker(events, initializer: Optional[Callable[[], None]]) -> None:
+    global _events
+    _events = events
+    if initializer is not None:
+        initializer()
+
+
+def _run_job(token: int, fn: Callable[..., Any], args: Tuple[Any, ...]) -> Any:
+    """工作进程入口：先通知主进程任务已开始，再执行"""
+    _events.put(token)
+    return fn(*args)
+
+
+@dataclass
+class _Job:
+    token: int
+    fn: Callable[..., Any]
+    args: Tuple[Any, ...]
+    future: Future
+    inner: Optional[Future] = None
+    executor: Optional[ProcessPoolExecutor] = None
+    started: Optional[float] = None
+    abandoned: bool = False
+
+
+class WatchedProcessPool:
+    """见模块说明。submit 返回的 Future 与 executor 无关，重新提交时保持不变。"""
+
+    def __init__(
+        self,
+        max_workers: int,
+        *,
+        mp_context=None,
+        initializer: Optional[Callable[[], None]] = None,
+        max_tasks_per_child: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        name: str = "pool",
+    ):
+        """
+        Args:
+            max_pending: 正在运行与排队的任务数上限，达到上限时 submit 阻塞等待
+            name: 日志中的名称
+        """
+        self.max_workers = max_workers
+        self.name = name
+        self._context = mp_context or multiprocessing.get_context()
+        self._initializer = initializer
+        self._max_tasks_per_child = max_tasks_per_child
+        self._slots = threading.BoundedSemaphore(max_pending) if max_pending else None
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._reaping: Set[ProcessPoolExecutor] = set()
+        self._jobs: Dict[int, _Job] = {}
+        self._by_future: Dict[Future, _Job] = {}
+        self._tokens = itertools.count()
+        self._closed = False
+        self._events = self._context.SimpleQueue()
+        self._listener = threading.Thread(target=self._listen, name=f"{name}-events", daemon=True)
+        self._listener.start()
+
+    # ---------- 提交与结果 ----------
+
+    def submit(self, fn: Callable[..., Any], *args: Any, slot_timeout: Optional[float] = None) -> Future:
+        """
+        提交任务；fn 需为模块级函数。
+
+        Raises:
+            TimeoutError: 达到 max_pending，且在 slot_timeout 秒内没有空位
+        """
+        if self._slots is not None and not self._slots.acquire(timeout=slot_timeout):
+            raise TimeoutError("任务排队超时，请稍后重试")
+        job = _Job(next(self._tokens), fn, args, Future())
+        with self._lock:
+            self._jobs[job.token] = job
+            self._by_future[job.future] = job
+        job.future.add_done_callback(self._on_outer_done)
+        try:
+            self._dispatch(job)
+        except BaseException:
+            job.future.cancel()
+            raise
+        return job.future
+
+    def started_at(self, future: Future) -> Optional[float]:
+        """任务在工作进程中开始执行的时间（time.monotonic()）；还在排队时为 None"""
+        with self._lock:
+            job = self._by_future.get(future)
+            return job.started if job is not None else None
+
+    def result(self, future: Future, timeout: Optional[float] = None) -> Any:
+        """
+        等待任务结果；timeout 从任务开始执行时计时，排队等待的时间不计入。
+
+        Raises:
+            TimeoutError: 任务开始后超过 timeout 仍未完成（此时放弃该任务）
+        """
+        if timeout is None or timeout <= 0:
+            return future.result()
+        deadline: Optional[float] = None
+        while True:
+            if deadline is None:
+                started = self.started_at(future)
+                if started is not None:
+                    deadline = started + timeout
+            wait_for = _START_POLL_INTERVAL if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                return future.result(timeout=wait_for)
+            except TimeoutError:
+                if future.done():
+                    raise
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.abandon(future)
+                    raise
+
+    def abandon(self, future: Future) -> None:
+        """放弃卡住的任务：所在 executor 不再接收新任务，其他任务结束后终止其中的进程"""
+        with self._lock:
+            job = self._by_future.get(future)
+            if job is None or job.abandoned:
+                return
+            job.abandoned = True
+            executor = job.executor
+            if executor is None or executor in self._reaping:
+                return
+            if self._executor is executor:
+                self._executor = None
+            self._reaping.add(executor)
+        print(f"[{self.name}] 任务卡住，等其他任务结束后替换工作进程")
+        threading.Thread(
+            target=self._reap, args=(executor,), name=f"{self.name}-reaper", daemon=True
+        ).start()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """关闭进程池（取消排队的任务）"""
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+            reaping = list(self._reaping)
+        for old in reaping:
+            _terminate(old)
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+        self._events.put(None)
+
+    def processes(self) -> list:
+        """当前 executor 的工作进程"""
+        with self._lock:
+            executor = self._executor
+        return list((getattr(executor, "_processes", None) or {}).values())
+
+    # ---------- 内部实现 ----------
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._closed:
+            raise RuntimeError(f"{self.name} 已关闭")
+        if self._executor is None or getattr(self._executor, "_broken", False):
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=self._context,
+                initializer=_init_worker,
+                initargs=(self._events, self._initializer),
+                max_tasks_per_child=self._max_tasks_per_child,
+            )
+        return self._executor
+
+    def _dispatch(self, job: _Job) -> None:
+        with self._lock:
+            executor = self._get_executor()
+            job.executor = executor
+            job.started = None
+            job.inner = executor.submit(_run_job, job.token, job.fn, job.args)
+        job.inner.add_done_callback(lambda inner, job=job: self._on_inner_done(job, inner))
+
+    def _on_inner_done(self, job: _Job, inner: Future) -> None:
+        if job.future.cancelled():
+            return
+        error = None if inner.cancelled() else inner.exception()
+        lost = inner.cancelled() or isinstance(error, BrokenProcessPool)
+        with self._lock:
+            if lost and self._executor is job.executor:
+                # 工作进程崩溃，之后的任务交给新的 executor
+                self._executor = None
+            retry = lost and job.started is None and not job.abandoned and not self._closed
+        if retry:
+            # 还没开始执行的任务与卡住的任务无关，重新提交
+            try:
+                self._dispatch(job)
+                return
+            except Exception as exc:  # noqa: BLE001
+                error = exc
+        if not job.future.set_running_or_notify_cancel():
+            return
+        if error is not None:
+            job.future.set_exception(error)
+        elif inner.cancelled():
+            job.future.set_exception(BrokenProcessPool("工作进程已终止"))
+        else:
+            job.future.set_result(inner.result())
+
+    def _on_outer_done(self, future: Future) -> None:
+        with self._lock:
+            job = self._by_future.pop(future, None)
+            if job is not None:
+                self._jobs.pop(job.token, None)
+        if job is None:
+            return
+        if future.cancelled() and job.inner is not None:
+            job.inner.cancel()
+        if self._slots is not None:
+            self._slots.release()
+
+    def _listen(self) -> None:
+        while True:
+            token = self._events.get()
+            if token is None:
+                return
+            with self._lock:
+                job = self._jobs.get(token)
+                if job is not None and job.started is None:
+                    job.started = time.monotonic()
+
+    def _reap(self, executor: ProcessPoolExecutor) -> None:
+        """等 executor 上其他已开始的任务结束，再终止它的进程；没开始的任务会被重新提交"""
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                running = [
+                    job.inner
+                    for job in self._jobs.values()
+                    if job.executor is executor
+                    and job.started is not None
+                    and not job.abandoned
+                    and job.inner is not None
+                    and not job.inner.done()
+                ]
+            if not running:
+                break
+            wait(running, timeout=1.0)
+        _terminate(executor)
+        with self._lock:
+            self._reaping.discard(executor)
+
+
+def _terminate(executor: ProcessPoolExecutor) -> None:
+    """终止 executor 的全部进程（包括卡住的）"""
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+__all__ = ["WatchedProcessPool"]
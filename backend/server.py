@@ -4,22 +4,61 @@ from typing import Dict, List, Optional
 from fastapi import FastAPI, HTTPException, Query
 from fastapi import File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, Field
 
 try:
     from .curious_student_agent import run_curious_student_agent
     from .simple_explainer_agent import run_simple_explainer_agent
     from .terms_generator import generate_terms_for_topic
-    from .note_terms_extractor import extract_terms_from_note
-    from .file_text_extractor import extract_text_from_upload
+    from .note_terms_extractor import (
+        ensure_corpus_index,
+        extract_terms_from_note,
+        index_note,
+        unindex_note,
+    )
+    from .file_text_extractor import extract_upload_text
     from .database import db
+    from .config import ocr_warmup
+    from .metrics import (
+        PROMETHEUS_CONTENT_TYPE,
+        http_metrics_middleware,
+        record_cache,
+        render_metrics,
+        time_stage,
+    )
+    from .ocr_pool import shutdown_ocr_pool, warmup_ocr_pool
+    from .pdf_extractor import shutdown_pdf_pool
+    from .term_matcher import add_terms as add_matcher_terms, match_known_terms
+    from .term_normalizer import clean_term, normalize_term
+    from .upload_spool import discard_upload, spool_upload, upload_size_middleware
+    from .word_segmenter import add_terms as add_segmenter_terms
 except ImportError:  # pragma: no cover
     from curious_student_agent import run_curious_student_agent
     from simple_explainer_agent import run_simple_explainer_agent
     from terms_generator import generate_terms_for_topic
-    from note_terms_extractor import extract_terms_from_note
-    from file_text_extractor import extract_text_from_upload
+    from note_terms_extractor import (
+        ensure_corpus_index,
+        extract_terms_from_note,
+        index_note,
+        unindex_note,
+    )
+    from file_text_extractor import extract_upload_text
     from database import db
+    from config import ocr_warmup
+    from metrics import (
+        PROMETHEUS_CONTENT_TYPE,
+        http_metrics_middleware,
+        record_cache,
+        render_metrics,
+        time_stage,
+    )
+    from ocr_pool import shutdown_ocr_pool, warmup_ocr_pool
+    from pdf_extractor import shutdown_pdf_pool
+    from term_matcher import add_terms as add_matcher_terms, match_known_terms
+    from term_normalizer import clean_term, normalize_term
+    from upload_spool import discard_upload, spool_upload, upload_size_middleware
+    from word_segmenter import add_terms as add_segmenter_terms
 
 
 app = FastAPI(title="Agent Service")
@@ -31,6 +70,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.middleware("http")(http_metrics_middleware)
+app.middleware("http")(upload_size_middleware)
 
 
 @app.get("/health")
@@ -43,12 +84,26 @@ def health_check():
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint() -> PlainTextResponse:
+    """Prometheus 指标导出接口"""
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 class AgentRequest(BaseModel):
     text: str = Field(..., min_length=1, description="用户输入文本")
+    session_id: str | None = Field(
+        default=None,
+        max_length=128,
+        pattern="^[^:]*$",
+        description="会话ID（可选，不能包含冒号），传入后服务端保存对话历史，每轮只需发送新输入",
+    )
+    card: str | None = Field(default=None, max_length=200, description="当前学习的卡片/词语（可选），同一会话内按卡片区分对话")
 
 
 class AgentResponse(BaseModel):
     reply: str
+    session_id: str | None = None
 
 
 class TermsResponse(BaseModel):
@@ -67,6 +122,12 @@ class NoteExtractResponse(BaseModel):
     text: str = Field(default="", description="提取的文本内容")
     terms: List[str] = Field(..., description="抽取出的词语列表（可编辑）")
     total_chars: int = Field(..., ge=0, description="笔记字符数")
+    pages_processed: Optional[int] = Field(default=None, description="实际处理的页数（从第 1 页起，仅文件上传）")
+    pages_total: Optional[int] = Field(default=None, description="文档总页数（仅文件上传）")
+    truncated_by: Optional[str] = Field(
+        default=None,
+        description="触发的提取预算（max_bytes/max_pages/max_chars/max_ocr_seconds），完整提取时为空",
+    )
 
 
 # ==================== 笔记管理相关模型 ====================
@@ -99,10 +160,21 @@ class FlashCardGenerateRequest(BaseModel):
     max_terms: int = Field(default=30, ge=5, le=60, description="最多生成词条数量")
 
 
+class LinkedTerm(BaseModel):
+    term: str = Field(..., description="笔记中出现的已学词条")
+    note_ids: List[str] = Field(..., description="已有该词条闪词卡片的其他笔记ID")
+
+
 class FlashCardGenerateResponse(BaseModel):
     note_id: str = Field(..., description="笔记ID")
     terms: List[str] = Field(..., description="生成的词条列表")
     total: int = Field(..., description="生成的总词条数")
+    linked_terms: List[LinkedTerm] = Field(default_factory=list, description="已在其他笔记中学过、未重复生成的词条")
+
+
+class LinkedTermsResponse(BaseModel):
+    note_id: str = Field(..., description="笔记ID")
+    linked_terms: List[LinkedTerm] = Field(..., description="笔记中出现的、其他笔记已有闪词卡片的词条")
 
 
 class FlashCardProgressResponse(BaseModel):
@@ -241,12 +313,41 @@ TERMS_LIBRARY = {
 }
 
 
+@app.on_event("startup")
+def seed_segmenter_dictionary():
+    """启动时用预设词库与已有闪词卡片词条构建分词词典和已学词条匹配器（后台线程，不阻塞启动）"""
+    preset_terms = [term for terms in TERMS_LIBRARY.values() for term in terms]
+    card_terms = db.list_flash_card_terms()
+    add_segmenter_terms(preset_terms + card_terms)
+    add_matcher_terms(card_terms)
+
+
+@app.on_event("startup")
+def start_ocr_workers():
+    """在后台预先启动 OCR 工作进程并加载模型，第一个图片请求不必等待"""
+    if ocr_warmup:
+        warmup_ocr_pool()
+
+
+@app.on_event("shutdown")
+def stop_ocr_workers():
+    """应用关闭时释放 PDF 与 OCR 工作进程"""
+    shutdown_pdf_pool()
+    shutdown_ocr_pool()
+
+
+@app.on_event("startup")
+def load_corpus_index():
+    """加载语料文档频率索引；磁盘上没有索引时用全部笔记重建"""
+    ensure_corpus_index(lambda: ((note.id, note.content) for note in db.list_notes()))
+
+
 def _call_agent(agent_fn, payload: AgentRequest) -> AgentResponse:
     try:
-        result = agent_fn(payload.text)
+        result = agent_fn(payload.text, session_id=payload.session_id, card=payload.card)
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=500, detail=str(exc)) from exc
-    return AgentResponse(reply=result)
+    return AgentResponse(reply=result, session_id=payload.session_id)
 
 
 @app.post("/agents/curious-student", response_model=AgentResponse)
@@ -271,6 +372,7 @@ def list_terms(category: str = Query("economics", min_length=1)) -> TermsRespons
     
     # 先检查预设库
     terms = TERMS_LIBRARY.get(key)
+    record_cache("topic_terms", hit=bool(terms))
     
     if not terms:
         # 如果不在预设库中，使用 LLM 生成
@@ -298,7 +400,8 @@ def extract_terms(payload: NoteExtractRequest) -> NoteExtractResponse:
     - LLM 不可用时使用规则兜底抽取
     """
     try:
-        terms = extract_terms_from_note(payload.text, max_terms=payload.max_terms)
+        with time_stage("term_extraction"):
+            terms = extract_terms_from_note(payload.text, max_terms=payload.max_terms)
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
@@ -315,22 +418,34 @@ def extract_terms(payload: NoteExtractRequest) -> NoteExtractResponse:
 async def extract_terms_from_file(
     file: UploadFile = File(...),
     max_terms: int = 30,
+    include_text: bool = True,
 ) -> NoteExtractResponse:
     """
-    上传笔记文件（支持 pdf/docx/txt/md），解析并抽取待学习词语。
+    上传笔记文件（支持 pdf/docx/pptx/epub/html/txt/md 与图片），解析并抽取待学习词语。
+
+    提取受配置的预算限制（字节数、页数、字符数、OCR 时长），触发时提前停止并在 truncated_by 中注明；
+    include_text=false 时不回传提取的全文。
     """
+    # 分块写入临时文件（超过大小上限返回 413），解析时按路径读取
+    path = await spool_upload(file)
     try:
-        raw = await file.read()
-        text = extract_text_from_upload(file.filename, raw)
-        terms = extract_terms_from_note(text, max_terms=max_terms)
+        with time_stage("text_extraction"):
+            result = extract_upload_text(file.filename, path)
+        with time_stage("term_extraction"):
+            terms = extract_terms_from_note(result.text, max_terms=max_terms)
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=500, detail=str(exc)) from exc
+    finally:
+        discard_upload(path)
 
     return NoteExtractResponse(
         title=file.filename,
-        text=text,
+        text=result.text if include_text else "",
         terms=terms,
-        total_chars=len(text),
+        total_chars=len(result.text),
+        pages_processed=result.pages_processed,
+        pages_total=result.pages_total,
+        truncated_by=result.truncated_by,
     )
 
 
@@ -402,6 +517,7 @@ def create_note(payload: NoteCreateRequest) -> NoteResponse:
     
     try:
         note = db.create_note(title=payload.title, content=payload.content)
+        index_note(note.id, note.content)
         return NoteResponse(
             id=note.id,
             title=note.title,
@@ -473,6 +589,8 @@ def update_note(note_id: str, payload: NoteUpdateRequest) -> NoteResponse:
 
         if not updated_note:
             raise HTTPException(status_code=404, detail=f"笔记 {note_id} 不存在")
+        if payload.content is not None:
+            index_note(updated_note.id, updated_note.content)
 
         # 获取该笔记的词条数量
         cards = db.get_flash_cards(note_id)
@@ -507,6 +625,7 @@ def delete_note(note_id: str) -> Dict[str, str]:
         success = db.delete_note(note_id)
         if not success:
             raise HTTPException(status_code=404, detail=f"笔记 {note_id} 不存在")
+        unindex_note(note_id)
 
         # 验证删除是否成功
         deleted_note = db.get_note(note_id)
@@ -523,6 +642,33 @@ def delete_note(note_id: str) -> Dict[str, str]:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
+def _studied_terms(content: str) -> Dict[str, List[str]]:
+    """笔记中出现的、仍有闪词卡片的已学词条：词条 -> 拥有该卡片的笔记ID 列表"""
+    return db.get_notes_for_terms(match_known_terms(content))
+
+
+def _linked_terms(studied: Dict[str, List[str]], note_id: str) -> List[LinkedTerm]:
+    linked = []
+    for term, note_ids in studied.items():
+        others = [n for n in note_ids if n != note_id]
+        if others:
+            linked.append(LinkedTerm(term=term, note_ids=others))
+    return linked
+
+
+@app.get("/notes/{note_id}/linked-terms", response_model=LinkedTermsResponse)
+def get_linked_terms(note_id: str) -> LinkedTermsResponse:
+    """
+    跨笔记关联
+
+    找出笔记中出现的、在其他笔记里已有闪词卡片的词条。
+    """
+    note = db.get_note(note_id)
+    if not note:
+        raise HTTPException(status_code=404, detail=f"笔记 {note_id} 不存在")
+    return LinkedTermsResponse(note_id=note_id, linked_terms=_linked_terms(_studied_terms(note.content), note_id))
+
+
 @app.post("/notes/{note_id}/flash-cards/generate", response_model=FlashCardGenerateResponse)
 def generate_flash_cards(
     note_id: str,
@@ -540,8 +686,16 @@ def generate_flash_cards(
         raise HTTPException(status_code=404, detail=f"笔记 {note_id} 不存在")
 
     try:
+        # 先找出笔记中出现的已学词条：不再让 LLM 重复抽取，也不在本笔记重复建卡
+        with time_stage("term_matching"):
+            studied = _studied_terms(note.content)
+        linked_terms = _linked_terms(studied, note_id)
+
         # 从笔记内容中提取词条
-        terms = extract_terms_from_note(note.content, max_terms=payload.max_terms)
+        with time_stage("term_extraction"):
+            terms = extract_terms_from_note(
+                note.content, max_terms=payload.max_terms, known_terms=list(studied)
+            )
 
         if not terms:
             # 如果没有提取到词条，返回空列表
@@ -549,10 +703,13 @@ def generate_flash_cards(
                 note_id=note_id,
                 terms=[],
                 total=0,
+                linked_terms=linked_terms,
             )
 
         # 创建闪词卡片（自动去重，保留已有词条的学习状态）
         new_cards = db.create_flash_cards(note_id, terms)
+        add_segmenter_terms(card.term for card in new_cards)
+        add_matcher_terms(card.term for card in new_cards)
 
         # 返回所有词条（包括新生成的和已有的）
         all_cards = db.get_flash_cards(note_id)
@@ -562,6 +719,7 @@ def generate_flash_cards(
             note_id=note_id,
             terms=all_terms,
             total=len(all_terms),
+            linked_terms=linked_terms,
         )
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e)) from e
@@ -598,12 +756,14 @@ def add_confused_terms(
                 detail=f"无效的状态值。允许的值: {', '.join(valid_statuses)}"
             )
         
-        # 清理词汇（移除尖括号等）
+        # 清理词汇（移除尖括号、全角转半角等），按规范化词条去重
         cleaned_terms = []
+        seen_normalized = set()
         for term in request.terms:
-            # 移除尖括号和空格
-            cleaned = term.replace("<", "").replace(">", "").strip()
-            if cleaned and cleaned not in cleaned_terms:
+            cleaned = clean_term(term)
+            normalized = normalize_term(cleaned)
+            if normalized and normalized not in seen_normalized:
+                seen_normalized.add(normalized)
                 cleaned_terms.append(cleaned)
         
         if not cleaned_terms:
@@ -611,6 +771,8 @@ def add_confused_terms(
         
         # 创建闪词卡片
         new_cards = db.create_flash_cards(note_id, cleaned_terms)
+        add_segmenter_terms(card.term for card in new_cards)
+        add_matcher_terms(card.term for card in new_cards)
         
         # 更新状态（使用 note_id 和 term）
         for card in new_cards:
@@ -713,20 +875,10 @@ def update_flash_card_status(
         raise HTTPException(status_code=404, detail=f"笔记 {note_id} 不存在")
 
     try:
-        cards = db.get_flash_cards(note_id)
-        target_card = None
-        
-        for card in cards:
-            if card.term == request.term:
-                target_card = card
-                break
-        
-        if not target_card:
-            raise HTTPException(status_code=404, detail="闪词卡片不存在")
-        
+        # 由数据库按规范化词条查找卡片（"ＡＰＩ" 与 "API" 是同一张卡片）
         success = db.update_flash_card_status(note_id, request.term, request.status)
         if not success:
-            raise HTTPException(status_code=500, detail="更新失败")
+            raise HTTPException(status_code=404, detail="闪词卡片不存在")
         
         return {"message": "状态更新成功"}
     except HTTPException:
@@ -1,13 +1,15 @@
 from datetime import datetime
-from typing import Dict, List, Optional, Awaitable
+from typing import Dict, List, Optional, Awaitable, Union
 from enum import Enum
 import asyncio
-import uuid
-from concurrent.futures import ThreadPoolExecutor
+import json
+import os
 
-from fastapi import FastAPI, HTTPException, Query, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, BackgroundTasks, Request
 from fastapi import File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 import contextlib
 
@@ -15,18 +17,80 @@ try:
     from .curious_student_agent import run_curious_student_agent
     from .simple_explainer_agent import run_simple_explainer_agent
     from .terms_generator import generate_terms_for_topic
-    from .note_terms_extractor import extract_terms_from_note
-    from .file_text_extractor import extract_text_from_upload
+    from .note_terms_extractor import (
+        ensure_corpus_index,
+        extract_terms_from_note,
+        index_note,
+        unindex_note,
+    )
+    from .file_text_extractor import extract_upload_text
+    from .batch_extractor import BatchItem
+    from .extraction_jobs import JOB_HANDLERS, discard_job_files, estimate_job_cost
+    from .job_queue import FINISHED, get_job_queue, start_workers
+    from .pdf_extractor import shutdown_pdf_pool
     from .database_async import db
-    from .config import database_url
+    from .corpus_index import get_corpus_index
+    from .config import (
+        batch_max_files,
+        database_url,
+        job_event_keepalive_seconds,
+        job_inprocess_workers,
+        job_max_client_jobs,
+        job_max_queue_depth,
+        job_retry_after_seconds,
+        job_trust_client_id_header,
+        ocr_warmup,
+    )
+    from .metrics import (
+        PROMETHEUS_CONTENT_TYPE,
+        http_metrics_middleware,
+        record_cache,
+        render_metrics,
+        time_stage,
+    )
+    from .ocr_pool import shutdown_ocr_pool, warmup_ocr_pool
+    from .term_matcher import add_terms as add_matcher_terms, match_known_terms
+    from .upload_spool import discard_upload, spool_upload, upload_size_middleware
+    from .word_segmenter import add_terms as add_segmenter_terms
 except ImportError:  # pragma: no cover
     from curious_student_agent import run_curious_student_agent
     from simple_explainer_agent import run_simple_explainer_agent
     from terms_generator import generate_terms_for_topic
-    from note_terms_extractor import extract_terms_from_note
-    from file_text_extractor import extract_text_from_upload
+    from note_terms_extractor import (
+        ensure_corpus_index,
+        extract_terms_from_note,
+        index_note,
+        unindex_note,
+    )
+    from file_text_extractor import extract_upload_text
+    from batch_extractor import BatchItem
+    from extraction_jobs import JOB_HANDLERS, discard_job_files, estimate_job_cost
+    from job_queue import FINISHED, get_job_queue, start_workers
+    from pdf_extractor import shutdown_pdf_pool
     from database_async import db
-    from config import database_url
+    from corpus_index import get_corpus_index
+    from config import (
+        batch_max_files,
+        database_url,
+        job_event_keepalive_seconds,
+        job_inprocess_workers,
+        job_max_client_jobs,
+        job_max_queue_depth,
+        job_retry_after_seconds,
+        job_trust_client_id_header,
+        ocr_warmup,
+    )
+    from metrics import (
+        PROMETHEUS_CONTENT_TYPE,
+        http_metrics_middleware,
+        record_cache,
+        render_metrics,
+        time_stage,
+    )
+    from ocr_pool import shutdown_ocr_pool, warmup_ocr_pool
+    from term_matcher import add_terms as add_matcher_terms, match_known_terms
+    from upload_spool import discard_upload, spool_upload, upload_size_middleware
+    from word_segmenter import add_terms as add_segmenter_terms
 
 app = FastAPI(title="Agent Service")
 
@@ -37,14 +101,24 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.middleware("http")(http_metrics_middleware)
+app.middleware("http")(upload_size_middleware)
 
 
 class AgentRequest(BaseModel):
     text: str = Field(..., min_length=1, description="用户输入文本")
+    session_id: str | None = Field(
+        default=None,
+        max_length=128,
+        pattern="^[^:]*$",
+        description="会话ID（可选，不能包含冒号），传入后服务端保存对话历史，每轮只需发送新输入",
+    )
+    card: str | None = Field(default=None, max_length=200, description="当前学习的卡片/词语（可选），同一会话内按卡片区分对话")
 
 
 class AgentResponse(BaseModel):
     reply: str
+    session_id: str | None = None
 
 
 class TermsResponse(BaseModel):
@@ -63,6 +137,12 @@ class NoteExtractResponse(BaseModel):
     text: str = Field(default="", description="提取的文本内容")
     terms: List[str] = Field(..., description="抽取出的词语列表（可编辑）")
     total_chars: int = Field(..., ge=0, description="笔记字符数")
+    pages_processed: Optional[int] = Field(default=None, description="实际处理的页数（从第 1 页起，仅文件上传）")
+    pages_total: Optional[int] = Field(default=None, description="文档总页数（仅文件上传）")
+    truncated_by: Optional[str] = Field(
+        default=None,
+        description="触发的提取预算（max_bytes/max_pages/max_chars/max_ocr_seconds），完整提取时为空",
+    )
 
 
 # ==================== 笔记管理相关模型 ====================
@@ -92,10 +172,21 @@ class FlashCardGenerateRequest(BaseModel):
     max_terms: int = Field(default=30, ge=5, le=60, description="最多生成词条数量")
 
 
+class LinkedTerm(BaseModel):
+    term: str = Field(..., description="笔记中出现的已学词条")
+    note_ids: List[str] = Field(..., description="已有该词条闪词卡片的其他笔记ID")
+
+
 class FlashCardGenerateResponse(BaseModel):
     note_id: str = Field(..., description="笔记ID")
     terms: List[str] = Field(..., description="生成的词条列表")
     total: int = Field(..., description="生成的总词条数")
+    linked_terms: List[LinkedTerm] = Field(default_factory=list, description="已在其他笔记中学过、未重复生成的词条")
+
+
+class LinkedTermsResponse(BaseModel):
+    note_id: str = Field(..., description="笔记ID")
+    linked_terms: List[LinkedTerm] = Field(..., description="笔记中出现的、其他笔记已有闪词卡片的词条")
 
 
 class FlashCardProgressResponse(BaseModel):
@@ -199,6 +290,12 @@ async def health_check():
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus 指标导出接口"""
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 # ==================== Agent 相关接口 ====================
 
 
@@ -206,8 +303,10 @@ async def health_check():
 async def curious_student(request: AgentRequest):
     """好奇学生Agent"""
     try:
-        reply = await run_curious_student_agent(request.text)
-        return AgentResponse(reply=reply)
+        reply = await run_in_threadpool(
+            run_curious_student_agent, request.text, session_id=request.session_id, card=request.card
+        )
+        return AgentResponse(reply=reply, session_id=request.session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -216,8 +315,10 @@ async def curious_student(request: AgentRequest):
 async def simple_explainer(request: AgentRequest):
     """简单解释器Agent"""
     try:
-        reply = await run_simple_explainer_agent(request.text)
-        return AgentResponse(reply=reply)
+        reply = await run_in_threadpool(
+            run_simple_explainer_agent, request.text, session_id=request.session_id, card=request.card
+        )
+        return AgentResponse(reply=reply, session_id=request.session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -228,6 +329,7 @@ async def simple_explainer(request: AgentRequest):
 @app.get("/topics/terms", response_model=TermsResponse)
 async def get_terms(category: str = Query(..., description="术语类别")):
     """获取术语列表"""
+    record_cache("topic_terms", hit=category in TERMS_LIBRARY)
     if category not in TERMS_LIBRARY:
         raise HTTPException(
             status_code=404, detail=f"类别 '{category}' 不存在"
@@ -243,7 +345,8 @@ async def get_terms(category: str = Query(..., description="术语类别")):
 async def extract_note_terms(request: NoteExtractRequest):
     """从笔记文本中抽取待学习词语"""
     try:
-        terms = await extract_terms_from_note(request.text, request.max_terms)
+        with time_stage("term_extraction"):
+            terms = await run_in_threadpool(extract_terms_from_note, request.text, request.max_terms)
         return NoteExtractResponse(
             title=request.title,
             text=request.text,
@@ -258,21 +361,34 @@ async def extract_note_terms(request: NoteExtractRequest):
 async def extract_note_terms_file(
     title: Optional[str] = None,
     max_terms: int = 30,
+    include_text: bool = True,
     file: UploadFile = File(...),
 ):
-    """从笔记文件中抽取待学习词语（multipart/form-data）"""
+    """
+    从笔记文件中抽取待学习词语（multipart/form-data）
+
+    提取受配置的预算限制，触发时提前停止并在 truncated_by 中注明；include_text=false 时不回传全文
+    """
+    # 分块写入临时文件（超过大小上限返回 413），解析时按路径读取
+    path = await spool_upload(file)
     try:
-        raw = await file.read()
-        text = extract_text_from_upload(file.filename, raw)
-        terms = await extract_terms_from_note(text, max_terms)
+        with time_stage("text_extraction"):
+            result = await run_in_threadpool(extract_upload_text, file.filename, path)
+        with time_stage("term_extraction"):
+            terms = await run_in_threadpool(extract_terms_from_note, result.text, max_terms)
         return NoteExtractResponse(
             title=title,
-            text=text,
+            text=result.text if include_text else "",
             terms=terms,
-            total_chars=len(text),
+            total_chars=len(result.text),
+            pages_processed=result.pages_processed,
+            pages_total=result.pages_total,
+            truncated_by=result.truncated_by,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        discard_upload(path)
 
 
 @app.post("/notes", response_model=NoteResponse)
@@ -280,6 +396,7 @@ async def create_note(request: NoteCreateRequest):
     """创建笔记"""
     try:
         note = await db.create_note(request.title, request.content)
+        index_note(note.id, note.content)
         cards = await db.get_flash_cards(note.id)
         return NoteResponse(
             id=note.id,
@@ -323,6 +440,8 @@ async def update_note(note_id: str, request: NoteUpdateRequest):
         note = await db.update_note(note_id, request.title, request.content)
         if not note:
             raise HTTPException(status_code=404, detail="笔记不存在")
+        if request.content is not None:
+            index_note(note.id, note.content)
         
         cards = await db.get_flash_cards(note_id)
         return NoteResponse(
@@ -346,6 +465,7 @@ async def delete_note(note_id: str):
         success = await db.delete_note(note_id)
         if not success:
             raise HTTPException(status_code=404, detail="笔记不存在")
+        unindex_note(note_id)
         return {"message": "笔记删除成功"}
     except HTTPException:
         raise
@@ -382,6 +502,31 @@ async def list_notes(
 # ==================== Flash Cards 相关接口 ====================
 
 
+async def _studied_terms(content: str) -> Dict[str, List[str]]:
+    """笔记中出现的、仍有闪词卡片的已学词条：词条 -> 拥有该卡片的笔记ID 列表"""
+    known = await run_in_threadpool(match_known_terms, content)
+    return await db.get_notes_for_terms(known)
+
+
+def _linked_terms(studied: Dict[str, List[str]], note_id: str) -> List[LinkedTerm]:
+    linked = []
+    for term, note_ids in studied.items():
+        others = [n for n in note_ids if n != note_id]
+        if others:
+            linked.append(LinkedTerm(term=term, note_ids=others))
+    return linked
+
+
+@app.get("/notes/{note_id}/linked-terms", response_model=LinkedTermsResponse)
+async def get_linked_terms(note_id: str):
+    """跨笔记关联：笔记中出现的、在其他笔记里已有闪词卡片的词条"""
+    note = await db.get_note(note_id)
+    if not note:
+        raise HTTPException(status_code=404, detail="笔记不存在")
+    studied = await _studied_terms(note.content)
+    return LinkedTermsResponse(note_id=note_id, linked_terms=_linked_terms(studied, note_id))
+
+
 @app.post(
     "/notes/{note_id}/flash-cards/generate",
     response_model=FlashCardGenerateResponse,
@@ -395,11 +540,23 @@ async def generate_flash_cards(
         if not note:
             raise HTTPException(status_code=404, detail="笔记不存在")
         
-        terms = await extract_terms_from_note(note.content, request.max_terms)
+        # 先找出笔记中出现的已学词条：不再让 LLM 重复抽取，也不在本笔记重复建卡
+        with time_stage("term_matching"):
+            studied = await _studied_terms(note.content)
+
+        with time_stage("term_extraction"):
+            terms = await run_in_threadpool(
+                extract_terms_from_note, note.content, request.max_terms, list(studied)
+            )
         cards = await db.create_flash_cards(note_id, terms)
+        add_segmenter_terms(card.term for card in cards)
+        add_matcher_terms(card.term for card in cards)
         
         return FlashCardGenerateResponse(
-            note_id=note_id, terms=[card.term for card in cards], total=len(cards)
+            note_id=note_id,
+            terms=[card.term for card in cards],
+            total=len(cards),
+            linked_terms=_linked_terms(studied, note_id),
         )
     except HTTPException:
         raise
@@ -458,18 +615,12 @@ async def get_flash_card_progress(note_id: str):
 async def update_flash_card_status(note_id: str, request: FlashCardStatusUpdateRequest):
     """更新闪词卡片状态"""
     try:
-        cards = await db.get_flash_cards(note_id)
-        target_card = None
-        
-        for card in cards:
-            if card.term == request.term:
-                target_card = card
-                break
-        
-        if not target_card:
+        # 按规范化词条查找卡片（"ＡＰＩ" 与 "API" 是同一张卡片）
+        card_id = await db.find_flash_card_id(note_id, request.term)
+        if not card_id:
             raise HTTPException(status_code=404, detail="闪词卡片不存在")
         
-        success = await db.update_flash_card_status(target_card.id, request.status)
+        success = await db.update_flash_card_status(card_id, request.status)
         if not success:
             raise HTTPException(status_code=500, detail="更新失败")
         
@@ -483,55 +634,91 @@ async def update_flash_card_status(note_id: str, request: FlashCardStatusUpdateR
 # ==================== 统计相关接口 ====================
 
 
-@app.get("/statistics")
-async def get_statistics():
-    """获取学习统计"""
+class LearningStatisticsResponse(BaseModel):
+    """学习统计响应模型"""
+    mastered: int = Field(..., description="已掌握词条数")
+    totalTerms: int = Field(..., description="累计学习词条数")
+    consecutiveDays: int = Field(..., description="连续学习天数")
+    totalMinutes: int = Field(..., description="累计学习时长（分钟）")
+
+
+@app.get("/statistics", response_model=LearningStatisticsResponse)
+async def get_learning_statistics() -> LearningStatisticsResponse:
+    """
+    获取学习统计信息
+
+    返回全局学习统计数据，包括已掌握词条数、累计学习词条数、连续学习天数等。
+    """
     try:
-        note_count = await db.get_note_count()
-        review_cards = await db.get_review_cards(1000)  # 获取最多1000张卡片进行统计
-        
-        total_review_cards = len(review_cards)
-        
-        return {
-            "totalNotes": note_count,
-            "totalReviewCards": total_review_cards,
-            "lastUpdated": datetime.now(),
-        }
+        stats = await db.get_learning_statistics()
+        return LearningStatisticsResponse(**stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/review/today")
-async def get_today_review_statistics():
-    """获取今日复习统计"""
+class TodayReviewStatisticsResponse(BaseModel):
+    """今日复习统计响应模型"""
+    total: int = Field(..., description="需要复习的词条总数")
+    needsReview: int = Field(..., description="困难词条数（需要复习）")
+    needsImprove: int = Field(..., description="需改进词条数")
+
+
+@app.get("/review/today", response_model=TodayReviewStatisticsResponse)
+async def get_today_review_statistics() -> TodayReviewStatisticsResponse:
+    """
+    获取今日复习统计信息
+
+    返回今日需要复习的词条统计，包括总数、困难词条数、需改进词条数。
+    """
     try:
-        # 这里简化实现，实际应该根据复习记录统计
-        review_cards = await db.get_review_cards(50)
-        return {
-            "todayReviewCards": len(review_cards),
-            "todayCompletedCards": 0,  # 需要实际实现
-            "date": datetime.now().date().isoformat(),
-        }
+        stats = await db.get_today_review_statistics()
+        return TodayReviewStatisticsResponse(**stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/review/cards", response_model=List[dict])
-async def get_review_flash_cards(limit: int = Query(default=50, ge=1, le=100)):
-    """获取需要复习的闪词卡片列表"""
+class ReviewFlashCardResponse(BaseModel):
+    """复习闪词卡片响应模型"""
+    id: str = Field(..., description="卡片ID")
+    noteId: str = Field(..., description="笔记ID")
+    noteTitle: Optional[str] = Field(default=None, description="笔记标题")
+    term: str = Field(..., description="词条内容")
+    status: str = Field(..., description="学习状态：needsReview, needsImprove")
+    createdAt: datetime = Field(..., description="创建时间")
+    lastReviewedAt: Optional[datetime] = Field(default=None, description="最后复习时间")
+
+
+class ReviewFlashCardsResponse(BaseModel):
+    """复习闪词卡片列表响应模型"""
+    cards: List[ReviewFlashCardResponse] = Field(..., description="闪词卡片列表")
+    total: int = Field(..., description="总卡片数")
+
+
+@app.get("/review/cards", response_model=ReviewFlashCardsResponse)
+async def get_review_flash_cards(include_all: bool = False) -> ReviewFlashCardsResponse:
+    """
+    获取闪词卡片列表
+
+    默认返回复习时间已到、状态为 needsReview 或 needsImprove 的闪词卡片。
+    如果 include_all=True，则返回所有状态的词条。
+    """
     try:
-        cards = await db.get_review_cards(limit)
-        return [
-            {
-                "id": card.id,
-                "noteId": card.note_id,
-                "term": card.term,
-                "status": card.status,
-                "createdAt": card.created_at,
-                "lastReviewedAt": card.last_reviewed_at,
-            }
+        cards = await db.get_review_flash_cards(include_all=include_all)
+        # 一次查询取出所有相关笔记的标题
+        titles = await db.get_note_titles([card.note_id for card in cards])
+        card_responses = [
+            ReviewFlashCardResponse(
+                id=card.id,
+                noteId=card.note_id,
+                noteTitle=titles.get(card.note_id),
+                term=card.term,
+                status=card.status,
+                createdAt=card.created_at,
+                lastReviewedAt=card.last_reviewed_at,
+            )
             for card in cards
         ]
+        return ReviewFlashCardsResponse(cards=card_responses, total=len(card_responses))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -539,16 +726,47 @@ async def get_review_flash_cards(limit: int = Query(default=50, ge=1, le=100)):
 # ==================== 应用启动和关闭事件 ====================
 
 
+# API 进程内的任务 worker：(停止事件, 线程列表)
+_job_workers = None
+
+
 @app.on_event("startup")
 async def startup_event():
-    """应用启动时初始化数据库连接池"""
+    """应用启动时初始化数据库连接池，启动任务 worker，用预设词库与已有闪词卡片词条构建分词词典和已学词条匹配器，加载语料索引并预热 OCR 工作进程"""
+    global _job_workers
     await db.init_pool()
+    if ocr_warmup:
+        warmup_ocr_pool()
+    if job_inprocess_workers > 0:
+        _job_workers = start_workers(job_inprocess_workers, JOB_HANDLERS, discard_job_files)
+    preset_terms = [term for terms in TERMS_LIBRARY.values() for term in terms]
+    card_terms = await db.list_flash_card_terms()
+    add_segmenter_terms(preset_terms + card_terms)
+    add_matcher_terms(card_terms)
+
+    if not get_corpus_index().loaded:
+        # 磁盘上没有语料索引：分页读出全部笔记后重建
+        notes = []
+        page_size = 500
+        while True:
+            page = await db.list_notes(limit=page_size, offset=len(notes))
+            notes.extend((note.id, note.content) for note in page)
+            if len(page) < page_size:
+                break
+        ensure_corpus_index(lambda: notes)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """应用关闭时清理数据库连接"""
+    """应用关闭时停止任务 worker（等待处理中的任务结束），清理数据库连接、PDF 提取与 OCR 进程池"""
+    if _job_workers is not None:
+        stop, threads = _job_workers
+        stop.set()
+        for thread in threads:
+            await run_in_threadpool(thread.join)
     await db.close()
+    shutdown_pdf_pool()
+    shutdown_ocr_pool()
 
 
 if __name__ == "__main__":
@@ -565,16 +783,35 @@ class TaskStatus(str, Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+# 异步任务保存在持久化任务队列中（见 job_queue.py），由 API 进程内的 worker 线程
+# 或独立的 job_worker.py 进程处理；处理函数见 extraction_jobs.py。
+# 任务按客户端公平调度、小文件优先；队列过长时拒绝新任务（429）
 
-# 异步任务存储（内存中，生产环境建议用Redis）
-_task_store: Dict[str, dict] = {}
 
-# 线程池用于CPU密集型任务
-_ocr_executor = ThreadPoolExecutor(max_workers=4)
+def _client_key(request: Request) -> str:
+    """
+    调度与准入控制使用的客户端标识：默认为客户端 IP。
+
+    X-Client-Id 由客户端自行填写，随意更换就能绕过单客户端的任务数上限，
+    只有配置了 JOB_TRUST_CLIENT_ID_HEADER（网关认证后写入该请求头）时才使用
+    """
+    if job_trust_client_id_header:
+        client_id = request.headers.get("x-client-id", "").strip()
+        if client_id:
+            return f"id:{client_id[:128]}"
+    return f"ip:{request.client.host if request.client else ''}"
+
 
-# 配置
-ASYNC_FILE_SIZE_THRESHOLD = 5 * 1024 * 1024  # 5MB
-ASYNC_PAGE_COUNT_THRESHOLD = 10  # 10页
+async def _admit_job(client: str) -> None:
+    """排队与处理中的任务过多（全局或该客户端）时返回 429，并在 Retry-After 中给出建议的等待秒数"""
+    total, own = await run_in_threadpool(get_job_queue().active_counts, client)
+    if 0 < job_max_queue_depth <= total:
+        detail = "任务队列已满，请稍后重试"
+    elif 0 < job_max_client_jobs <= own:
+        detail = f"未完成的任务过多（最多 {job_max_client_jobs} 个），请稍后重试"
+    else:
+        return
+    raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(job_retry_after_seconds)})
 
 
 class AsyncTaskResponse(BaseModel):
@@ -584,71 +821,51 @@ class AsyncTaskResponse(BaseModel):
     message: str
 
 
-class AsyncTaskResult(BaseModel):
-    """异步任务结果"""
+class AsyncTaskSummary(BaseModel):
+    """异步任务摘要（列表默认返回，不含全文与词语）"""
     task_id: str
+    kind: Optional[str] = Field(default=None, description="任务类型：file 单文件，batch 批量上传")
     status: TaskStatus
-    text: Optional[str] = None
-    terms: Optional[List[str]] = None
+    message: Optional[str] = None
+    pages_done: int = 0
+    pages_total: Optional[int] = None
+    # 批量任务：已完成/总文件数，提取失败被跳过的文件
+    files_done: int = 0
+    files_total: Optional[int] = None
+    failed_files: Optional[List[str]] = None
+    # 触发的提取预算（见 NoteExtractResponse.truncated_by）
+    truncated_by: Optional[str] = None
+    # 已提取文本字数与词语数（处理中时为部分结果）
+    text_chars: int = 0
+    term_count: int = 0
     error: Optional[str] = None
+    # 已开始处理的次数（失败后会自动重试，见 JOB_MAX_ATTEMPTS）
+    attempts: int = 0
+    created_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
 
 
-def _create_task(task_id: str, message: str) -> dict:
-    """创建异步任务"""
-    task = {
-        "task_id": task_id,
-        "status": TaskStatus.PENDING,
-        "message": message,
-        "text": None,
-        "terms": None,
-        "error": None,
-        "created_at": datetime.now().isoformat(),
-        "completed_at": None,
-    }
-    _task_store[task_id] = task
-    return task
-
-
-def _update_task(task_id: str, status: TaskStatus, **kwargs):
-    """更新异步任务"""
-    if task_id in _task_store:
-        _task_store[task_id].update({
-            "status": status,
-            **kwargs,
-        })
-        if status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
-            _task_store[task_id]["completed_at"] = datetime.now().isoformat()
+class AsyncTaskResult(AsyncTaskSummary):
+    """异步任务结果；处理中时 text/terms 为已提取部分的文本与规则抽取的初步词语"""
+    # text/terms 是否为处理中的部分结果
+    partial: bool = False
+    text: Optional[str] = None
+    terms: Optional[List[str]] = None
 
 
-async def _process_file_async(task_id: str, filename: str, raw: bytes, max_terms: int):
-    """后台处理文件提取（异步任务）"""
-    try:
-        _update_task(task_id, TaskStatus.PROCESSING, message="正在提取文本...")
-        
-        # 在线程池中运行CPU密集型OCR操作
-        loop = asyncio.get_event_loop()
-        text = await loop.run_in_executor(
-            _ocr_executor,
-            lambda: extract_text_from_upload(filename or "unknown", raw)
-        )
-        
-        _update_task(task_id, TaskStatus.PROCESSING, message="正在提取术语...")
-        
-        # 提取术语
-        terms = await extract_terms_from_note(text, max_terms)
-        
-        _task_store[task_id].update({
-            "status": TaskStatus.COMPLETED,
-            "message": "处理完成",
-            "text": text,
-            "terms": terms,
-        })
-    except Exception as e:
-        _update_task(task_id, TaskStatus.FAILED, error=str(e), message="处理失败")
+class AsyncTaskListResponse(BaseModel):
+    """异步任务分页列表（按创建时间倒序）"""
+    tasks: List[Union[AsyncTaskResult, AsyncTaskSummary]] = Field(
+        ..., description="本页任务；include_results=true 时包含全文与词语"
+    )
+    limit: int
+    offset: int
+    has_more: bool = Field(..., description="是否还有下一页")
 
 
 @app.post("/notes/extract-terms/file/async", response_model=AsyncTaskResponse)
 async def extract_note_terms_file_async(
+    request: Request,
     title: Optional[str] = None,
     max_terms: int = 30,
     file: UploadFile = File(...),
@@ -656,70 +873,212 @@ async def extract_note_terms_file_async(
     """
     异步从笔记文件中抽取待学习词语
     
-    适用于大文件（>5MB或>10页），立即返回任务ID，可通过API查询进度
+    适用于大文件（>5MB或>10页），立即返回任务ID，可通过API查询进度；
+    队列过长时返回 429（见 Retry-After 响应头）
     """
-    task_id = str(uuid.uuid4())[:8]
-    raw = await file.read()
-    file_size = len(raw)
-    
-    # 创建任务
-    _create_task(
-        task_id,
-        f"文件 {file.filename} ({file_size/1024:.1f}KB) 已加入队列"
-    )
-    
-    # 启动后台任务
-    asyncio.create_task(
-        _process_file_async(task_id, file.filename, raw, max_terms)
+    client = _client_key(request)
+    await _admit_job(client)
+    path = await spool_upload(file)
+    file_size = os.path.getsize(path)
+    message = f"文件 {file.filename} ({file_size/1024:.1f}KB) 已加入队列"
+    try:
+        cost = await run_in_threadpool(estimate_job_cost, [(file.filename or "unknown", path)])
+        task_id = await run_in_threadpool(
+            get_job_queue().enqueue,
+            "file",
+            {"filename": file.filename, "path": path, "max_terms": max_terms},
+            {"message": message},
+            client,
+            cost,
+        )
+    except BaseException:
+        discard_upload(path)
+        raise
+
+    return AsyncTaskResponse(task_id=task_id, status=TaskStatus.PENDING, message=message)
+
+
+@app.post("/notes/extract-terms/batch", response_model=AsyncTaskResponse)
+async def extract_note_terms_batch(
+    request: Request,
+    max_terms: int = 30,
+    files: List[UploadFile] = File(...),
+):
+    """
+    批量从多个笔记文件（或 zip 压缩包）中抽取待学习词语
+
+    各文件并行提取文本，按上传顺序（zip 内按文件名）拼接后统一抽取一次词语。
+    立即返回任务ID，通过 /notes/extract-terms/async/{task_id} 查询进度与结果
+    """
+    if len(files) > batch_max_files:
+        raise HTTPException(status_code=400, detail=f"文件过多，一次最多 {batch_max_files} 个")
+    client = _client_key(request)
+    await _admit_job(client)
+
+    uploads: List[BatchItem] = []
+    try:
+        for file in files:
+            uploads.append((file.filename or "unknown", await spool_upload(file)))
+        total_size = sum(os.path.getsize(path) for _, path in uploads)
+        message = f"{len(uploads)} 个文件 ({total_size/1024:.1f}KB) 已加入队列"
+        cost = await run_in_threadpool(estimate_job_cost, uploads)
+        task_id = await run_in_threadpool(
+            get_job_queue().enqueue,
+            "batch",
+            {"uploads": uploads, "max_terms": max_terms},
+            {"message": message},
+            client,
+            cost,
+        )
+    except BaseException:
+        for _, path in uploads:
+            discard_upload(path)
+        raise
+
+    return AsyncTaskResponse(task_id=task_id, status=TaskStatus.PENDING, message=message)
+
+
+def _task_summary(task: dict, include_results: bool = False) -> AsyncTaskSummary:
+    fields = dict(
+        task_id=task["task_id"],
+        kind=task.get("kind"),
+        status=task["status"],
+        message=task.get("message"),
+        pages_done=task.get("pages_done", 0),
+        pages_total=task.get("pages_total"),
+        files_done=task.get("files_done", 0),
+        files_total=task.get("files_total"),
+        failed_files=task.get("failed_files"),
+        truncated_by=task.get("truncated_by"),
+        text_chars=task.get("text_chars", 0),
+        term_count=task.get("term_count", 0),
+        error=task.get("error"),
+        attempts=task.get("attempts", 0),
+        created_at=task.get("created_at"),
+        completed_at=task.get("completed_at"),
     )
-    
-    return AsyncTaskResponse(
-        task_id=task_id,
-        status=TaskStatus.PENDING,
-        message=_task_store[task_id]["message"]
+    if not include_results:
+        return AsyncTaskSummary(**fields)
+    return AsyncTaskResult(
+        **fields,
+        partial=task.get("partial", False),
+        text=task.get("text"),
+        terms=task.get("terms"),
     )
 
 
 @app.get("/notes/extract-terms/async/{task_id}", response_model=AsyncTaskResult)
 async def get_async_task_result(task_id: str):
     """获取异步任务结果"""
-    task = _task_store.get(task_id)
+    task = await run_in_threadpool(get_job_queue().get, task_id)
     
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    return AsyncTaskResult(
-        task_id=task_id,
-        status=task["status"],
-        text=task.get("text"),
-        terms=task.get("terms"),
-        error=task.get("error"),
-    )
+    return _task_summary(task, include_results=True)
 
 
-@app.get("/notes/extract-terms/async", response_model=Dict[str, AsyncTaskResult])
-async def list_async_tasks() -> Dict[str, AsyncTaskResult]:
-    """列出所有异步任务"""
-    return {
-        task_id: AsyncTaskResult(
-            task_id=task_id,
-            status=task["status"],
-            text=task.get("text"),
-            terms=task.get("terms"),
-            error=task.get("error"),
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@app.get("/notes/extract-terms/async/{task_id}/events")
+async def stream_async_task_events(
+    task_id: str,
+    request: Request,
+    include_results: bool = Query(default=False, description="处理中的事件是否包含部分文本与词语"),
+):
+    """
+    以 Server-Sent Events 推送异步任务的状态与进度，代替轮询 /notes/extract-terms/async/{task_id}
+
+    - progress：状态或进度变化时推送任务摘要（include_results 时为含部分结果的完整记录）
+    - done：任务完成或失败时推送完整结果，随后关闭连接
+    - deleted：任务被删除，随后关闭连接
+    长时间没有变化时发送注释行保活
+    """
+    queue = get_job_queue()
+    if await run_in_threadpool(queue.get, task_id, False) is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        # 先订阅再读取，读取之后的变化都会唤醒；订阅时会查询数据库，放到线程池中执行
+        unsubscribe = await run_in_threadpool(
+            queue.events.subscribe, task_id, lambda: loop.call_soon_threadsafe(changed.set)
         )
-        for task_id, task in _task_store.items()
-    }
+        try:
+            last = None
+            while True:
+                changed.clear()
+                task = await run_in_threadpool(queue.get, task_id, include_results)
+                if task is not None and task["status"] in FINISHED and not include_results:
+                    task = await run_in_threadpool(queue.get, task_id)
+                if task is None:
+                    yield _sse("deleted", json.dumps({"task_id": task_id}))
+                    return
+                if task["status"] in FINISHED:
+                    yield _sse("done", _task_summary(task, include_results=True).model_dump_json())
+                    return
+                data = _task_summary(task, include_results).model_dump_json()
+                if data != last:
+                    last = data
+                    yield _sse("progress", data)
+                while True:
+                    try:
+                        await asyncio.wait_for(changed.wait(), timeout=job_event_keepalive_seconds)
+                        break
+                    except asyncio.TimeoutError:
+                        if await request.is_disconnected():
+                            return
+                        yield ": keepalive\n\n"
+        finally:
+            unsubscribe()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/notes/extract-terms/async", response_model=AsyncTaskListResponse)
+async def list_async_tasks(
+    limit: int = Query(default=50, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    status: Optional[List[TaskStatus]] = Query(default=None, description="按状态过滤，可重复"),
+    created_after: Optional[datetime] = Query(default=None, description="只列出该时间之后创建的任务"),
+    created_before: Optional[datetime] = Query(default=None, description="只列出该时间之前创建的任务"),
+    include_results: bool = Query(default=False, description="是否返回全文与词语（默认只返回摘要）"),
+):
+    """分页列出异步任务（新的在前），默认只返回摘要，完整结果请按任务ID查询"""
+    tasks = await run_in_threadpool(
+        get_job_queue().list_jobs,
+        limit + 1,
+        offset,
+        [s.value for s in status] if status else None,
+        created_after.timestamp() if created_after else None,
+        created_before.timestamp() if created_before else None,
+        include_results,
+    )
+    return AsyncTaskListResponse(
+        tasks=[_task_summary(task, include_results) for task in tasks[:limit]],
+        limit=limit,
+        offset=offset,
+        has_more=len(tasks) > limit,
+    )
 
 
 @app.delete("/notes/extract-terms/async/{task_id}")
 async def delete_async_task(task_id: str):
-    """删除已完成的任务"""
-    if task_id not in _task_store:
-        raise HTTPException(status_code=404, detail="任务不存在")
-    
-    if _task_store[task_id]["status"] == TaskStatus.PROCESSING:
+    """删除未在处理中的任务（排队中的任务同时取消，并删除上传的临时文件）"""
+    queue = get_job_queue()
+    task = await run_in_threadpool(queue.delete, task_id)
+    if task is None:
+        if await run_in_threadpool(queue.get, task_id) is None:
+            raise HTTPException(status_code=404, detail="任务不存在")
         raise HTTPException(status_code=400, detail="无法删除正在进行的任务")
-    
-    del _task_store[task_id]
-    return {"message": "任务已删除"}
\ No newline at end of file
+
+    if task["status"] == TaskStatus.PENDING:
+        discard_job_files(task["payload"])
+    return {"message": "任务已删除"}
@@ -0,0 +1,115 @@
+"""
+词条规范化
+
+同一个词条常以不同写法出现："API" / "api" / "ＡＰＩ"、"通貨膨脹" / "通货膨胀"、"<购买力>"。
+闪词卡片按规范化后的词条（normalized_term）去重，数据库中 (note_id, normalized_term) 唯一。
+
+规范化步骤：
+1. NFKC：全角字母数字与标点转半角，兼容字符转标准形式
+2. 去掉首尾的空白、括号、引号与句读标点；内部连续空白合并为一个空格，中文之间的空白去掉
+3. 繁体转简体：安装了 OpenCC 时使用其 t2s 转换，否则使用内置的常用字对照表
+4. 大小写折叠（casefold）
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+
+try:
+    from opencc import OpenCC  # type: ignore
+
+    _opencc = OpenCC("t2s")
+except Exception:  # pragma: no cover - 可选依赖
+    _opencc = None
+
+
+# 首尾需要去掉的标点（NFKC 之后的形式）。不含 # + 等会出现在词条里的符号（C#、C++）
+_EDGE_CHARS = "".join(
+    [
+        " \t\r\n　",
+        "<>()[]{}《》〈〉「」『』【】〔〕",
+        "\"'“”‘’`",
+        ",.;:!?、，。；：！？…·",
+    ]
+)
+_SPACE_RE = re.compile(r"\s+")
+_HAN = r"㐀-䶿一-鿿"
+_HAN_SPACE_RE = re.compile(rf"(?<=[{_HAN}]) (?=[{_HAN}])")
+
+# 常用繁体字 -> 简体字（每项两个字：繁 简）
+_T2S_PAIRS = """
+個个 們们 這这 來来 時时 說说 為为 國国 學学 會会 對对 發发 動动 現现 經经 進进 種种 樣样
+於于 長长 開开 關关 問问 題题 點点 麼么 還还 體体 機机 電电 數数 實实 應应 與与 無无 從从
+後后 當当 將将 義义 產产 業业 員员 見见 間间 頭头 麵面 車车 東东 門门 馬马 魚鱼 鳥鸟 龍龙
+貝贝 頁页 風风 飛飞 語语 論论 議议 讀读 記记 認认 識识 試试 課课 調调 談谈 請请 變变 讓让
+計计 設设 訊讯 證证 評评 詞词 譯译 貨货 幣币 價价 財财 貿贸 資资 費费 購购 貸贷 賬账 賣卖
+買买 質质 負负 責责 賽赛 漲涨 濟济 場场 報报 導导 習习 複复 復复 雜杂 難难 離离 雙双 歲岁
+歷历 曆历 決决 況况 減减 準准 處处 備备 傳传 億亿 優优 僅仅 儲储 網网 絡络 統统 結结 給给
+約约 級级 紀纪 線线 練练 組组 細细 終终 織织 續续 總总 績绩 維维 綜综 緊紧 構构 標标 權权
+檢检 條条 極极 槓杠 樓楼 歸归 氣气 漢汉 潤润 濃浓 測测 滿满 澤泽 灣湾 熱热 營营 爭争 牆墙
+獨独 環环 畫画 療疗 盡尽 監监 盤盘 碼码 確确 礎础 稅税 穩稳 積积 窮穷 競竞 筆笔 節节 範范
+簡简 類类 糧粮 紅红 罰罚 聯联 聲声 聽听 腦脑 臉脸 興兴 舉举 藝艺 藥药 蘭兰 號号 術术 衛卫
+補补 裝装 製制 規规 視视 親亲 覺觉 觀观 訂订 許许 診诊 誤误 誰谁 諾诺 謝谢 護护 讚赞 贊赞
+貧贫 販贩 貢贡 賦赋 賴赖 贏赢 趨趋 軌轨 軍军 軟软 較较 輔辅 輕轻 輸输 轉转 辦办 農农 邊边
+遠远 適适 選选 遺遗 郵邮 鄉乡 醫医 釋释 針针 鋼钢 錄录 錢钱 錯错 鍵键 鎖锁 鏈链 鐵铁 閉闭
+閱阅 闆板 陸陆 陣阵 際际 險险 隨随 隱隐 雖虽 雞鸡 靜静 頂顶 項项 順顺 須须 預预 領领 頻频
+顆颗 顧顾 顯显 飯饭 養养 餘余 館馆 驗验 驅驱 髮发 鬥斗 鬧闹 麥麦 黃黄 齊齐 齒齿 團团 園园
+圖图 圓圆 圍围 壓压 壞坏 夠够 奪夺 奮奋 婦妇 嬰婴 孫孙 寫写 寬宽 尋寻 專专 屬属 層层 嶺岭
+幾几 廠厂 廣广 廢废 彈弹 彙汇 徑径 徵征 態态 慣惯 憶忆 懷怀 戰战 戶户 撥拨 擁拥 擇择 擊击
+擔担 據据 擴扩 攝摄 敗败 敵敌 斷断 昇升 晉晋 暫暂 書书 朧胧 棄弃 樂乐 歐欧 殺杀 殼壳 毀毁
+氫氢 沒没 淚泪 淨净 淺浅 溫温 滅灭 漁渔 潛潜 澀涩 災灾 烏乌 煙烟 燈灯 燒烧 爐炉 牽牵 犧牺
+狀状 猶犹 獎奖 獲获 瑪玛 異异 疊叠 癒愈 盜盗 眾众 衆众 睏困 矯矫 礦矿 禮礼 禍祸 穀谷 窩窝
+築筑 簽签 籌筹 糾纠 紡纺 紙纸 純纯 紛纷 絕绝 絲丝 綠绿 緒绪 編编 緣缘 縣县 縮缩 繩绳 繪绘
+繳缴 罷罢 翹翘 聖圣 聞闻 職职 肅肃 脅胁 脫脱 腳脚 膚肤 膽胆 臨临 臺台 檯台 颱台 舊旧 艱艰
+莊庄 華华 萬万 葉叶 蒼苍 蓋盖 蕭萧 薦荐 薩萨 藍蓝 蘇苏 虛虚 蟲虫 蠶蚕 蠻蛮 衝冲 沖冲 裡里
+裏里 襲袭 覽览 觸触 訴诉 詐诈 該该 詳详 誇夸 誌志 誠诚 誕诞 誘诱 諸诸 謀谋 謂谓 講讲 謙谦
+謠谣 譜谱 譽誉 豐丰 豬猪 貓猫 貪贪 貫贯 貴贵 貶贬 貼贴 賀贺 賊贼 賓宾 賜赐 賞赏 賠赔 賢贤
+賤贱 賺赚 贈赠 贖赎 趕赶 跡迹 踐践 蹤踪 躍跃 軀躯 輛辆 輝辉 輪轮 輯辑 轟轰 辭辞 辯辩 連连
+週周 運运 過过 達达 違违 遞递 遙遥 遜逊 遲迟 遷迁 邏逻 醜丑 醬酱 鈔钞 鈴铃 銀银 銅铜 銷销
+鋒锋 鋪铺 鍋锅 鍛锻 鎮镇 鏡镜 鐘钟 鍾钟 鑄铸 鑑鉴 閃闪 閒闲 閣阁 閥阀 闊阔 闡阐 隊队 階阶
+陽阳 隻只 雲云 霧雾 靈灵 韋韦 韓韩 響响 頓顿 頒颁 頗颇 頸颈 額额 顏颜 願愿 顛颠 飄飘 飢饥
+飲饮 飽饱 飾饰 餅饼 餓饿 饒饶 駐驻 駕驾 騎骑 騙骗 騰腾 驕骄 驚惊 鬆松 魯鲁 鮮鲜 鯨鲸 鳳凤
+鳴鸣 鴨鸭 鴻鸿 鵝鹅 鶴鹤 鷹鹰 鹽盐 麗丽 黨党 齡龄 龜龟 劃划 劑剂 勞劳 勢势 勵励 勸劝 區区
+協协 單单 參参 叢丛 啟启 喚唤 喪丧 嗎吗 嘆叹 噸吨 嚴严 囑嘱 執执 堅坚 塊块 塗涂 塵尘 墜坠
+墳坟 壇坛 壘垒 壩坝 壯壮 壽寿 夢梦 夥伙 奧奥 妝妆 娛娱 媽妈 寧宁 審审 寶宝 屆届 島岛 峽峡
+崗岗 幫帮 帶带 師师 帳帐 庫库 廳厅 張张 強强 彎弯 徹彻 恆恒 惡恶 惱恼 愛爱 慘惨 慮虑 慶庆
+憂忧 憑凭 懇恳 懶懒 懸悬 懼惧 戀恋 戲戏 挾挟 捨舍 掃扫 掛挂 採采 揚扬 換换 揮挥 損损 搖摇
+搶抢 撐撑 撲扑 擋挡 擠挤 擬拟 擾扰 攔拦 攜携 攤摊 敘叙 斂敛 暈晕 暢畅 曉晓 桿杆 棟栋 楊杨
+榮荣 樞枢 橋桥 橫横 檔档 櫃柜 欄栏 歡欢 殘残 殲歼 毆殴 涼凉 淪沦 湧涌 湯汤 溝沟 溼湿 濕湿
+滯滞 滲渗 滾滚 漸渐 潔洁 濁浊 濤涛 濫滥 瀏浏 瀕濒 灘滩 灑洒 爛烂 爺爷 爾尔 狹狭 獄狱 獵猎
+獸兽 獻献 瑣琐 瓊琼 畢毕 癢痒 盞盏 盧卢 碩硕 磚砖 礙碍 祕秘 稱称 穎颖 竄窜 籃篮 籠笼 籤签
+紋纹 納纳 紐纽 紹绍 絨绒 綁绑 綱纲 緩缓 緯纬 緻致 縫缝 縱纵 繞绕 繼继 纖纤 纜缆 羅罗 聰聪
+聳耸 脹胀 膠胶 臟脏 髒脏 艙舱 蓮莲 蔥葱 蔔卜 薑姜 蘋苹 蘆芦 蘿萝 虧亏 蝦虾 蝕蚀 蠟蜡 褲裤
+襯衬 覓觅 訓训 託托 訪访 註注 詢询 詩诗 話话 詭诡 誼谊 諒谅 諧谐 諮咨 謊谎 謹谨 譴谴 豎竖
+賄贿 賭赌 載载 輿舆 轄辖 迴回 遊游 邁迈 鄭郑 鄰邻 醞酝 釀酿 鈍钝 鉛铅 鉤钩 鋁铝 錦锦 錶表
+鎊镑 鑰钥 鑽钻 閘闸 闖闯 陰阴 陳陈 隸隶 頌颂 頑顽 顫颤 飼饲 餃饺 馴驯 駁驳 駛驶 驟骤 驢驴
+鬍胡 鬚须 鬱郁 鯉鲤 鴉鸦 鴿鸽 鵬鹏 鸚鹦 鹼碱 黴霉 齋斋 龐庞 脈脉 鏽锈
+"""
+
+_T2S_TABLE = str.maketrans({pair[0]: pair[1] for pair in _T2S_PAIRS.split()})
+
+
+def to_simplified(text: str) -> str:
+    """繁体转简体"""
+    if _opencc is not None:
+        return _opencc.convert(text)
+    return text.translate(_T2S_TABLE)
+
+
+def clean_term(term: str) -> str:
+    """
+    用于展示与存储的词条：NFKC、去掉首尾标点与空白、合并内部空白。
+    保留原有的大小写与繁简写法。
+    """
+    text = unicodedata.normalize("NFKC", term)
+    text = _SPACE_RE.sub(" ", text).strip(_EDGE_CHARS)
+    return _HAN_SPACE_RE.sub("", text)
+
+
+def normalize_term(term: str) -> str:
+    """用于去重的规范形式；结果为空字符串表示不是有效词条"""
+    return to_simplified(clean_term(term)).casefold()
+
+
+__all__ = ["clean_term", "normalize_term", "to_simplified"]
@@ -8,9 +8,9 @@ from typing import List
 from langchain_core.messages import HumanMessage, SystemMessage
 
 try:
-    from .llm import get_default_llm
+    from .llm import get_default_llm, invoke_llm
 except ImportError:
-    from llm import get_default_llm
+    from llm import get_default_llm, invoke_llm
 
 
 TERMS_GENERATION_PROMPT = """你是一位专业的教育内容生成助手。你的任务是根据用户提供的主题，生成该主题下最核心、最重要的10-15个专业术语或概念。
@@ -66,7 +66,7 @@ def generate_terms_for_topic(topic: str) -> List[str]:
     ]
     
     try:
-        response = llm.invoke(messages)
+        response = invoke_llm(llm, messages, call_site="terms_generator")
         content = response.content.strip()
         
         # 尝试提取 JSON
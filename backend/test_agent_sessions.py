@@ -0,0 +1,98 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, StateGraph
+
+from agent_sessions import (
+    AgentSessionStore,
+    SessionRegistry,
+    SessionState,
+    SQLiteCheckpointSaver,
+    compact_history,
+    _sqlite_executor,
+)
+
+
+def _build_echo_graph(max_tokens: int):
+    """不依赖 LLM 的测试图：compact -> echo"""
+    seen_prompt_sizes = []
+
+    def compact(state: SessionState):
+        return compact_history(state["messages"], state.get("summary", ""), max_tokens) or {}
+
+    def echo(state: SessionState):
+        seen_prompt_sizes.append(len(state["messages"]))
+        return {"messages": [AIMessage(content="收到：" + state["messages"][-1].content)]}
+
+    graph = StateGraph(SessionState)
+    graph.add_node("compact", compact)
+    graph.add_node("echo", echo)
+    graph.set_entry_point("compact")
+    graph.add_edge("compact", "echo")
+    graph.add_edge("echo", END)
+    return graph, seen_prompt_sizes
+
+
+def test_session_history_persists_across_savers(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    graph, _ = _build_echo_graph(max_tokens=10_000)
+    config = {"configurable": {"thread_id": "curious_student:s1:通货膨胀"}}
+
+    app = graph.compile(checkpointer=SQLiteCheckpointSaver(db_path))
+    app.invoke({"messages": [HumanMessage(content="第一轮")]}, config)
+
+    # 模拟服务重启：新的 saver 实例读取同一个文件
+    app = graph.compile(checkpointer=SQLiteCheckpointSaver(db_path))
+    result = app.invoke({"messages": [HumanMessage(content="第二轮")]}, config)
+    assert [m.content for m in result["messages"]] == ["第一轮", "收到：第一轮", "第二轮", "收到：第二轮"]
+
+    other = app.invoke({"messages": [HumanMessage(content="另一张卡片")]}, {"configurable": {"thread_id": "x"}})
+    assert len(other["messages"]) == 2
+
+
+def test_session_history_stays_within_budget(tmp_path):
+    saver = SQLiteCheckpointSaver(str(tmp_path / "sessions.db"))
+    graph, prompt_sizes = _build_echo_graph(max_tokens=200)
+    app = graph.compile(checkpointer=saver)
+    config = {"configurable": {"thread_id": "simple_explainer:s1:"}}
+
+    for i in range(60):
+        app.invoke({"messages": [HumanMessage(content=f"第{i}轮解释：需求增加导致价格上涨")]}, config)
+
+    # 历史被截断后每轮发送给模型的消息数保持稳定
+    assert max(prompt_sizes[20:]) == max(prompt_sizes[-10:])
+    assert max(prompt_sizes) < 20
+    # checkpoint 不随轮数增长
+    count = saver._conn.execute("SELECT COUNT(*) FROM agent_checkpoints").fetchone()[0]
+    assert count <= 2
+
+
+def test_idle_sessions_expire(tmp_path):
+    saver = SQLiteCheckpointSaver(str(tmp_path / "sessions.db"))
+    store = AgentSessionStore(saver, SessionRegistry(_sqlite_executor(saver)), ttl_seconds=60)
+    graph, _ = _build_echo_graph(max_tokens=10_000)
+    app = graph.compile(checkpointer=saver)
+
+    config = store.open("curious_student", "s1", "GDP")
+    app.invoke({"messages": [HumanMessage(content="你好")]}, config)
+    assert saver.get_tuple(config) is not None
+
+    assert store.expire_idle(now=0) == 0
+    assert store.expire_idle(now=10**12) == 1
+    assert saver.get_tuple(config) is None
+
+
+def test_session_id_cannot_contain_separator(tmp_path):
+    saver = SQLiteCheckpointSaver(str(tmp_path / "sessions.db"))
+    store = AgentSessionStore(saver, SessionRegistry(_sqlite_executor(saver)), ttl_seconds=60)
+
+    # "a:b" + "c" 与 "a" + "b:c" 会拼出同一个线程键
+    with pytest.raises(ValueError):
+        store.open("curious_student", "a:b", "c")
+    config = store.open("curious_student", "a", "b:c")
+    assert config["configurable"]["thread_id"] == "curious_student:a:b:c"
+
+    from fastapi.testclient import TestClient
+    from server import app
+
+    response = TestClient(app).post("/agents/curious-student", json={"text": "你好", "session_id": "a:b"})
+    assert response.status_code == 422
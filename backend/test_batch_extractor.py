@@ -0,0 +1,147 @@
+import os
+import zipfile
+
+import pytest
+
+import batch_extractor
+import file_text_extractor
+import note_terms_extractor
+import ocr_pool
+from batch_extractor import expand_uploads, iter_batch_texts, join_batch_texts
+from note_terms_extractor import extract_terms_from_long_note, split_note_chunks
+
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def _make_zip(path, members):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return str(path)
+
+
+def test_zip_expanded_in_natural_order(tmp_path):
+    archive = _make_zip(
+        tmp_path / "notes.zip",
+        [
+            ("slides/10.txt", "ten"),
+            ("slides/2.txt", "two"),
+            ("slides/", ""),
+            ("__MACOSX/slides/._2.txt", "junk"),
+            ("slides/.DS_Store", "junk"),
+            ("../evil/1.txt", "one"),
+        ],
+    )
+    first = _write(tmp_path / "first.txt", b"first")
+    items = expand_uploads([("first.txt", first), ("notes.zip", archive)])
+    try:
+        # zip 内文件按自然顺序排在原位置，压缩包里的路径不影响临时文件位置
+        assert [name for name, _ in items] == ["first.txt", "1.txt", "2.txt", "10.txt"]
+        assert not os.path.exists(archive)
+        for _, path in items[1:]:
+            assert os.path.dirname(path) != str(tmp_path / "evil")
+        assert open(items[3][1]).read() == "ten"
+    finally:
+        for _, path in items:
+            os.unlink(path)
+
+
+def test_zip_kept_when_not_discarding_archives(tmp_path):
+    archive = _make_zip(tmp_path / "notes.zip", [("1.txt", "one")])
+    items = expand_uploads([("notes.zip", archive)], discard_archives=False)
+    try:
+        # 任务重试时需要重新展开，原 zip 保留
+        assert os.path.exists(archive) and [name for name, _ in items] == ["1.txt"]
+    finally:
+        for _, path in items:
+            os.unlink(path)
+
+
+def test_zip_limits(tmp_path, monkeypatch):
+    archive = _make_zip(tmp_path / "many.zip", [(f"{i}.txt", "x") for i in range(5)])
+    with pytest.raises(ValueError, match="过多"):
+        expand_uploads([("many.zip", archive)], max_files=3)
+
+    # 解压后的实际大小超过上限（高压缩比的 zip 炸弹）
+    monkeypatch.setattr(batch_extractor, "upload_max_bytes", 1024)
+    bomb = _make_zip(tmp_path / "bomb.zip", [("big.txt", "0" * 100_000)])
+    assert os.path.getsize(bomb) < 1024
+    with pytest.raises(ValueError, match="过大"):
+        expand_uploads([("bomb.zip", bomb)])
+
+    with pytest.raises(ValueError, match="zip"):
+        expand_uploads([("broken.zip", _write(tmp_path / "broken.zip", b"not a zip"))])
+
+
+def test_batch_texts_joined_in_upload_order(tmp_path):
+    items = [
+        ("a.txt", _write(tmp_path / "a.txt", "第一份讲义".encode("utf-8"))),
+        ("b.doc", _write(tmp_path / "b.doc", b"legacy")),
+        ("c.md", _write(tmp_path / "c.md", "第三份讲义".encode("utf-8"))),
+    ]
+    results = list(iter_batch_texts(items, workers=3))
+    assert sorted(r.index for r in results) == [0, 1, 2]
+
+    failed = [r for r in results if r.error is not None]
+    assert [r.filename for r in failed] == ["b.doc"] and failed[0].text is None
+    assert join_batch_texts(results) == "第一份讲义\n\n第三份讲义"
+
+
+def test_batch_images_ocr_together(tmp_path, monkeypatch):
+    cv2 = pytest.importorskip("cv2")
+    import numpy as np
+
+    items = []
+    for i in range(5):
+        ok, encoded = cv2.imencode(".png", np.full((8, 6 + i, 3), i, dtype=np.uint8))
+        assert ok
+        items.append((f"{i}.png", _write(tmp_path / f"{i}.png", encoded.tobytes())))
+    items.insert(2, ("notes.txt", _write(tmp_path / "notes.txt", "讲义".encode("utf-8"))))
+    items.append(("broken.png", _write(tmp_path / "broken.png", b"not an image")))
+
+    batches = []
+
+    def fake_ocr(images):
+        batches.append(len(images))
+        return [f"width {img.shape[1]}" for img in images]
+
+    monkeypatch.setattr(ocr_pool, "ocr_workers", 0)
+    monkeypatch.setattr(file_text_extractor, "_ocr_images", fake_ocr)
+    results = sorted(iter_batch_texts(items, workers=2, batch_size=3), key=lambda r: r.index)
+    # 图片按上传顺序每 3 张一个 OCR 任务，无法解码的图片单独报错，不影响同批其他图片
+    assert sorted(batches) == [2, 3]
+    assert [r.text for r in results] == ["width 6", "width 7", "讲义", "width 8", "width 9", "width 10", None]
+    assert results[-1].error == "无法解析图片文件"
+
+    # 再次上传时命中缓存，不再 OCR
+    batches.clear()
+    assert [r.text for r in iter_batch_texts(items[:2], workers=1)] == ["width 6", "width 7"]
+    assert batches == []
+
+
+def test_split_note_chunks():
+    paragraphs = ["甲" * 30, "乙" * 30, "丙" * 30, "丁" * 100]
+    chunks = split_note_chunks("\n\n".join(paragraphs), 70)
+    assert chunks == ["甲" * 30 + "\n\n" + "乙" * 30, "丙" * 30, "丁" * 70, "丁" * 30]
+    assert split_note_chunks("短文本", 70) == ["短文本"]
+
+
+def test_long_note_terms_merged_across_chunks(monkeypatch):
+    calls = []
+
+    def fake_extract(text, max_terms=30, known_terms=None):
+        calls.append(text)
+        return {"A": ["共同", "甲词"], "B": ["乙词", "共同"]}[text[0]]
+
+    monkeypatch.setattr(note_terms_extractor, "extract_terms_from_note", fake_extract)
+    text = "A" * 50 + "\n\n" + "B" * 50
+    # 在多个块中都出现的词排在前面，其余按块内排名
+    assert extract_terms_from_long_note(text, max_terms=2, chunk_chars=60) == ["共同", "乙词"]
+    assert len(calls) == 2
+
+    calls.clear()
+    extract_terms_from_long_note(text, max_terms=2, chunk_chars=0)
+    assert calls == [text]
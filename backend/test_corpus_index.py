@@ -0,0 +1,136 @@
+import multiprocessing
+import os
+
+import pytest
+
+import corpus_index
+import word_segmenter
+from corpus_index import CorpusIndex
+from note_terms_extractor import _heuristic_extract_terms, ensure_corpus_index, index_note, unindex_note
+from word_segmenter import WordSegmenter, build_dictionary
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    idx = CorpusIndex(str(tmp_path / "corpus_index.bin"))
+    monkeypatch.setattr(corpus_index, "_index", idx)
+    seg = WordSegmenter(build_dictionary(["通货膨胀", "货币政策", "边际效用"], str(tmp_path / "segmenter.dict")))
+    monkeypatch.setattr(word_segmenter, "_segmenter", seg)
+    yield idx
+    idx.close()
+
+
+def test_incremental_document_frequency(index):
+    index.set_note("n1", ["通货膨胀", "货币政策", "通货膨胀"])
+    index.set_note("n2", ["通货膨胀", "边际效用"])
+    assert index.note_count == 2
+    assert index.df("通货膨胀") == 2
+    assert index.average_length == 2.5
+
+    # 修改笔记：旧词的计数被撤销
+    index.set_note("n1", ["边际效用"])
+    assert index.df("通货膨胀") == 1
+    assert index.df("货币政策") == 0
+    assert index.df("边际效用") == 2
+
+    index.remove_note("n2")
+    assert index.note_count == 1
+    assert index.df("通货膨胀") == 0
+    assert index.idf("边际效用") < index.idf("从未出现")
+
+
+def test_snapshot_and_journal_reload(index):
+    index.rebuild({"n1": ["a", "b"], "n2": ["b", "c"]})
+    index.set_note("n3", ["c", "d"])
+    index.remove_note("n1")
+    index.close()
+
+    reloaded = CorpusIndex(index.path)
+    assert reloaded.load()
+    assert reloaded.note_count == 2
+    assert [reloaded.df(t) for t in "abcd"] == [0, 1, 2, 1]
+    assert reloaded.average_length == 2.0
+
+    # 合并进快照后再次加载结果不变，已无引用的词被回收
+    with reloaded._lock:
+        reloaded._write_snapshot()
+    again = CorpusIndex(index.path)
+    assert again.load()
+    assert [again.df(t) for t in "abcd"] == [0, 1, 2, 1]
+    assert "a" not in again._vocab
+    reloaded.close()
+    again.close()
+
+    assert not CorpusIndex(str(index.path) + ".missing").load()
+
+
+def test_instances_sharing_files_stay_consistent(index, monkeypatch):
+    # 两个实例模拟两个 worker 进程：各自的修改互相可见，合并快照时不丢失对方追加的日志
+    monkeypatch.setattr(corpus_index, "_COMPACT_THRESHOLD", 3)
+    other = CorpusIndex(index.path)
+    other.load()
+    index.set_note("n1", ["a", "b"])
+    other.set_note("n2", ["b", "c"])
+    index.set_note("n3", ["c"])  # 日志达到 3 条，合并进快照
+    assert not os.path.exists(index.journal_path)
+    other.remove_note("n1")
+    other.set_note("n4", ["d"])
+
+    for idx in (index, other):
+        idx.refresh()
+        assert idx.note_count == 3
+        assert [idx.df(t) for t in "abcd"] == [0, 1, 2, 1]
+    reloaded = CorpusIndex(index.path)
+    assert reloaded.load()
+    assert [reloaded.df(t) for t in "abcd"] == [0, 1, 2, 1]
+
+
+def _index_notes(path, prefix, count):
+    idx = CorpusIndex(path)
+    idx.load()
+    for i in range(count):
+        idx.set_note(f"{prefix}{i}", ["共享", prefix])
+
+
+def test_concurrent_processes_keep_every_update(tmp_path):
+    path = str(tmp_path / "corpus_index.bin")
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=_index_notes, args=(path, prefix, 600)) for prefix in ("x", "y", "z")]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=120)
+        assert process.exitcode == 0
+
+    # 1800 条修改跨过了合并阈值，合并快照不会丢掉其他进程的日志
+    idx = CorpusIndex(path)
+    assert idx.load()
+    assert idx.note_count == 1800
+    assert idx.df("共享") == 1800
+    assert [idx.df(prefix) for prefix in "xyz"] == [600, 600, 600]
+
+
+def test_ensure_rebuilds_only_when_missing(index):
+    calls = []
+
+    def load_notes():
+        calls.append(1)
+        return [("n1", "通货膨胀与货币政策"), ("n2", "通货膨胀")]
+
+    ensure_corpus_index(load_notes)
+    assert index.note_count == 2 and index.df("通货膨胀") == 2
+    ensure_corpus_index(load_notes)
+    assert len(calls) == 1
+
+
+def test_idf_demotes_corpus_wide_words(index):
+    for i in range(20):
+        index_note(f"n{i}", "Python 是一门语言，本节介绍 Python 的用法。")
+    note = "Python 代码里的 decorator 用于包装函数，decorator 可以叠加。Python 很常用。"
+    index_note("target", note)
+
+    terms = _heuristic_extract_terms(note, max_terms=5)
+    assert terms.index("decorator") < terms.index("Python")
+
+    unindex_note("target")
+    assert index.note_count == 20
@@ -0,0 +1,138 @@
+import zipfile
+
+import pytest
+
+from document_parsers import html_to_text, iter_epub_sections, iter_html_sections, iter_pptx_sections
+from file_text_extractor import TextChunk, extract_text_from_upload, iter_text_from_upload
+
+A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+P = "http://schemas.openxmlformats.org/presentationml/2006/main"
+R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+
+def _shape(paragraphs, placeholder=None):
+    ph = f'<p:nvPr><p:ph type="{placeholder}"/></p:nvPr>' if placeholder else "<p:nvPr/>"
+    body = "".join(f"<a:p><a:r><a:t>{text}</a:t></a:r></a:p>" for text in paragraphs)
+    return f'<p:sp><p:nvSpPr><p:cNvPr id="1" name="s"/><p:cNvSpPr/>{ph}</p:nvSpPr><p:txBody>{body}</p:txBody></p:sp>'
+
+
+def _slide(shapes, root="p:sld"):
+    return (
+        f'<{root} xmlns:a="{A}" xmlns:p="{P}" xmlns:r="{R}"><p:cSld><p:spTree>'
+        + "".join(shapes)
+        + f"</p:spTree></p:cSld></{root}>"
+    )
+
+
+def _rels(*targets):
+    items = "".join(f'<Relationship Id="rId{i}" Type="{R}/{kind}" Target="{target}"/>' for i, (kind, target) in enumerate(targets, 1))
+    return f'<Relationships xmlns="{REL}">{items}</Relationships>'
+
+
+def _make_pptx(path):
+    with zipfile.ZipFile(path, "w") as z:
+        # 放映顺序与文件名顺序不同
+        z.writestr(
+            "ppt/presentation.xml",
+            f'<p:presentation xmlns:p="{P}" xmlns:r="{R}"><p:sldIdLst>'
+            '<p:sldId id="256" r:id="rId2"/><p:sldId id="257" r:id="rId1"/></p:sldIdLst></p:presentation>',
+        )
+        z.writestr("ppt/_rels/presentation.xml.rels", _rels(("slide", "slides/slide1.xml"), ("slide", "slides/slide2.xml")))
+        z.writestr("ppt/slides/slide1.xml", _slide([_shape(["第二页 光合作用"])]))
+        z.writestr("ppt/slides/slide2.xml", _slide([_shape(["第一页 标题", "细胞呼吸"])]))
+        z.writestr("ppt/slides/_rels/slide2.xml.rels", _rels(("notesSlide", "../notesSlides/notesSlide1.xml")))
+        z.writestr(
+            "ppt/notesSlides/notesSlide1.xml",
+            _slide([_shape(["讲解时强调线粒体"], "body"), _shape(["1"], "sldNum")], root="p:notes"),
+        )
+    return path
+
+
+def _make_epub(path):
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("mimetype", "application/epub+zip")
+        z.writestr(
+            "META-INF/container.xml",
+            '<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+            '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles></container>',
+        )
+        z.writestr(
+            "OEBPS/content.opf",
+            '<package xmlns="http://www.idpf.org/2007/opf"><manifest>'
+            '<item id="c1" href="text/ch%201.xhtml" media-type="application/xhtml+xml"/>'
+            '<item id="c2" href="text/ch2.xhtml" media-type="application/xhtml+xml"/>'
+            '<item id="css" href="style.css" media-type="text/css"/>'
+            '</manifest><spine><itemref idref="c2"/><itemref idref="c1"/></spine></package>',
+        )
+        z.writestr("OEBPS/text/ch2.xhtml", "<html><body><h1>第一章</h1><p>牛顿第一定律</p></body></html>")
+        z.writestr("OEBPS/text/ch 1.xhtml", "<html><body><h1>第二章</h1><p>动量守恒</p></body></html>")
+        z.writestr("OEBPS/style.css", "h1 { color: red }")
+    return path
+
+
+def test_pptx_slides_in_presentation_order_with_notes(tmp_path):
+    path = _make_pptx(tmp_path / "deck.pptx")
+    sections = list(iter_pptx_sections(str(path)))
+    assert sections == [
+        (0, "第一页 标题\n细胞呼吸\n讲解时强调线粒体", 2),
+        (1, "第二页 光合作用", 2),
+    ]
+    # bytes 输入同样可以解析
+    assert list(iter_pptx_sections(path.read_bytes())) == sections
+
+
+def test_epub_chapters_in_spine_order(tmp_path):
+    path = _make_epub(tmp_path / "book.epub")
+    assert list(iter_epub_sections(str(path))) == [
+        (0, "第一章\n牛顿第一定律", 2),
+        (1, "第二章\n动量守恒", 2),
+    ]
+
+
+def test_html_to_text():
+    markup = """<html><head><title>忽略</title><style>p {}</style></head><body>
+    <script>var x = 1;</script>
+    <h2>向量</h2><p>向量有  大小
+    和方向</p><ul><li>加法</li><li>数乘 &amp; 点积</li></ul><pre>a  b\n c</pre></body></html>"""
+    assert html_to_text(markup) == "向量\n向量有 大小 和方向\n加法\n数乘 & 点积\na  b\n c"
+
+
+def test_html_encoding_sniffed_and_parsed_incrementally(tmp_path, monkeypatch):
+    import document_parsers
+
+    monkeypatch.setattr(document_parsers, "_HTML_CHUNK", 7)
+    body = "<p>" + "电磁感应" * 20 + "</p>"
+    gbk = tmp_path / "gbk.htm"
+    gbk.write_bytes(('<meta charset="gb2312">' + body).encode("gbk"))
+    assert list(iter_html_sections(str(gbk))) == [(0, "电磁感应" * 20, 1)]
+
+    # 没有声明编码、也不是 UTF-8 时按 GB18030
+    undeclared = tmp_path / "plain.html"
+    undeclared.write_bytes(body.encode("gb18030"))
+    assert list(iter_html_sections(str(undeclared)))[0][1] == "电磁感应" * 20
+
+    # UTF-8 多字节字符被块边界截断
+    assert list(iter_html_sections(body.encode("utf-8")))[0][1] == "电磁感应" * 20
+
+
+def test_upload_pipeline_streams_and_caches(tmp_path):
+    path = _make_pptx(tmp_path / "deck.pptx")
+    chunks = list(iter_text_from_upload("deck.pptx", str(path)))
+    assert [(c.index, c.done, c.total) for c in chunks] == [(0, 1, 2), (1, 2, 2)]
+
+    text = extract_text_from_upload("deck.pptx", str(path))
+    assert text.index("第一页 标题") < text.index("第二页 光合作用")
+    assert list(iter_text_from_upload("deck.pptx", str(path))) == [TextChunk(0, text, 2, 2)]
+
+
+def test_invalid_documents_raise_value_error(tmp_path):
+    broken = tmp_path / "broken.pptx"
+    broken.write_bytes(b"not a zip")
+    with pytest.raises(ValueError):
+        extract_text_from_upload("broken.pptx", str(broken))
+
+    empty = tmp_path / "empty.html"
+    empty.write_bytes(b"<html><script>only()</script></html>")
+    with pytest.raises(ValueError, match="提取到文本"):
+        extract_text_from_upload("empty.html", str(empty))
@@ -0,0 +1,79 @@
+import os
+import time
+
+import pytest
+
+import extraction_cache
+import file_text_extractor
+import ocr_pool
+from extraction_cache import ExtractionCache, cache_key, digest_source
+from file_text_extractor import extract_text_from_upload
+from metrics import registry, render_metrics
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ExtractionCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    monkeypatch.setattr(extraction_cache, "_cache", cache)
+    registry.reset()
+    return cache
+
+
+def test_put_get_roundtrip(cache, tmp_path):
+    path = tmp_path / "upload.bin"
+    path.write_bytes(b"same content")
+    # 路径与 bytes 的哈希一致
+    digest = digest_source(str(path))
+    assert digest == digest_source(b"same content")
+    key = cache_key(digest, "pdf", "easyocr")
+    assert key != cache_key(digest, "pdf", "tesseract")
+
+    assert cache.get("document", key) is None
+    cache.put("document", key, "通货膨胀")
+    assert cache.get("document", key) == "通货膨胀"
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"), max_bytes=1000)
+    for i in range(3):
+        cache.put("document", f"k{i}", "x" * 300)
+        # mtime 精度有限，拉开写入时间
+        os.utime(cache._path("document", f"k{i}"), (time.time() - 100 + i, time.time() - 100 + i))
+    # 访问 k0，使其成为最近使用
+    assert cache.get("document", "k0") is not None
+    cache.put("document", "k3", "x" * 300)
+
+    assert cache.get("document", "k1") is None
+    assert cache.get("document", "k0") is not None
+    assert cache.get("document", "k3") is not None
+    assert cache._scan_total() <= 1000
+
+
+def test_repeat_upload_skips_parsing(cache, tmp_path, monkeypatch):
+    cv2 = pytest.importorskip("cv2")
+    import numpy as np
+
+    ok, encoded = cv2.imencode(".png", np.zeros((8, 6, 3), dtype=np.uint8))
+    assert ok
+    image = tmp_path / "slide.png"
+    image.write_bytes(encoded.tobytes())
+
+    calls = []
+    monkeypatch.setattr(ocr_pool, "ocr_workers", 0)
+    monkeypatch.setattr(file_text_extractor, "_ocr_images", lambda images: calls.extend(images) or ["需求曲线"])
+    assert extract_text_from_upload("slide.png", str(image)) == "需求曲线"
+    # 同样内容以 bytes 再次上传：命中缓存，不再解码与 OCR
+    assert extract_text_from_upload("other.png", image.read_bytes()) == "需求曲线"
+    assert len(calls) == 1
+
+    text = render_metrics()
+    assert 'cache_requests_total{cache="extracted_text",result="miss"} 1' in text
+    assert 'cache_requests_total{cache="extracted_text",result="hit"} 1' in text
+
+
+def test_disabled_cache(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"), max_bytes=0)
+    assert not cache.enabled
+    cache.put("document", "k", "text")
+    assert cache.get("document", "k") is None
+    assert not (tmp_path / "cache").exists()
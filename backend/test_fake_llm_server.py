@@ -0,0 +1,70 @@
+"""
+假 LLM 服务冒烟测试
+
+- 按 system prompt 返回各调用方约定格式的 JSON
+- 流式响应与 usage 分片
+- 错误注入
+"""
+
+import json
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_llm_server import FakeLLMConfig, LatencyModel, create_app
+from system_prompt import curious_student_agent_system_prompt
+
+
+def _client(**kwargs) -> TestClient:
+    return TestClient(create_app(FakeLLMConfig(latency=LatencyModel.parse("fixed:0"), seed=1, **kwargs)))
+
+
+def test_chat_completion_follows_caller_format():
+    client = _client()
+    assert client.get("/v1/models").json()["data"][0]["id"] == "fake-model"
+
+    response = client.post(
+        "/v1/chat/completions",
+        json={
+            "model": "fake-model",
+            "messages": [
+                {"role": "system", "content": "你会收到一段用户笔记，请抽取术语"},
+                {"role": "user", "content": "最多返回 5 个。笔记：通货膨胀与货币政策 Gradient Descent"},
+            ],
+        },
+    )
+    body = response.json()
+    terms = json.loads(body["choices"][0]["message"]["content"])["terms"]
+    assert 0 < len(terms) <= 5
+    assert "Gradient" in terms
+    assert body["usage"]["total_tokens"] == body["usage"]["prompt_tokens"] + body["usage"]["completion_tokens"]
+
+
+def test_streaming_completion_with_usage():
+    client = _client()
+    response = client.post(
+        "/v1/chat/completions",
+        json={
+            "stream": True,
+            "stream_options": {"include_usage": True},
+            "messages": [
+                {"role": "system", "content": curious_student_agent_system_prompt},
+                {"role": "user", "content": "通货膨胀是指货币的购买力下降"},
+            ],
+        },
+    )
+    events = [line[len("data: "):] for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    content = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+    assert '"status": "confused"' in content
+    assert chunks[-1]["usage"]["completion_tokens"] > 0
+
+
+def test_injected_errors():
+    client = _client(error_rate=1.0, error_status=429)
+    response = client.post("/v1/chat/completions", json={"messages": [{"role": "user", "content": "你好"}]})
+    assert response.status_code == 429
@@ -0,0 +1,408 @@
+import os
+import threading
+import time
+
+import pytest
+
+import extraction_jobs
+from job_queue import (
+    COMPLETED,
+    FAILED,
+    PENDING,
+    PROCESSING,
+    JobQueue,
+    JobWorker,
+    LeaseLost,
+    _sqlite_executor,
+    _table_columns,
+)
+
+
+def _queue(tmp_path, **kwargs):
+    tmp_path.mkdir(exist_ok=True)
+    kwargs.setdefault("retry_backoff", 0)
+    kwargs.setdefault("result_dir", str(tmp_path / "results"))
+    return JobQueue(_sqlite_executor(str(tmp_path / "jobs.db")), **kwargs)
+
+
+def test_enqueue_claim_complete_visible_across_connections(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.enqueue("file", {"path": "/tmp/x"}, {"message": "已加入队列"})
+
+    # 另一个进程（另一条连接）也能看到任务
+    other = _queue(tmp_path)
+    assert other.get(job_id)["status"] == PENDING
+    assert other.get(job_id)["message"] == "已加入队列"
+
+    job = queue.claim("w1", ["file"])
+    assert job["task_id"] == job_id and job["status"] == PROCESSING and job["attempts"] == 1
+    assert other.claim("w2") is None
+
+    queue.heartbeat(job_id, "w1", {"message": "处理中", "pages_done": 1})
+    assert other.get(job_id)["pages_done"] == 1
+    queue.complete(job_id, "w1", {"message": "处理完成", "terms": ["牛顿"]})
+
+    done = other.get(job_id)
+    assert done["status"] == COMPLETED and done["terms"] == ["牛顿"] and done["completed_at"]
+    assert [job["task_id"] for job in other.list_jobs()] == [job_id]
+    assert other.delete(job_id)["task_id"] == job_id
+    assert other.get(job_id) is None
+
+
+def test_old_table_migrated(tmp_path):
+    # 旧版本创建的表：没有调度、访问时间、结果列与结果转存相关的列
+    execute = _sqlite_executor(str(tmp_path / "jobs.db"))
+    execute(
+        """
+        CREATE TABLE extraction_jobs (
+            id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL,
+            state TEXT NOT NULL, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL,
+            available_at DOUBLE PRECISION NOT NULL, lease_owner TEXT, lease_expires_at DOUBLE PRECISION,
+            created_at DOUBLE PRECISION NOT NULL, updated_at DOUBLE PRECISION NOT NULL,
+            completed_at DOUBLE PRECISION
+        )
+        """,
+        (),
+    )
+    execute(
+        "INSERT INTO extraction_jobs (id, kind, payload, status, state, max_attempts, available_at, "
+        "created_at, updated_at, completed_at) VALUES ('old', 'file', '{}', ?, ?, 3, 1, 1, 1, 2)",
+        (COMPLETED, '{"message": "处理完成", "text": "旧结果"}'),
+    )
+
+    queue = JobQueue(execute, result_dir=str(tmp_path / "results"), result_ttl=0, max_finished=1)
+    assert {"client", "cost", "accessed_at", "result_bytes", "result_path", "result"} <= _table_columns(execute)
+    # 按客户端调度的索引在补充列之后创建
+    assert execute("SELECT 1 FROM pragma_index_list('extraction_jobs') WHERE name = 'idx_extraction_jobs_client'", ())
+    # 旧记录回填访问时间与结果大小，照常读取与淘汰
+    assert execute("SELECT accessed_at, result_bytes > 0 FROM extraction_jobs WHERE id = 'old'", ()) == [(2.0, 1)]
+    assert queue.get("old")["text"] == "旧结果"
+    assert queue.list_jobs(with_results=True)[0]["text"] == "旧结果"
+    new_id = queue.enqueue("file", {}, client="10.0.0.1", cost=0.5)
+    assert queue.active_counts("10.0.0.1") == (1, 1)
+    queue.complete(queue.claim("w1")["task_id"], "w1", {"text": "新结果"})
+    assert queue.purge() == 1 and queue.get("old") is None and queue.get(new_id)["text"] == "新结果"
+
+    # 再次启动时不重复补充
+    JobQueue(execute, result_dir=str(tmp_path / "results"))
+
+
+def test_claim_filters_kinds_and_processing_not_deleted(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.enqueue("batch", {})
+    assert queue.claim("w1", ["file"]) is None
+    assert queue.claim("w1", ["batch"])["task_id"] == job_id
+    assert queue.delete(job_id) is None
+
+
+def test_expired_lease_reclaimed_and_old_owner_loses(tmp_path):
+    queue = _queue(tmp_path, lease_seconds=0.05)
+    job_id = queue.enqueue("file", {})
+    queue.claim("w1")
+    assert queue.claim("w2") is None
+
+    time.sleep(0.1)
+    job = queue.claim("w2")
+    assert job["task_id"] == job_id and job["worker"] == "w2" and job["attempts"] == 2
+    with pytest.raises(LeaseLost):
+        queue.heartbeat(job_id, "w1")
+    with pytest.raises(LeaseLost):
+        queue.complete(job_id, "w1", {})
+
+
+def test_expired_lease_after_last_attempt_fails(tmp_path):
+    queue = _queue(tmp_path, lease_seconds=0.05, max_attempts=1)
+    job_id = queue.enqueue("file", {"path": "/tmp/upload-x"})
+    queue.claim("w1")
+    time.sleep(0.1)
+    cleaned = []
+    worker = JobWorker(queue, {"file": lambda payload, report: {}}, cleanup=cleaned.append, worker_id="w2")
+    assert not worker.run_once()
+    job = queue.get(job_id)
+    assert job["status"] == FAILED and "超时" in job["error"]
+    # 原 worker 崩溃的任务同样清理临时文件，且只清理一次
+    assert cleaned == [{"path": "/tmp/upload-x"}]
+    assert queue.fail_exhausted() == []
+
+
+def test_worker_retries_then_fails(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    cleaned = []
+    calls = []
+
+    def flaky(payload, report):
+        calls.append(payload)
+        report(message="处理中")
+        raise RuntimeError("LLM 超时")
+
+    worker = JobWorker(queue, {"file": flaky}, cleanup=cleaned.append, worker_id="w1")
+    job_id = queue.enqueue("file", {"n": 1})
+
+    assert worker.run_once()
+    job = queue.get(job_id)
+    assert job["status"] == PENDING and job["error"] == "LLM 超时" and job["message"] == "处理失败，稍后重试"
+    # 还会重试，临时文件保留
+    assert cleaned == []
+
+    assert worker.run_once()
+    job = queue.get(job_id)
+    assert job["status"] == FAILED and job["attempts"] == 2 and job["message"] == "处理失败"
+    assert cleaned == [{"n": 1}] and len(calls) == 2
+    assert not worker.run_once()
+
+
+def test_retry_backoff_delays_next_claim(tmp_path):
+    queue = _queue(tmp_path, retry_backoff=60)
+    job_id = queue.enqueue("file", {})
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", 1, "boom", {}, retry=True)
+    assert queue.claim("w1") is None
+
+
+def test_value_error_not_retried(tmp_path):
+    queue = _queue(tmp_path, max_attempts=3)
+
+    def invalid(payload, report):
+        raise ValueError("不支持的文件类型")
+
+    job_id = queue.enqueue("file", {})
+    JobWorker(queue, {"file": invalid}, worker_id="w1").run_once()
+    job = queue.get(job_id)
+    assert job["status"] == FAILED and job["attempts"] == 1 and job["error"] == "不支持的文件类型"
+
+
+def _finished(queue, state, owner="w1"):
+    job_id = queue.enqueue("file", {})
+    queue.claim(owner)
+    queue.complete(job_id, owner, state)
+    return job_id
+
+
+def test_large_results_offloaded_compressed(tmp_path):
+    queue = _queue(tmp_path, offload_bytes=1024)
+    text = "光合作用" * 2000
+    big = _finished(queue, {"message": "处理完成", "text": text, "terms": ["光合作用"]})
+    small = _finished(queue, {"message": "处理完成", "text": "短", "terms": []})
+
+    files = os.listdir(tmp_path / "results")
+    assert files == [f"{big}.json.gz"]
+    assert os.path.getsize(tmp_path / "results" / files[0]) < len(text.encode("utf-8")) / 10
+
+    job = queue.get(big)
+    assert job["text"] == text and job["terms"] == ["光合作用"] and job["message"] == "处理完成"
+    # 列表默认只读取元数据
+    listed = {job["task_id"]: job for job in queue.list_jobs()}
+    assert "text" not in listed[big] and "text" not in listed[small]
+    assert listed[big]["text_chars"] == len(text) and listed[big]["term_count"] == 1
+    listed = {job["task_id"]: job for job in queue.list_jobs(with_results=True)}
+    assert listed[big]["text"] == text and listed[small]["text"] == "短"
+
+    queue.delete(big)
+    assert os.listdir(tmp_path / "results") == []
+
+
+def test_list_jobs_paginated_and_filtered(tmp_path):
+    queue = _queue(tmp_path)
+    done = _finished(queue, {"message": "处理完成", "text": "正文"})
+    created = time.time()
+    time.sleep(0.01)
+    pending = [queue.enqueue("file", {}) for _ in range(3)]
+
+    page = queue.list_jobs(limit=2)
+    assert [job["task_id"] for job in page] == pending[::-1][:2]
+    page = queue.list_jobs(limit=2, offset=2)
+    assert [job["task_id"] for job in page] == [pending[0], done]
+
+    assert [job["task_id"] for job in queue.list_jobs(statuses=[COMPLETED])] == [done]
+    assert len(queue.list_jobs(statuses=[PENDING, COMPLETED])) == 4
+    assert [job["task_id"] for job in queue.list_jobs(created_before=created)] == [done]
+    assert len(queue.list_jobs(created_after=created)) == 3
+
+
+def test_partial_results_kept_out_of_metadata(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.enqueue("file", {})
+    queue.claim("w1")
+    queue.heartbeat(job_id, "w1", {"message": "处理中", "text": "部分" * 100, "terms": ["部分"], "partial": True})
+    summary = queue.list_jobs()[0]
+    assert "text" not in summary and summary["text_chars"] == 200 and summary["partial"] is True
+    assert queue.get(job_id)["terms"] == ["部分"]
+
+
+def test_claim_fair_across_clients_and_cheap_first(tmp_path):
+    queue = _queue(tmp_path, cost_aging=0)
+    # 客户端 a 先提交了很多大文件，b 之后提交一张照片
+    big = [queue.enqueue("file", {}, client="a", cost=30) for _ in range(3)]
+    small_a = queue.enqueue("file", {}, client="a", cost=0.1)
+    photo_b = queue.enqueue("file", {}, client="b", cost=0.1)
+
+    assert queue.active_counts("a") == (5, 4)
+    assert queue.claim("w1")["task_id"] == small_a
+    # a 已有任务在处理，b 优先
+    assert queue.claim("w2")["task_id"] == photo_b
+    assert queue.claim("w3")["task_id"] == big[0]
+    assert queue.active_counts("b") == (5, 1)
+
+
+def test_cost_aging_lets_large_jobs_through(tmp_path):
+    # 不随等待时间调整时，小文件总是先处理
+    queue = _queue(tmp_path / "fresh", cost_aging=0)
+    queue.enqueue("file", {}, client="a", cost=3)
+    time.sleep(0.05)
+    small = queue.enqueue("file", {}, client="a", cost=0.1)
+    assert queue.claim("w1")["task_id"] == small
+
+    # 等待足够久后，大文件的成本降到比新来的小文件更低
+    queue = _queue(tmp_path / "aged", cost_aging=0.01)
+    large = queue.enqueue("file", {}, client="a", cost=3)
+    time.sleep(0.05)
+    queue.enqueue("file", {}, client="a", cost=0.1)
+    assert queue.claim("w1")["task_id"] == large
+
+
+def test_estimate_job_cost(tmp_path):
+    fitz = pytest.importorskip("fitz")
+    doc = fitz.open()
+    for _ in range(30):
+        doc.new_page()
+    pdf = tmp_path / "scan.pdf"
+    doc.save(str(pdf))
+    photo = tmp_path / "photo.jpg"
+    photo.write_bytes(b"x" * 1024)
+
+    assert extraction_jobs.estimate_job_cost([("scan.pdf", str(pdf))]) == pytest.approx(3.0)
+    assert extraction_jobs.estimate_job_cost([("photo.jpg", str(photo))]) == pytest.approx(0.1)
+    assert extraction_jobs.estimate_job_cost([("scan.pdf", str(pdf)), ("photo.jpg", str(photo))]) == pytest.approx(3.1)
+
+
+def test_events_notify_in_process_and_across_connections(tmp_path):
+    queue = _queue(tmp_path)
+    # 后台检查线程在本测试中不运行，手动调用 poll
+    queue.events.poll_interval = 60
+    job_id = queue.enqueue("file", {})
+    other_job = queue.enqueue("file", {})
+    notified = []
+    unsubscribe = queue.events.subscribe(job_id, lambda: notified.append(job_id))
+
+    # 同一进程内的改动立即通知
+    queue.claim("w1", ["file"])
+    assert notified == [job_id]
+    queue.events.poll()
+    notified.clear()
+    assert queue.events.poll() == 0
+
+    # 单纯续约不算变化，不唤醒订阅者
+    queue.heartbeat(job_id, "w1")
+    _queue(tmp_path).heartbeat(job_id, "w1")
+    assert queue.events.poll() == 0 and notified == []
+
+    # 其他进程（另一条连接）的改动由检查发现
+    other = _queue(tmp_path)
+    other.heartbeat(job_id, "w1", {"message": "处理中", "pages_done": 1})
+    assert notified == []
+    assert queue.events.poll() == 1 and notified == [job_id]
+    assert queue.events.poll() == 0
+
+    unsubscribe()
+    notified.clear()
+    queue.complete(job_id, "w1", {})
+    assert notified == [] and queue.events.poll() == 0
+    assert queue.get(other_job)["status"] == PENDING
+
+
+def test_events_background_watcher(tmp_path):
+    queue = _queue(tmp_path)
+    queue.events.poll_interval = 0.02
+    job_id = queue.enqueue("file", {})
+    changed = threading.Event()
+    unsubscribe = queue.events.subscribe(job_id, changed.set)
+    try:
+        _queue(tmp_path).delete(job_id)
+        assert changed.wait(2)
+    finally:
+        unsubscribe()
+
+
+def test_purge_ttl_and_lru_bounds(tmp_path):
+    # 超过 TTL 的结束任务与其结果文件一并删除，排队中的任务不受影响
+    queue = _queue(tmp_path / "ttl", offload_bytes=1024, result_ttl=3600, max_finished=0, max_result_bytes=0)
+    _finished(queue, {"text": "旧" * 2000})
+    _finished(queue, {"text": "短"})
+    pending = queue.enqueue("file", {})
+    assert queue.purge() == 0
+    assert queue.purge(now=time.time() + 3601) == 2
+    assert queue.list_jobs()[0]["task_id"] == pending
+    assert os.listdir(tmp_path / "ttl" / "results") == []
+
+    # 数量上限：淘汰最久未访问的
+    queue = _queue(tmp_path / "count", result_ttl=0, max_finished=2, max_result_bytes=0)
+    a = _finished(queue, {"text": "甲"})
+    b = _finished(queue, {"text": "乙"})
+    c = _finished(queue, {"text": "丙"})
+    queue.get(a)
+    assert queue.purge() == 1
+    assert queue.get(b) is None and queue.get(a) and queue.get(c)
+
+    # 结果总大小上限
+    queue = _queue(tmp_path / "bytes", result_ttl=0, max_finished=0, max_result_bytes=5000)
+    x = _finished(queue, {"text": "旧" * 1000})
+    y = _finished(queue, {"text": "新" * 1000})
+    queue.get(x)
+    assert queue.purge() == 1
+    assert queue.get(y) is None and queue.get(x)
+
+
+def test_file_job_reports_pages_and_partial_results(tmp_path, monkeypatch):
+    fitz = pytest.importorskip("fitz")
+    doc = fitz.open()
+    for i in range(3):
+        doc.new_page().insert_text((72, 72), f"Photosynthesis page {i + 1}")
+    pdf = tmp_path / "upload-lecture.pdf"
+    doc.save(str(pdf))
+    doc.close()
+
+    monkeypatch.setattr(extraction_jobs, "PARTIAL_UPDATE_INTERVAL", 0)
+    monkeypatch.setattr(extraction_jobs, "extract_terms_from_note", lambda text, max_terms: ["Photosynthesis"])
+    monkeypatch.setattr(extraction_jobs, "preview_terms_from_note", lambda text, max_terms: [f"{len(text)} chars"])
+    updates = []
+    result = extraction_jobs.run_file_job(
+        {"filename": "lecture.pdf", "path": str(pdf), "max_terms": 10}, lambda **update: updates.append(update)
+    )
+
+    pages = [(u["pages_done"], u.get("pages_total"), u.get("partial")) for u in updates if "pages_done" in u]
+    # 提取到一半时为部分结果，最后一页之后不再刷新部分结果
+    assert pages == [(0, None, False), (1, 3, True), (2, 3, True), (3, 3, None)]
+
+    # 进入词语抽取阶段时文本已完整：partial 复位，初步词语按全文刷新
+    term_stage = updates[-1]
+    assert term_stage["message"] == "正在提取术语..." and term_stage["partial"] is False
+    assert term_stage["terms"] == [f"{len(result['text'])} chars"] and term_stage["text"] == result["text"]
+    assert result["partial"] is False and result["terms"] == ["Photosynthesis"]
+
+
+def test_worker_runs_file_job_end_to_end(tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction_jobs, "extract_terms_from_note", lambda text, max_terms: ["光合作用"])
+    note = tmp_path / "upload-note.txt"
+    note.write_text("光合作用把光能转化为化学能。", encoding="utf-8")
+
+    queue = _queue(tmp_path)
+    job_id = queue.enqueue(
+        "file", {"filename": "note.txt", "path": str(note), "max_terms": 10}, {"message": "已加入队列"}
+    )
+    stop = threading.Event()
+    worker = JobWorker(queue, extraction_jobs.JOB_HANDLERS, extraction_jobs.discard_job_files, poll_interval=0.01)
+    thread = threading.Thread(target=worker.run, args=(stop,))
+    thread.start()
+    try:
+        deadline = time.monotonic() + 10
+        while queue.get(job_id)["status"] != COMPLETED and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        stop.set()
+        thread.join()
+
+    job = queue.get(job_id)
+    assert job["status"] == COMPLETED and job["message"] == "处理完成"
+    assert job["text"] == "光合作用把光能转化为化学能。" and job["terms"] == ["光合作用"]
+    assert job["pages_done"] == 1 and job["partial"] is False
+    assert not os.path.exists(note)
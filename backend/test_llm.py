@@ -0,0 +1,81 @@
+"""
+LLM HTTP 客户端测试
+
+- 每个 model/base_url 共享一组同步/异步客户端
+- httpcore trace 钩子统计新建连接，/metrics 与 get_http_connection_stats 中的连接复用数据
+"""
+
+import asyncio
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import uvicorn
+from langchain_core.messages import HumanMessage
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import llm
+from fake_llm_server import FakeLLMConfig, LatencyModel, create_app
+from llm import get_http_clients, get_http_connection_stats, get_llm, invoke_llm
+from metrics import registry, render_metrics
+
+
+@pytest.fixture(scope="module")
+def fake_llm_url():
+    """在后台线程中监听真实端口的假 LLM 服务（trace 钩子只在真实连接上触发）"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    app = create_app(FakeLLMConfig(latency=LatencyModel.parse("fixed:0"), seed=1))
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        assert time.time() < deadline, "假 LLM 服务未启动"
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}/v1"
+    server.should_exit = True
+    thread.join(timeout=10)
+
+
+def test_clients_shared_per_model_and_url(fake_llm_url):
+    sync_client, async_client = get_http_clients(fake_llm_url, "model-a")
+    assert get_http_clients(fake_llm_url, "model-a") == (sync_client, async_client)
+    assert get_http_clients(fake_llm_url, "model-b")[0] is not sync_client
+    assert get_http_clients("http://localhost:1/v1", "model-a")[0] is not sync_client
+
+
+def test_connections_reused_and_counted(fake_llm_url, monkeypatch):
+    monkeypatch.setattr(llm, "api_key", "fake-key")
+    registry.reset()
+    chat = get_llm("model-reuse", fake_llm_url)
+    assert get_llm("model-reuse", fake_llm_url) is chat
+    sync_client, async_client = get_http_clients(fake_llm_url, "model-reuse")
+    assert chat.http_client is sync_client and chat.http_async_client is async_client
+
+    messages = [HumanMessage(content="通货膨胀是指货币的购买力下降")]
+    for _ in range(3):
+        invoke_llm(chat, messages, "test")
+
+    async def run_async():
+        for _ in range(2):
+            await chat.ainvoke(messages)
+
+    asyncio.run(run_async())
+
+    # 同步与异步客户端各建立一次连接，之后的请求复用
+    stats = get_http_connection_stats()["model-reuse@127.0.0.1"]
+    assert stats["requests"] == 5
+    assert stats["tcp_connects"] == 2
+    assert stats["tls_handshakes"] == 0
+    assert stats["reuse_ratio"] == pytest.approx(0.6)
+
+    text = render_metrics()
+    assert 'llm_http_requests_total{client="sync",pool="model-reuse@127.0.0.1"} 3' in text
+    assert 'llm_http_requests_total{client="async",pool="model-reuse@127.0.0.1"} 2' in text
+    assert 'llm_http_connection_events_total{event="tcp_connect",pool="model-reuse@127.0.0.1"} 2' in text
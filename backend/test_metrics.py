@@ -0,0 +1,56 @@
+"""
+指标采集测试
+
+- LLM 调用记录（耗时 / token / 错误类型）
+- Prometheus 文本格式导出
+- /metrics 接口与 HTTP 路由耗时
+"""
+
+import sys
+from pathlib import Path
+
+from langchain_core.messages import AIMessage
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from metrics import record_cache, record_fallback, record_llm_call, registry, render_metrics
+
+
+def test_llm_call_metrics():
+    registry.reset()
+    response = AIMessage(
+        content="{}",
+        usage_metadata={"input_tokens": 120, "output_tokens": 30, "total_tokens": 150},
+    )
+    record_llm_call("note_terms", 0.8, response=response)
+    record_llm_call("note_terms", 2.5, error=TimeoutError("timeout"))
+    record_cache("topic_terms", hit=True)
+    record_fallback("note_terms", reason="llm_error")
+
+    text = render_metrics()
+    assert 'llm_request_duration_seconds_count{call_site="note_terms"} 2' in text
+    assert 'llm_request_duration_seconds_bucket{call_site="note_terms",le="1"} 1' in text
+    assert 'llm_tokens_total{call_site="note_terms",kind="prompt"} 120' in text
+    assert 'llm_tokens_total{call_site="note_terms",kind="completion"} 30' in text
+    assert 'llm_errors_total{call_site="note_terms",error="TimeoutError"} 1' in text
+    assert 'cache_requests_total{cache="topic_terms",result="hit"} 1' in text
+    assert 'heuristic_fallbacks_total{call_site="note_terms",reason="llm_error"} 1' in text
+
+
+def test_metrics_endpoint_uses_route_template():
+    from fastapi.testclient import TestClient
+    from server import app
+
+    registry.reset()
+    client = TestClient(app)
+    client.get("/notes/not-exists")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'route="/notes/{note_id}",status="404"' in response.text
+
+
+if __name__ == "__main__":
+    test_llm_call_metrics()
+    test_metrics_endpoint_uses_route_template()
+    print("✅ 指标测试通过")
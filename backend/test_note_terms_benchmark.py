@@ -0,0 +1,59 @@
+"""
+规则兜底抽词的性能基准（需要 pytest-benchmark）：
+
+    pip install pytest-benchmark
+    pytest test_note_terms_benchmark.py --benchmark-only
+"""
+
+import random
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import corpus_index
+import word_segmenter
+from corpus_index import CorpusIndex
+from note_terms_extractor import _heuristic_extract_terms
+from word_segmenter import WordSegmenter, build_dictionary
+
+TERMS = ["通货膨胀", "货币政策", "需求曲线", "机器学习", "深度学习", "神经网络"]
+WORDS = TERMS + [
+    "我们", "因此", "的", "是", "在", "价格", "上涨", "模型", "训练",
+    "Python", "GDP", "gradient", "descent", "Transformer", "attention", "the", "and",
+]
+
+
+def _mixed_text(size_bytes: int) -> str:
+    """中英文混排文本，UTF-8 编码后约 size_bytes 字节"""
+    rng = random.Random(size_bytes)
+    parts, size = [], 0
+    while size < size_bytes:
+        word = rng.choice(WORDS)
+        if word.isascii():
+            word = f" {word} "
+        parts.append(word)
+        size += len(word.encode("utf-8"))
+        roll = rng.random()
+        if roll < 0.3:
+            parts.append(" ")
+            size += 1
+        elif roll < 0.35:
+            parts.append("。")
+            size += 3
+    return "".join(parts)
+
+
+@pytest.fixture
+def isolated(tmp_path, monkeypatch):
+    seg = WordSegmenter(build_dictionary(TERMS, str(tmp_path / "segmenter.dict")))
+    monkeypatch.setattr(word_segmenter, "_segmenter", seg)
+    monkeypatch.setattr(corpus_index, "_index", CorpusIndex(str(tmp_path / "corpus_index.bin")))
+
+
+@pytest.mark.parametrize("size", [10_000, 1_000_000, 10_000_000], ids=["10KB", "1MB", "10MB"])
+def test_heuristic_extraction(benchmark, isolated, size):
+    text = _mixed_text(size)
+    terms = benchmark.pedantic(_heuristic_extract_terms, args=(text, 30), rounds=3, warmup_rounds=1)
+    assert set(TERMS) <= set(terms)
+    assert "我们" not in terms and "the" not in terms
@@ -0,0 +1,62 @@
+import os
+import time
+
+import pytest
+
+import ocr_pool
+from ocr_pool import run_ocr_job, shutdown_ocr_pool, warmup_ocr_pool
+
+
+def _sleep_then_pid(seconds):
+    time.sleep(seconds)
+    return os.getpid()
+
+
+@pytest.fixture(autouse=True)
+def single_worker(monkeypatch):
+    shutdown_ocr_pool()
+    monkeypatch.setattr(ocr_pool, "ocr_workers", 1)
+    yield
+    shutdown_ocr_pool()
+
+
+def test_jobs_run_in_worker_process():
+    warmup_ocr_pool(background=False)
+    assert len(ocr_pool._pool.processes()) == 1
+    assert run_ocr_job(os.getpid) != os.getpid()
+
+
+def test_worker_replaced_after_max_jobs(monkeypatch):
+    monkeypatch.setattr(ocr_pool, "ocr_max_jobs_per_worker", 1)
+    assert run_ocr_job(os.getpid) != run_ocr_job(os.getpid)
+
+
+def test_job_timeout_replaces_stuck_worker():
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        run_ocr_job(time.sleep, 10, timeout=0.5)
+    assert time.perf_counter() - start < 5
+    # 卡住的进程被替换，后续任务交给新的工作进程
+    assert run_ocr_job(os.getpid) != os.getpid()
+
+
+def test_budget_exceeded_keeps_job_running():
+    warmup_ocr_pool(background=False)
+    pid = run_ocr_job(os.getpid)
+    late = []
+    with pytest.raises(ocr_pool.OcrBudgetExceeded):
+        run_ocr_job(_sleep_then_pid, 1.0, budget=0.2, on_late=late.append)
+    # 任务没有放弃，在同一个工作进程中完成后交给回调，工作进程没有被替换
+    deadline = time.monotonic() + 5
+    while not late and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert late == [pid]
+    assert run_ocr_job(os.getpid) == pid
+
+
+def test_job_timeout_excludes_queue_wait():
+    warmup_ocr_pool(background=False)
+    busy = ocr_pool.submit_ocr_job(time.sleep, 1.0)
+    # 在唯一的工作进程上排队约 1 秒，开始执行后立即完成，不算超时
+    assert run_ocr_job(os.getpid, timeout=0.5) != os.getpid()
+    assert busy.result() is None
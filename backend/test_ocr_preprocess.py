@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+import file_text_extractor
+from ocr_preprocess import TILE_HEIGHT, TILE_OVERLAP, merge_tile_texts, preprocess_for_ocr, tile_image
+
+
+def make_page(width, height, font_scale, noise=0.0, blur=0.0, contrast=1.0):
+    """白底黑字的合成页面"""
+    img = np.full((height, width), 255, dtype=np.uint8)
+    y = int(60 * font_scale)
+    while y < height - 20:
+        cv2.putText(
+            img, "The quick brown fox jumps over 123 lazy dogs", (20, y),
+            cv2.FONT_HERSHEY_SIMPLEX, font_scale, 0, max(1, int(2 * font_scale)), cv2.LINE_AA,
+        )
+        y += int(50 * font_scale)
+    page = 128 + (img.astype(np.float32) - 128) * contrast
+    if blur:
+        page = cv2.GaussianBlur(page, (0, 0), blur)
+    if noise:
+        page += np.random.default_rng(0).normal(0, noise, page.shape)
+    return np.clip(page, 0, 255).astype(np.uint8)
+
+
+def test_crisp_screenshot_is_only_downscaled():
+    steps = []
+    out = preprocess_for_ocr(cv2.cvtColor(make_page(4000, 3000, 3.0), cv2.COLOR_GRAY2BGR), steps)
+    assert out.ndim == 2
+    assert [s.split(":")[0] for s in steps] == ["resize"]
+    assert out.shape[1] < 2500
+
+
+@pytest.mark.parametrize(
+    "kwargs, expected",
+    [
+        ({}, []),
+        ({"noise": 25.0}, ["denoise"]),
+        ({"blur": 2.5}, ["sharpen"]),
+        ({"contrast": 0.3}, ["clahe"]),
+    ],
+    ids=["crisp", "noisy", "blurry", "low-contrast"],
+)
+def test_quality_gating(kwargs, expected):
+    steps = []
+    preprocess_for_ocr(make_page(1600, 1200, 0.7, **kwargs), steps)
+    assert steps == expected
+
+
+def test_tiles_cover_long_image():
+    long_image = np.zeros((TILE_HEIGHT * 2 + 500, 800), dtype=np.uint8)
+    long_image[:, :] = np.arange(long_image.shape[0], dtype=np.uint32)[:, None] % 251
+    tiles = tile_image(long_image)
+    assert len(tiles) == 3
+    assert {t.shape for t in tiles} == {(TILE_HEIGHT, 800)}
+    # 各块按顺序覆盖整张图
+    assert np.array_equal(tiles[1][:100], long_image[TILE_HEIGHT - TILE_OVERLAP : TILE_HEIGHT - TILE_OVERLAP + 100])
+    assert len(tile_image(long_image[:100])) == 1
+
+
+def test_merge_tile_texts_drops_overlap():
+    assert merge_tile_texts(["第一行\n第二行\n第三行", "第三行\n第四行", "", "第五行"]) == "第一行\n第二行\n第三行\n第四行\n第五行"
+
+
+def test_long_image_is_tiled_for_ocr(monkeypatch):
+    seen = []
+
+    def fake_easyocr(images):
+        seen.append([img.shape for img in images])
+        return [f"tile {i}" for i in range(len(images))]
+
+    monkeypatch.setattr(file_text_extractor, "_get_ocr_backend", lambda: "easyocr")
+    monkeypatch.setattr(file_text_extractor, "_ocr_with_easyocr", fake_easyocr)
+    texts = file_text_extractor._ocr_images([make_page(1000, 6000, 0.6), make_page(800, 600, 0.6)])
+    # 两张图的所有块在一次调用中批量识别
+    assert len(seen) == 1 and len(seen[0]) == 5
+    assert texts == ["tile 0\ntile 1\ntile 2\ntile 3", "tile 4"]
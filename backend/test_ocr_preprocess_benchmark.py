@@ -0,0 +1,74 @@
+"""
+OCR 预处理的性能与准确率基准（需要 pytest-benchmark；准确率部分另需 Tesseract）：
+
+    pip install pytest-benchmark
+    pytest test_ocr_preprocess_benchmark.py --benchmark-only
+
+legacy 为原先的处理方式（原始分辨率上 CLAHE + fastNlMeansDenoising），adaptive 为 ocr_preprocess。
+"""
+
+import difflib
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+cv2 = pytest.importorskip("cv2")
+
+from ocr_preprocess import preprocess_for_ocr
+from test_ocr_preprocess import make_page
+
+TEXT_LINE = "The quick brown fox jumps over 123 lazy dogs"
+
+IMAGES = {
+    "screenshot-4000x3000": dict(width=4000, height=3000, font_scale=3.0),
+    "scan-noisy-2000x1500": dict(width=2000, height=1500, font_scale=1.2, noise=25.0),
+    "scan-blurry-2000x1500": dict(width=2000, height=1500, font_scale=1.2, blur=2.5),
+    "crisp-1600x1200": dict(width=1600, height=1200, font_scale=0.7),
+}
+
+
+def _drawn_lines(height, font_scale, **_):
+    """make_page 画出的文本行数"""
+    return len(range(int(60 * font_scale), height - 20, int(50 * font_scale)))
+
+
+def legacy_preprocess(gray):
+    enhanced = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    return cv2.fastNlMeansDenoising(enhanced, None, 10, 7, 21)
+
+
+PIPELINES = {"legacy": legacy_preprocess, "adaptive": preprocess_for_ocr}
+
+
+@pytest.mark.parametrize("pipeline", list(PIPELINES))
+@pytest.mark.parametrize("image", list(IMAGES))
+def test_preprocess_latency(benchmark, image, pipeline):
+    page = make_page(**IMAGES[image])
+    out = benchmark.pedantic(PIPELINES[pipeline], args=(page,), rounds=1, warmup_rounds=0)
+    assert out.ndim == 2
+
+
+def _tesseract():
+    pytesseract = pytest.importorskip("pytesseract")
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception:
+        pytest.skip("未安装 Tesseract")
+    return pytesseract
+
+
+@pytest.mark.parametrize("pipeline", list(PIPELINES))
+@pytest.mark.parametrize("image", list(IMAGES))
+def test_ocr_accuracy(benchmark, image, pipeline):
+    pytesseract = _tesseract()
+    page = make_page(**IMAGES[image])
+
+    def run():
+        return pytesseract.image_to_string(PIPELINES[pipeline](page), lang="eng", config="--oem 3 --psm 6")
+
+    text = benchmark.pedantic(run, rounds=1, warmup_rounds=0)
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    expected = [TEXT_LINE] * _drawn_lines(**IMAGES[image])
+    accuracy = difflib.SequenceMatcher(None, "\n".join(lines), "\n".join(expected)).ratio()
+    benchmark.extra_info["accuracy"] = round(accuracy, 3)
+    assert accuracy > 0.8
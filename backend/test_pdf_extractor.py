@@ -0,0 +1,245 @@
+import time
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+import file_text_extractor
+import ocr_pool
+import pdf_extractor
+from file_text_extractor import (
+    ExtractionBudget,
+    TextChunk,
+    extract_text_from_upload,
+    extract_upload_text,
+    iter_text_from_upload,
+    join_chunks,
+)
+from pdf_extractor import extract_pdf_pages
+
+
+def _make_pdf(path, pages, scanned=()):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        if i in scanned:
+            # 只有图片、没有文本层的扫描页（各页灰度不同，不会互相命中页面 OCR 缓存）
+            pix = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 40, 20), False)
+            pix.clear_with(128 + i)
+            page.insert_image(page.rect, pixmap=pix)
+        else:
+            page.insert_text((72, 72), f"page {i + 1} content")
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _isolated_pool():
+    pdf_extractor.shutdown_pdf_pool()
+    ocr_pool.shutdown_ocr_pool()
+    yield
+    pdf_extractor.shutdown_pdf_pool()
+    ocr_pool.shutdown_ocr_pool()
+
+
+def test_parallel_pages_are_merged_in_order(tmp_path):
+    path = _make_pdf(tmp_path / "doc.pdf", 11)
+    texts = extract_pdf_pages(str(path), workers=2, pages_per_shard=3, max_pages=0)
+    assert [t.strip() for t in texts] == [f"page {i + 1} content" for i in range(11)]
+
+    # 内容以 bytes 传入时写入临时文件后同样并行提取
+    assert extract_pdf_pages(path.read_bytes(), workers=2, pages_per_shard=3, max_pages=0) == texts
+
+
+def test_max_pages_budget(tmp_path):
+    path = _make_pdf(tmp_path / "doc.pdf", 6)
+    texts = extract_pdf_pages(str(path), workers=2, pages_per_shard=2, max_pages=4)
+    assert len(texts) == 4
+
+    text = extract_text_from_upload("doc.pdf", str(path))
+    assert text.index("page 1 content") < text.index("page 6 content")
+
+
+def test_page_timeout_skips_slow_page(tmp_path, monkeypatch):
+    path = _make_pdf(tmp_path / "doc.pdf", 3, scanned={1})
+
+    def slow_ocr(images):
+        time.sleep(5)
+        return ["too late"] * len(images)
+
+    monkeypatch.setattr(ocr_pool, "ocr_workers", 0)
+    monkeypatch.setattr(file_text_extractor, "_ocr_images", slow_ocr)
+    start = time.perf_counter()
+    texts = extract_pdf_pages(str(path), workers=1, max_pages=0, page_timeout=0.2)
+    assert time.perf_counter() - start < 2
+    assert texts[1] is None
+    assert texts[0].strip() == "page 1 content" and texts[2].strip() == "page 3 content"
+
+
+def test_scanned_pages_rendered_for_ocr(tmp_path, monkeypatch):
+    path = _make_pdf(tmp_path / "scan.pdf", 3, scanned={1})
+    seen = []
+
+    def fake_ocr(images):
+        seen.extend(images)
+        # 直接使用 pixmap 的像素缓冲区
+        assert not any(img.flags.owndata for img in images)
+        return [f"scanned {img.shape[1]}x{img.shape[0]}" for img in images]
+
+    monkeypatch.setattr(ocr_pool, "ocr_workers", 0)
+    monkeypatch.setattr(file_text_extractor, "_ocr_images", fake_ocr)
+    progress = []
+    texts = extract_pdf_pages(
+        str(path), workers=1, max_pages=0, ocr_dpi=144, progress=lambda done, total: progress.append((done, total))
+    )
+    assert texts[1] == "scanned 1190x1684"
+    assert len(seen) == 1 and seen[0].ndim == 2
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+
+    # 相同页面再次出现时直接使用页面 OCR 缓存
+    assert extract_pdf_pages(str(path), workers=1, max_pages=0, ocr_dpi=144)[1] == "scanned 1190x1684"
+    assert len(seen) == 1
+
+
+def test_scanned_pages_ocr_in_batches(tmp_path, monkeypatch):
+    path = _make_pdf(tmp_path / "scan.pdf", 6, scanned={0, 1, 2, 3, 4})
+    batches = []
+
+    def fake_ocr(images):
+        batches.append(len(images))
+        return ["scanned"] * len(images)
+
+    monkeypatch.setattr(ocr_pool, "ocr_workers", 0)
+    monkeypatch.setattr(file_text_extractor, "_ocr_images", fake_ocr)
+    monkeypatch.setattr(pdf_extractor, "ocr_batch_size", 2)
+    texts = extract_pdf_pages(str(path), workers=1, max_pages=0)
+    # 5 个扫描页按每批 2 页识别，文本页不参与 OCR
+    assert batches == [2, 2, 1]
+    assert texts[:5] == ["scanned"] * 5 and texts[5].strip() == "page 6 content"
+
+
+def test_failed_ocr_page_not_cached(tmp_path, monkeypatch):
+    path = _make_pdf(tmp_path / "scan.pdf", 2, scanned={1})
+    calls = []
+
+    def flaky_ocr(images):
+        calls.append(len(images))
+        if len(calls) == 1:
+            raise RuntimeError("OCR 引擎暂时不可用")
+        return ["scanned"] * len(images)
+
+    monkeypatch.setattr(ocr_pool, "ocr_workers", 0)
+    monkeypatch.setattr(file_text_extractor, "_ocr_images", flaky_ocr)
+    assert extract_text_from_upload("scan.pdf", str(path)).strip() == "page 1 content"
+    # 识别失败的页不写入缓存，再次上传时重新识别
+    assert "scanned" in extract_text_from_upload("scan.pdf", str(path))
+    assert len(calls) == 2
+
+
+def test_scanned_pages_ocr_in_parallel_workers(tmp_path):
+    path = _make_pdf(tmp_path / "scan.pdf", 5, scanned={0, 2, 4})
+    progress = []
+    texts = extract_pdf_pages(
+        str(path), workers=2, max_pages=0, progress=lambda done, total: progress.append(done)
+    )
+    # 工作进程里没有 OCR 引擎时扫描页为空，文本页不受影响
+    assert texts[1].strip() == "page 2 content" and texts[3].strip() == "page 4 content"
+    assert progress == [1, 2, 3, 4, 5]
+
+
+def test_text_streamed_page_by_page(tmp_path):
+    path = _make_pdf(tmp_path / "stream.pdf", 5)
+    chunks = iter_text_from_upload("stream.pdf", str(path))
+    pages = {}
+    while True:
+        try:
+            chunk = next(chunks)
+        except StopIteration as stop:
+            text = stop.value.text
+            break
+        pages[chunk.index] = chunk.text
+        assert chunk.total == 5 and chunk.done == len(pages)
+        # 部分结果按页码顺序拼接
+        partial = join_chunks(pages)
+        assert partial.strip().startswith("page 1 content") or 0 not in pages
+
+    assert len(pages) == 5
+    assert text == join_chunks(pages)
+    assert text.index("page 1 content") < text.index("page 5 content")
+
+    # 完整结果已缓存，再次提取整份产出一段
+    assert list(iter_text_from_upload("stream.pdf", str(path))) == [TextChunk(0, text, 5, 5)]
+
+
+def test_page_and_char_budgets_stop_early(tmp_path):
+    path = _make_pdf(tmp_path / "long.pdf", 12)
+
+    result = extract_upload_text("long.pdf", str(path), ExtractionBudget(max_pages=5))
+    assert (result.pages_processed, result.pages_total, result.truncated_by) == (5, 12, "max_pages")
+    assert "page 5 content" in result.text and "page 6 content" not in result.text
+
+    # 每页约 16 个字符，前 3 页达到字符预算后不再提取后续页
+    progress = []
+    result = extract_upload_text(
+        "long.pdf", str(path), ExtractionBudget(max_chars=40), progress=lambda done, total: progress.append(done)
+    )
+    assert result.truncated_by == "max_chars" and len(result.text) == 40
+    assert result.pages_processed == 3 and len(progress) == 3
+
+    # 触发预算的结果不写入缓存，完整提取时没有 truncated_by
+    result = extract_upload_text("long.pdf", str(path), ExtractionBudget())
+    assert (result.pages_processed, result.pages_total, result.truncated_by) == (12, 12, None)
+
+    # 命中缓存时同样按页数预算截取，并保留页数
+    result = extract_upload_text("long.pdf", str(path), ExtractionBudget(max_pages=5))
+    assert (result.pages_processed, result.pages_total, result.truncated_by) == (5, 12, "max_pages")
+    assert "page 5 content" in result.text and "page 6 content" not in result.text
+    result = extract_upload_text("long.pdf", str(path), ExtractionBudget())
+    assert (result.pages_processed, result.pages_total, result.truncated_by) == (12, 12, None)
+
+
+def test_ocr_seconds_budget(tmp_path, monkeypatch):
+    path = _make_pdf(tmp_path / "scan.pdf", 4, scanned={0, 1, 2, 3})
+
+    def slow_ocr(images):
+        time.sleep(0.3 * len(images))
+        return ["scanned"] * len(images)
+
+    monkeypatch.setattr(ocr_pool, "ocr_workers", 0)
+    monkeypatch.setattr(file_text_extractor, "_ocr_images", slow_ocr)
+    monkeypatch.setattr(pdf_extractor, "pdf_workers", 1)
+    # 预算在每批识别完成后检查，每批一页
+    monkeypatch.setattr(pdf_extractor, "ocr_batch_size", 1)
+    result = extract_upload_text("scan.pdf", str(path), ExtractionBudget(max_ocr_seconds=0.1))
+    assert result.truncated_by == "max_ocr_seconds"
+    assert result.pages_processed == 1 and result.text == "scanned"
+
+
+def test_image_ocr_seconds_budget_keeps_worker(tmp_path, monkeypatch):
+    image = tmp_path / "slide.png"
+    image.write_bytes(b"png")
+
+    def over_budget(fn, source, budget, on_late):
+        assert budget == 0.5
+        # 任务在后台完成后写入缓存
+        on_late("late text")
+        raise ocr_pool.OcrBudgetExceeded("OCR 超过时长预算")
+
+    monkeypatch.setattr(ocr_pool, "ocr_workers", 1)
+    monkeypatch.setattr(file_text_extractor, "run_ocr_job", over_budget)
+    result = extract_upload_text("slide.png", str(image), ExtractionBudget(max_ocr_seconds=0.5))
+    assert (result.text, result.truncated_by) == ("", "max_ocr_seconds")
+    assert extract_upload_text("slide.png", str(image)).text == "late text"
+
+
+def test_byte_budget(tmp_path):
+    text = tmp_path / "notes.txt"
+    text.write_bytes("牛顿定律".encode("utf-8") * 10)
+    # 截断处落在多字节字符中间时丢弃不完整的字符
+    result = extract_upload_text("notes.txt", str(text), ExtractionBudget(max_bytes=14))
+    assert (result.text, result.truncated_by) == ("牛顿定律", "max_bytes")
+
+    path = _make_pdf(tmp_path / "doc.pdf", 1)
+    with pytest.raises(ValueError, match="超过提取上限"):
+        extract_upload_text("doc.pdf", str(path), ExtractionBudget(max_bytes=100))
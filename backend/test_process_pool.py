@@ -0,0 +1,57 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from process_pool import WatchedProcessPool
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(workers):
+        pool = WatchedProcessPool(workers, mp_context=multiprocessing.get_context("forkserver"), name="test")
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.shutdown(wait=False)
+
+
+def test_timeout_counts_from_start_not_queue(make_pool):
+    pool = make_pool(1)
+    busy = pool.submit(time.sleep, 1.0)
+    queued = pool.submit(os.getpid)
+    # 排在 busy 后面约 1 秒，但开始执行后很快完成，不算超时
+    assert pool.result(queued, timeout=0.5) != os.getpid()
+    assert busy.result() is None
+    assert pool.started_at(busy) is None  # 已完成的任务不再跟踪
+
+
+def test_stuck_job_does_not_fail_other_jobs(make_pool):
+    pool = make_pool(2)
+    stuck = pool.submit(time.sleep, 30)
+    other = pool.submit(time.sleep, 1.5)
+    with pytest.raises(TimeoutError):
+        pool.result(stuck, timeout=0.5)
+    # 卡住的任务被放弃，同一批进程上已经开始的其他任务照常完成
+    assert other.result(timeout=10) is None
+    # 新任务交给新的进程
+    assert pool.result(pool.submit(os.getpid), timeout=10) != os.getpid()
+    deadline = time.monotonic() + 10
+    while not stuck.done() and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert stuck.done()
+
+
+def test_queued_jobs_resubmitted_when_stuck_worker_replaced(make_pool):
+    pool = make_pool(1)
+    stuck = pool.submit(time.sleep, 30)
+    queued = [pool.submit(os.getpid) for _ in range(3)]
+    with pytest.raises(TimeoutError):
+        pool.result(stuck, timeout=0.5)
+    # 排在卡住任务后面、还没开始的任务在新进程中执行
+    assert all(future.result(timeout=10) != os.getpid() for future in queued)
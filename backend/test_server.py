@@ -1,8 +1,12 @@
 from fastapi.testclient import TestClient
 
 try:
+    from . import server
+    from .database import Database
     from .server import app
 except ImportError:  # pragma: no cover
+    import server
+    from database import Database
     from server import app
 
 
@@ -30,6 +34,26 @@ def test_simple_explainer():
     print("Simple explainer reply:", data["reply"])
 
 
+def test_flash_card_status_matches_normalized_term(tmp_path, monkeypatch):
+    db = Database(str(tmp_path / "notes.db"))
+    monkeypatch.setattr(server, "db", db)
+    note = db.create_note("规范化测试", "API 电脑")
+    db.create_flash_cards(note.id, ["API", "电脑"])
+    client = TestClient(app)
+
+    # 全角与繁体写法命中已有卡片
+    for term, status in (("ＡＰＩ", "mastered"), ("電腦", "needsReview")):
+        response = client.put(f"/notes/{note.id}/flash-cards/status", json={"term": term, "status": status})
+        assert response.status_code == 200, response.text
+    assert {card.term: card.status for card in db.get_flash_cards(note.id)} == {
+        "API": "mastered",
+        "电脑": "needsReview",
+    }
+
+    response = client.put(f"/notes/{note.id}/flash-cards/status", json={"term": "光合作用", "status": "mastered"})
+    assert response.status_code == 404
+
+
 if __name__ == "__main__":
     test_curious_student()
     test_simple_explainer()
@@ -0,0 +1,63 @@
+import random
+
+import note_terms_extractor
+import term_matcher
+from term_matcher import TermMatcher
+
+TERMS = ["通货膨胀", "通货", "膨胀率", "GDP", "货币政策", "政策"]
+
+
+def _brute_force(text, terms):
+    matches = []
+    for term in set(terms):
+        start = text.find(term)
+        while start != -1:
+            matches.append((start, start + len(term), term))
+            start = text.find(term, start + 1)
+    return sorted(matches)
+
+
+def test_finds_all_overlapping_occurrences():
+    text = "通货膨胀率上升，GDP 增速放缓，货币政策转向。GDP"
+    matcher = TermMatcher(TERMS)
+    assert matcher.find(text) == _brute_force(text, TERMS)
+    assert matcher.terms_in(text) == ["通货", "通货膨胀", "膨胀率", "GDP", "货币政策", "政策"]
+    assert matcher.find("") == []
+    assert TermMatcher([]).find(text) == []
+
+
+def test_matches_brute_force_on_random_terms():
+    rng = random.Random(0)
+    alphabet = "通货膨胀政策需求曲线ab"
+    terms = {"".join(rng.choices(alphabet, k=rng.randint(1, 6))) for _ in range(300)}
+    text = "".join(rng.choices(alphabet, k=2000))
+    assert TermMatcher(terms).find(text) == _brute_force(text, terms)
+
+
+def test_new_terms_match_before_rebuild(monkeypatch):
+    monkeypatch.setattr(term_matcher, "_matcher", TermMatcher())
+    monkeypatch.setattr(term_matcher, "_known_terms", set())
+    monkeypatch.setattr(term_matcher, "_pending_terms", set())
+    monkeypatch.setattr(term_matcher, "_rebuild_thread", None)
+
+    term_matcher.add_terms(["边际效用", "机会成本"])
+    assert term_matcher.match_known_terms("机会成本和边际效用") == ["机会成本", "边际效用"]
+
+    # 重建线程结束时会清空 _rebuild_thread
+    thread = term_matcher._rebuild_thread
+    if thread is not None:
+        thread.join(timeout=10)
+    assert term_matcher._rebuild_thread is None
+    assert len(term_matcher.get_term_matcher()) == 2
+    assert not term_matcher._pending_terms
+
+
+def test_extraction_skips_known_terms(monkeypatch):
+    def no_llm():
+        raise RuntimeError("LLM 不可用")
+
+    monkeypatch.setattr(note_terms_extractor, "get_default_llm", no_llm)
+    note = "Inflation 与 Deflation 都与 Monetary policy 有关，Inflation 更常见。"
+    terms = note_terms_extractor.extract_terms_from_note(note, max_terms=5, known_terms=["Inflation"])
+    assert "Inflation" not in terms
+    assert "Deflation" in terms
@@ -0,0 +1,63 @@
+import sqlite3
+
+from database import Database
+from term_normalizer import clean_term, normalize_term
+
+
+def test_variants_share_normalized_form():
+    assert {normalize_term(t) for t in ["API", "api", "ＡＰＩ", " <API> "]} == {"api"}
+    assert normalize_term("通貨膨脹") == normalize_term("通货膨胀") == "通货膨胀"
+    assert normalize_term("机器 学习") == "机器学习"
+    assert normalize_term("Machine   Learning") == "machine learning"
+    assert normalize_term("《资本论》") == "资本论"
+    # 词条中的符号保留
+    assert normalize_term("C++") != normalize_term("C#") != normalize_term("C")
+    assert normalize_term(" <> ") == ""
+
+
+def test_clean_term_keeps_display_form():
+    assert clean_term("<购买力>") == "购买力"
+    assert clean_term("ＧＤＰ") == "GDP"
+    assert clean_term("通貨膨脹") == "通貨膨脹"
+
+
+def test_flash_cards_dedupe_on_normalized_term(tmp_path):
+    db = Database(str(tmp_path / "notes.db"))
+    note = db.create_note("经济学", "通货膨胀与 API")
+
+    created = db.create_flash_cards(note.id, ["API", "ＡＰＩ", "api", "通貨膨脹"])
+    assert [c.term for c in created] == ["API", "通貨膨脹"]
+    assert db.create_flash_cards(note.id, ["通货膨胀", "<api>"]) == []
+    assert len(db.get_flash_cards(note.id)) == 2
+
+    # 其他笔记不受影响
+    other = db.create_note(None, "另一篇")
+    assert len(db.create_flash_cards(other.id, ["api"])) == 1
+
+    # 状态更新同样按规范化词条找到卡片
+    assert db.update_flash_card_status(note.id, "ａｐｉ", "mastered")
+    assert {c.term: c.status for c in db.get_flash_cards(note.id)}["API"] == "mastered"
+
+
+def test_legacy_database_is_backfilled(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE notes (id TEXT PRIMARY KEY, title TEXT, content TEXT NOT NULL,
+                            created_at TEXT NOT NULL, updated_at TEXT NOT NULL);
+        CREATE TABLE flash_cards (id TEXT PRIMARY KEY, note_id TEXT NOT NULL, term TEXT NOT NULL,
+                                  status TEXT NOT NULL DEFAULT 'notStarted', created_at TEXT NOT NULL,
+                                  last_reviewed_at TEXT, UNIQUE(note_id, term));
+        INSERT INTO notes VALUES ('n1', NULL, 'x', '2024-01-01', '2024-01-01');
+        INSERT INTO flash_cards (id, note_id, term, created_at) VALUES ('c1', 'n1', 'API', '2024-01-01');
+        INSERT INTO flash_cards (id, note_id, term, created_at) VALUES ('c2', 'n1', 'api', '2024-01-02');
+    """)
+    conn.close()
+
+    db = Database(path)
+    conn = sqlite3.connect(path)
+    rows = dict(conn.execute("SELECT id, normalized_term FROM flash_cards").fetchall())
+    conn.close()
+    # 旧的重复卡片不删除，只有最早的一张参与去重
+    assert rows == {"c1": "api", "c2": None}
+    assert db.create_flash_cards("n1", ["Api"]) == []
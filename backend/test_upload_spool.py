@@ -0,0 +1,82 @@
+import asyncio
+import io
+import os
+
+import numpy as np
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+from starlette.datastructures import Headers
+
+import extraction_cache
+import file_text_extractor
+import ocr_pool
+import upload_spool
+from file_text_extractor import extract_text_from_upload
+from upload_spool import discard_upload, spool_upload, upload_size_middleware
+
+
+def _upload(data: bytes, filename: str = "note.txt") -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename=filename, headers=Headers({"content-type": "text/plain"}))
+
+
+def test_spool_writes_chunks_to_disk(monkeypatch):
+    monkeypatch.setattr(upload_spool, "CHUNK_SIZE", 4)
+    data = "通货膨胀与货币政策".encode("utf-8") * 10
+    path = asyncio.run(spool_upload(_upload(data, "笔记.MD"), max_bytes=1024))
+    try:
+        assert path.endswith(".md")
+        with open(path, "rb") as f:
+            assert f.read() == data
+        # 文本提取可以直接读取路径
+        assert extract_text_from_upload("笔记.md", path) == data.decode("utf-8")
+    finally:
+        discard_upload(path)
+    assert not os.path.exists(path)
+
+
+def test_spool_rejects_oversized_upload(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_spool, "upload_spool_dir", str(tmp_path))
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(spool_upload(_upload(b"x" * 100), max_bytes=10))
+    assert exc_info.value.status_code == 413
+    # 写了一半的临时文件被清理
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_middleware_rejects_by_content_length(monkeypatch):
+    monkeypatch.setattr(upload_spool, "upload_max_bytes", 1024)
+    app = FastAPI()
+    app.middleware("http")(upload_size_middleware)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    client = TestClient(app)
+    assert client.post("/upload", files={"file": ("a.txt", b"ok")}).json() == {"size": 2}
+    response = client.post("/upload", files={"file": ("a.txt", b"x" * 200_000)})
+    assert response.status_code == 413
+
+
+def test_extract_text_from_path(tmp_path):
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+    assert extract_text_from_upload("empty.txt", str(empty)) == ""
+    latin = tmp_path / "latin.txt"
+    latin.write_bytes(b"caf\xe9")
+    assert extract_text_from_upload("latin.txt", latin) == extract_text_from_upload("latin.txt", b"caf\xe9")
+
+
+def test_image_decoded_from_mmap(tmp_path, monkeypatch):
+    cv2 = pytest.importorskip("cv2")
+    ok, encoded = cv2.imencode(".png", np.zeros((8, 6, 3), dtype=np.uint8))
+    assert ok
+    image = tmp_path / "blank.png"
+    image.write_bytes(encoded.tobytes())
+    monkeypatch.setattr(extraction_cache, "_cache", extraction_cache.ExtractionCache(str(tmp_path / "cache"), 0))
+    monkeypatch.setattr(ocr_pool, "ocr_workers", 0)
+    monkeypatch.setattr(
+        file_text_extractor, "_ocr_images", lambda images: [f"{img.shape[0]}x{img.shape[1]}" for img in images]
+    )
+    assert extract_text_from_upload("blank.png", str(image)) == "8x6"
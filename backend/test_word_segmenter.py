@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+import corpus_index
+import word_segmenter
+from corpus_index import CorpusIndex
+from note_terms_extractor import _heuristic_extract_terms
+from word_segmenter import KIND_BASE, KIND_TERM, MAX_RUN_LEN, WordSegmenter, build_dictionary
+
+TERMS = ["通货膨胀", "货币政策", "财政赤字", "需求曲线", "凯恩斯主义", "机器学习", "深度学习", "神经网络"]
+
+
+@pytest.fixture
+def segmenter(tmp_path, monkeypatch):
+    seg = WordSegmenter(build_dictionary(TERMS, str(tmp_path / "segmenter.dict")))
+    monkeypatch.setattr(word_segmenter, "_segmenter", seg)
+    # 打分不受本地语料索引影响
+    monkeypatch.setattr(corpus_index, "_index", CorpusIndex(str(tmp_path / "corpus_index.bin")))
+    return seg
+
+
+def test_cut_prefers_dictionary_terms(segmenter):
+    words = segmenter.cut("凯恩斯主义认为财政赤字可以刺激需求曲线右移，深度学习是机器学习的一个分支。")
+    assert words == [
+        "凯恩斯主义", "认为", "财政赤字", "可以", "刺激", "需求曲线", "右移",
+        "深度学习", "是", "机器学习", "的", "一个", "分支",
+    ]
+
+
+def test_lookup_and_kinds(segmenter):
+    assert segmenter.lookup("通货膨胀")[1] == KIND_TERM
+    assert segmenter.lookup("因此")[1] == KIND_BASE
+    assert segmenter.lookup("通货") == (None, 0)
+    assert segmenter.lookup("abc") == (None, 0)
+
+
+def test_segment_spans_cover_han_text(segmenter):
+    text = "abc 通货膨胀" * 3 + "神经网络" * MAX_RUN_LEN
+    starts, lengths, _ = segmenter.segment_spans(text)
+    words = [text[s : s + n] for s, n in zip(starts.tolist(), lengths.tolist())]
+    assert "".join(words) == text.replace("abc ", "")
+    assert set(words) == {"通货膨胀", "神经网络"}
+
+
+def test_heuristic_extraction_uses_segmenter(segmenter):
+    note = "通货膨胀是指货币政策宽松时物价持续上涨。通货膨胀与财政赤字有关，因此我们需要关注需求曲线。"
+    terms = _heuristic_extract_terms(note, max_terms=10)
+    assert terms[0] == "通货膨胀"
+    assert {"货币政策", "财政赤字", "需求曲线"} <= set(terms)
+    assert "因此" not in terms and "我们" not in terms
+    # 不再出现跨词的句子片段
+    assert all(len(t) <= 8 for t in terms)
+
+
+def test_segmenter_handles_one_megabyte(segmenter):
+    text = ("通货膨胀是指在货币政策宽松的情况下，物价水平持续上涨的现象。" * 12000)[: 1_000_000 // 3]
+    segmenter.segment_spans(text)  # 预热
+    start = time.perf_counter()
+    starts, _, _ = segmenter.segment_spans(text)
+    elapsed = time.perf_counter() - start
+    assert len(starts) > 0
+    # 宽松的上限，避免 CI 抖动；本地约 60-80ms
+    assert elapsed < 1.0
@@ -0,0 +1,92 @@
+"""
+上传文件落盘
+
+上传内容按块写入磁盘临时文件，而不是一次性 `await file.read()` 读进内存；
+文本提取直接读取临时文件（PyMuPDF 按路径打开，图片/纯文本用 mmap），
+异步任务也只持有文件路径，处理结束后删除。
+
+超过 UPLOAD_MAX_BYTES 的上传返回 413：
+- upload_size_middleware 根据 Content-Length 在解析请求体之前拒绝
+- spool_upload 写入时再按实际字节数检查（没有 Content-Length 或其不准确时）
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+try:
+    from .config import upload_max_bytes, upload_spool_dir
+except ImportError:  # pragma: no cover
+    from config import upload_max_bytes, upload_spool_dir
+
+
+# 每次读取 1MB
+CHUNK_SIZE = 1024 * 1024
+# multipart 头部等额外开销
+_MULTIPART_OVERHEAD = 64 * 1024
+
+
+def _too_large_detail(max_bytes: int) -> str:
+    return f"上传文件过大，最大允许 {max_bytes / 1024 / 1024:.0f}MB"
+
+
+async def spool_upload(file: UploadFile, max_bytes: Optional[int] = None) -> str:
+    """
+    把上传文件分块写入临时文件，返回文件路径（调用方负责删除）。
+
+    Raises:
+        HTTPException(413): 文件超过大小上限
+    """
+    limit = upload_max_bytes if max_bytes is None else max_bytes
+    if file.size is not None and file.size > limit:
+        raise HTTPException(status_code=413, detail=_too_large_detail(limit))
+
+    _, ext = os.path.splitext(file.filename or "")
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=ext.lower(), dir=upload_spool_dir)
+    try:
+        written = 0
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > limit:
+                    raise HTTPException(status_code=413, detail=_too_large_detail(limit))
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def discard_upload(path: Optional[str]) -> None:
+    """删除 spool_upload 生成的临时文件"""
+    if path:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+async def upload_size_middleware(request, call_next):
+    """
+    FastAPI/Starlette HTTP 中间件：multipart 上传的 Content-Length 超过上限时直接返回 413，
+    避免框架先把整个请求体解析到临时文件。
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        try:
+            length = int(request.headers.get("content-length", ""))
+        except ValueError:
+            length = None
+        if length is not None and length > upload_max_bytes + _MULTIPART_OVERHEAD:
+            return JSONResponse(status_code=413, content={"detail": _too_large_detail(upload_max_bytes)})
+    return await call_next(request)
+
+
+__all__ = ["CHUNK_SIZE", "discard_upload", "spool_upload", "upload_size_middleware"]
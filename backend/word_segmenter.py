@@ -0,0 +1,489 @@
+"""
+基于词典的中文分词
+
+- 词典：双数组 Trie（base/check 为 int32 数组），连同词频、词类型写入一个二进制文件，
+  加载时通过 mmap 直接映射为 numpy 数组，不做反序列化
+- 切分：对每个位置查出词典中的所有候选词构成 DAG，按最大概率路径切分；
+  连续的词典外单字合并成一个未登录词（通常是专有名词或新术语）
+- 词典来源：内置的常用词/虚词表 + 预设主题词库（TERMS_LIBRARY）+ 所有闪词卡片词条，
+  服务启动时构建，新增卡片后在后台增量重建
+
+DAG 构建与动态规划都按“列”向量化：候选词按词长逐层扩展，动态规划按到句尾的距离分层，
+循环次数只与最大词长/最大句长有关，与文本总长度无关。
+"""
+
+from __future__ import annotations
+
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from .config import segmenter_dict_path
+except ImportError:  # pragma: no cover
+    from config import segmenter_dict_path
+
+
+# 词类型：基础词（常用词、虚词，抽取时视为停用词）与学习术语
+KIND_BASE = 1
+KIND_TERM = 2
+
+# 单个词的最大长度（字）；超过的词条不进入词典
+MAX_WORD_LEN = 16
+# 没有标点的超长中文片段按该长度强制切开，保证动态规划的层数有上限
+MAX_RUN_LEN = 256
+# 学习术语的默认词频：高于绝大多数基础词，保证术语整体优先于拆分
+TERM_FREQ = 3000
+
+_MAGIC = b"NSDAT002"
+# magic, 状态数, 词典中最长词的长度, 未登录单字的对数概率
+_HEADER = struct.Struct("<8sIIf")
+
+# 字符编码表覆盖的码位范围（CJK 扩展 A 到基本区），表内为字符编码，0 表示词典中没有该字
+_HAN_FIRST = 0x3400
+_HAN_LAST = 0x9FFF
+
+_HAN_RE = re.compile(r"^[\u3400-\u4dbf\u4e00-\u9fff]+$")
+
+# 内置基础词表：按词频档位分组，词频只影响相对概率
+_BASE_LEXICON: Dict[int, str] = {
+    200000: "的 了 是 在 和",
+    50000: """
+        与 及 或 也 都 就 而 被 把 对 从 向 为 以 于 之 其 这 那 有 不 没 很 更 最 又 还 再 将 会
+        能 可 要 让 使 给 等 个 种 些 中 上 下 内 外 后 前 时 我 你 他 她 它 们 着 过 地 得 所 如 若
+        则 但 并 且 即 因 此 各 每 该 某 一 二 三 四 五 六 七 八 九 十 百 千 万 亿 多 少 大 小 高 低
+        来 去 做 说 看 用 到 由 比 向 跟 同 当 按 据 除 至 已 才 只 仍 常 较 太 越 吗 呢 吧 啊 么
+    """,
+    20000: """
+        我们 你们 他们 它们 她们 这个 那个 这些 那些 这样 那样 这种 那种 这里 那里 哪里 什么 怎么
+        怎样 如何 为何 因为 所以 因此 但是 然而 而且 并且 或者 如果 虽然 即使 只要 只有 除了 然后
+        之后 之前 以后 以前 同时 已经 正在 可以 能够 应该 需要 必须 可能 一定 一个 一些 一种 一般
+        一样 一起 一直 进行 通过 根据 关于 对于 由于 作为 成为 包括 其中 以及 以上 以下 之间 之中
+        主要 重要 不同 相同 其他 其它 所有 每个 整个 非常 比较 更加 特别 尤其 例如 比如 就是 也是
+        还是 不是 没有 具有 存在 表示 称为 叫做 认为 发现 导致 造成 产生 出现 发生 影响 增加 减少
+        提高 降低 变化 发展 问题 方法 结果 方面 过程 情况 部分 内容 方式 时候 时间 目前 现在 自己
+        大家 人们 不会 不能 不要 就会 也会 都是 还有 只是 而是 于是 从而 进而 甚至 不仅 不但 而言
+        来说 来看 看来 总之 总的来说 首先 其次 最后 另外 此外 同样 相反 换句话说 也就是说 简单 复杂
+        容易 困难 基本 根本 直接 间接 本身 本质 实际 实际上 事实上 当然 显然 通常 往往 经常 有时
+        越来越 之所以 是否 能否 是不是 有没有 为了 以便 以免 使得 使用 利用 采用 引起 意味着 意思
+        指的是 所谓 叫作 称作 属于 来自 位于 处于 形成 构成 组成 分为 分成 包含 含有 拥有 得到 获得
+        取得 达到 实现 完成 开始 结束 继续 保持 维持 改变 提供 支持 帮助 需求 要求 条件 原因 目的
+        作用 意义 特点 特征 关系 区别 联系 例子 比喻 理解 解释 学习 知识 概念 定义 原理 理论 现象
+        上涨 下跌 上升 下降 增长 扩大 缩小 中文 英文 文章 句子 词语 笔记 课程 老师 学生 书本 第一
+    """,
+}
+
+
+def _base_lexicon() -> Dict[str, int]:
+    words: Dict[str, int] = {}
+    for freq, block in _BASE_LEXICON.items():
+        for word in block.split():
+            words.setdefault(word, freq)
+    return words
+
+
+def _build_double_array(
+    entries: Dict[str, Tuple[int, int]],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, float]:
+    """
+    由 {词: (词频, 类型)} 构建双数组 Trie（词条只含 _HAN_FIRST.._HAN_LAST 范围内的汉字）。
+
+    Returns:
+        (字符编码表, base, check, 对数概率, 词类型, 未登录单字的对数概率)
+    """
+    chars = sorted({ord(ch) for word in entries for ch in word})
+    code_of = {cp: i + 1 for i, cp in enumerate(chars)}
+    code_table = np.zeros(_HAN_LAST - _HAN_FIRST + 1, dtype=np.uint16)
+    for cp, code in code_of.items():
+        code_table[cp - _HAN_FIRST] = code
+    total = float(sum(freq for freq, _ in entries.values())) or 1.0
+
+    # 先构建普通 Trie：children[node] = {code: child}
+    children: List[Dict[int, int]] = [{}]
+    terminal: Dict[int, Tuple[float, int]] = {}
+    for word, (freq, kind) in entries.items():
+        node = 0
+        for ch in word:
+            code = code_of[ord(ch)]
+            nxt = children[node].get(code)
+            if nxt is None:
+                nxt = len(children)
+                children[node][code] = nxt
+                children.append({})
+            node = nxt
+        terminal[node] = (math.log(freq / total), kind)
+
+    # 再按广度优先为每个节点分配 base，使所有子节点落在空闲槽位（check == -1）
+    capacity = max(1024, len(children) * 2 + len(chars) + 1)
+    base = np.zeros(capacity, dtype=np.int32)
+    check = np.full(capacity, -1, dtype=np.int32)
+    check[0] = 0  # 根节点占用 0 号槽位
+    used = bytearray(capacity)
+    used[0] = 1
+    state_of = {0: 0}
+    first_free = 1
+    queue = deque([0])
+    while queue:
+        node = queue.popleft()
+        codes = sorted(children[node])
+        if not codes:
+            continue
+        first_free = used.find(0, first_free)
+        # 从第一个可能的空闲槽位开始，用 bytearray.find 跳过已占用的槽位
+        pos = used.find(0, max(first_free, codes[0] + 1))
+        while True:
+            if pos == -1 or pos - codes[0] + codes[-1] >= len(used):
+                grow = len(used)
+                pos = len(used) if pos == -1 else pos
+                used.extend(bytes(grow))
+                base = np.concatenate([base, np.zeros(grow, dtype=np.int32)])
+                check = np.concatenate([check, np.full(grow, -1, dtype=np.int32)])
+            b = pos - codes[0]
+            if all(not used[b + c] for c in codes[1:]):
+                break
+            pos = used.find(0, pos + 1)
+        s = state_of[node]
+        base[s] = b
+        for c in codes:
+            t = b + c
+            used[t] = 1
+            check[t] = s
+            state_of[children[node][c]] = t
+            queue.append(children[node][c])
+
+    # 末尾留出一个字符表长度的余量，查询时 base + code 不会越界
+    size = max(state_of.values()) + len(chars) + 2
+    base = base[:size].copy() if size <= len(base) else np.concatenate([base, np.zeros(size - len(base), np.int32)])
+    check = check[:size].copy() if size <= len(check) else np.concatenate([check, np.full(size - len(check), -1, np.int32)])
+    logp = np.full(size, -np.inf, dtype=np.float32)
+    kinds = np.zeros(size, dtype=np.uint8)
+    for node, (lp, kind) in terminal.items():
+        logp[state_of[node]] = lp
+        kinds[state_of[node]] = kind
+    oov_logp = math.log(0.5 / total)
+    return code_table, base, check, logp, kinds, oov_logp
+
+
+def build_dictionary(terms: Iterable[str] = (), path: Optional[str] = None) -> str:
+    """
+    用基础词表 + 给定术语构建词典文件（原子替换），返回文件路径。
+    """
+    path = path or segmenter_dict_path
+    entries: Dict[str, Tuple[int, int]] = {w: (f, KIND_BASE) for w, f in _base_lexicon().items()}
+    for term in terms:
+        term = (term or "").strip()
+        if 2 <= len(term) <= MAX_WORD_LEN and _HAN_RE.match(term):
+            entries[term] = (TERM_FREQ, KIND_TERM)
+
+    code_table, base, check, logp, kinds, oov_logp = _build_double_array(entries)
+    max_len = max(len(word) for word in entries)
+    header = _HEADER.pack(_MAGIC, len(base), max_len, oov_logp)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".segmenter-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            for array in (code_table, base, check, logp, kinds):
+                f.write(array.tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return path
+
+
+class WordSegmenter:
+    """基于 mmap 词典的最大概率分词器（只切分中文片段）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        magic, n_states, max_len, oov_logp = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"无效的分词词典文件: {path}")
+        offset = _HEADER.size
+
+        def take(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        self.code_table = take(np.uint16, _HAN_LAST - _HAN_FIRST + 1)
+        self.base = take(np.int32, n_states)
+        self.check = take(np.int32, n_states)
+        self.logp = take(np.float32, n_states)
+        self.kinds = take(np.uint8, n_states)
+        self.max_len = max_len
+        self.oov_logp = np.float32(oov_logp)
+
+    def lookup(self, word: str) -> Tuple[Optional[float], int]:
+        """查询词条，返回 (对数概率, 类型)，不在词典中时返回 (None, 0)"""
+        state = 0
+        for ch in word:
+            cp = ord(ch)
+            code = int(self.code_table[cp - _HAN_FIRST]) if _HAN_FIRST <= cp <= _HAN_LAST else 0
+            t = int(self.base[state]) + code
+            if code == 0 or self.check[t] != state:
+                return None, 0
+            state = t
+        if state == 0 or not np.isfinite(self.logp[state]):
+            return None, 0
+        return float(self.logp[state]), int(self.kinds[state])
+
+    def segment_spans(self, text: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        切分文本中的中文片段。
+
+        Returns:
+            (起始下标, 长度, 类型) 三个等长数组，按起始位置排序；
+            类型为 KIND_BASE / KIND_TERM，未登录词为 0
+        """
+        cps = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        n = len(cps)
+        empty = np.zeros(0, dtype=np.int64)
+        if n == 0:
+            return empty, empty, empty.astype(np.uint8)
+        han_pos = np.flatnonzero((cps >= _HAN_FIRST) & (cps <= _HAN_LAST))
+        if not len(han_pos):
+            return empty, empty, empty.astype(np.uint8)
+        # 末尾补 0，词典遍历越过文本末尾时自然终止
+        codes = np.zeros(n + self.max_len + 1, dtype=np.int64)
+        codes[han_pos] = self.code_table[cps[han_pos] - _HAN_FIRST]
+
+        # 1) 切出中文片段 [start, end)，超长片段强制截断；dist 为各位置到片段末尾的距离
+        is_start = np.ones(len(han_pos), dtype=bool)
+        is_start[1:] = np.diff(han_pos) != 1
+        first = np.flatnonzero(is_start)
+        if (np.diff(np.append(first, len(han_pos))) > MAX_RUN_LEN).any():
+            run_id = np.cumsum(is_start) - 1
+            offset = np.arange(len(han_pos)) - first[run_id]
+            is_start |= offset % MAX_RUN_LEN == 0
+            first = np.flatnonzero(is_start)
+        seg_starts = han_pos[first]
+        seg_ends = han_pos[np.append(first[1:], len(han_pos)) - 1] + 1
+        seg_of = np.cumsum(is_start) - 1
+        dist = np.zeros(n, dtype=np.int64)
+        dist[han_pos] = seg_ends[seg_of] - han_pos
+
+        # 2) 构建 DAG：单字边是稠密的（词典外单字取未登录概率），多字词边很稀疏，单独记录
+        single_logp = np.full(n, self.oov_logp, dtype=np.float32)
+        single_kind = np.zeros(n, dtype=np.uint8)
+        edges: List[Tuple[np.ndarray, int, np.ndarray, np.ndarray]] = []
+        active = np.flatnonzero(codes[:n])
+        states = self.base[0] + codes[active]
+        keep = self.check[states] == 0
+        active, states = active[keep], states[keep]
+        for d in range(1, self.max_len + 1):
+            if d > 1:
+                # 非中文字符与词典外字符的编码为 0，遍历在此终止
+                code = codes[active + d - 1]
+                keep = code > 0
+                active, states, code = active[keep], states[keep], code[keep]
+                nxt = self.base[states] + code
+                keep = self.check[nxt] == states
+                active, states = active[keep], nxt[keep]
+                if not len(active):
+                    break
+            lp = self.logp[states]
+            hit = np.isfinite(lp)
+            if d == 1:
+                single_logp[active[hit]] = lp[hit]
+                single_kind[active[hit]] = self.kinds[states[hit]]
+            else:
+                # 跨越强制截断位置的词丢弃
+                hit &= dist[active] >= d
+                edges.append((active[hit], d, lp[hit], self.kinds[states[hit]]))
+
+        # 3) 最大概率路径：按到片段末尾的距离 k 分层，从后往前逐层计算。
+        #    片段按长度降序编号，第 k 层只包含长度 >= k 的片段，恰好是编号的前缀；
+        #    把位置按“层优先”排成一维后，同一片段在各层的位置编号相同，
+        #    每层及其后继层都是连续切片，无需随机访问。
+        seg_len = seg_ends - seg_starts
+        seg_rank = np.empty(len(seg_len), dtype=np.int64)
+        seg_rank[np.argsort(-seg_len, kind="stable")] = np.arange(len(seg_len))
+        layer_size = np.cumsum(np.bincount(seg_len)[::-1])[::-1][1:]  # layer_size[k - 1]: 长度 >= k 的片段数
+        layer_offset = np.concatenate(([0], np.cumsum(layer_size)))
+        m = len(han_pos)
+        flat_of = np.zeros(n, dtype=np.int64)
+        flat_of[han_pos] = layer_offset[dist[han_pos] - 1] + seg_rank[seg_of]
+        flat_pos = np.empty(m, dtype=np.int64)
+        flat_pos[flat_of[han_pos]] = han_pos
+
+        # 多字词边：起点的层内编号、后继位置（恰好到片段末尾时指向末尾的哨兵 0 分）
+        if edges:
+            e_pos = np.concatenate([e[0] for e in edges])
+            e_len = np.concatenate([np.full(len(e[0]), e[1], dtype=np.int64) for e in edges])
+            e_logp = np.concatenate([e[2] for e in edges])
+            e_kind = np.concatenate([e[3] for e in edges])
+        else:
+            e_pos = e_len = empty
+            e_logp, e_kind = np.zeros(0, np.float32), np.zeros(0, np.uint8)
+        e_flat = flat_of[e_pos]
+        e_dist = dist[e_pos]
+        e_rank = e_flat - layer_offset[e_dist - 1]
+        e_next = np.where(
+            e_len == e_dist, m, layer_offset[np.maximum(e_dist - e_len - 1, 0)] + e_rank
+        )
+        order = np.argsort(e_flat, kind="stable")
+        e_flat, e_len, e_logp, e_kind, e_next = (
+            e_flat[order], e_len[order], e_logp[order], e_kind[order], e_next[order]
+        )
+        edge_bounds = np.searchsorted(e_flat, layer_offset)
+
+        flat_logp = single_logp[flat_pos]
+        flat_len = np.ones(m, dtype=np.int64)
+        flat_kind = single_kind[flat_pos]
+        route = np.zeros(m + 1, dtype=np.float32)  # route[m] 为片段末尾的哨兵
+        for k in range(1, len(layer_size) + 1):
+            a, size = layer_offset[k - 1], layer_size[k - 1]
+            best = flat_logp[a : a + size]
+            if k > 1:
+                prev = layer_offset[k - 2]
+                best = best + route[prev : prev + size]
+            ea, eb = edge_bounds[k - 1], edge_bounds[k]
+            if eb > ea:
+                local = e_flat[ea:eb] - a
+                cand = e_logp[ea:eb] + route[e_next[ea:eb]]
+                np.maximum.at(best, local, cand)
+                win = cand >= best[local]
+                flat_len[a + local[win]] = e_len[ea:eb][win]
+                flat_kind[a + local[win]] = e_kind[ea:eb][win]
+            route[a : a + size] = best
+        best_len = np.ones(n + 1, dtype=np.int64)
+        best_len[flat_pos] = flat_len
+        best_kind = np.zeros(n, dtype=np.uint8)
+        best_kind[flat_pos] = flat_kind
+
+        # 4) 沿最优路径取出各词（所有片段并行前进）
+        is_word_start = np.zeros(n, dtype=bool)
+        cur, cur_end = seg_starts, seg_ends
+        while len(cur):
+            is_word_start[cur] = True
+            cur = cur + best_len[cur]
+            keep = cur < cur_end
+            cur, cur_end = cur[keep], cur_end[keep]
+        starts = np.flatnonzero(is_word_start)
+        lengths = best_len[starts]
+        word_kinds = best_kind[starts]
+
+        # 5) 合并相邻的词典外单字为未登录词（强制截断处也允许合并）
+        oov = (lengths == 1) & (single_logp[starts] == self.oov_logp)
+        if oov.any():
+            joined = np.zeros(len(starts), dtype=bool)
+            joined[1:] = oov[1:] & oov[:-1] & (starts[1:] == starts[:-1] + 1)
+            group_first = np.flatnonzero(~joined)
+            lengths = np.add.reduceat(lengths, group_first)
+            starts = starts[group_first]
+            word_kinds = word_kinds[group_first]
+        return starts, lengths, word_kinds
+
+    def cut(self, text: str) -> List[str]:
+        """返回文本中文部分的分词结果"""
+        starts, lengths, _ = self.segment_spans(text)
+        return [text[s : s + l] for s, l in zip(starts.tolist(), lengths.tolist())]
+
+    def close(self) -> None:
+        for name in ("code_table", "base", "check", "logp", "kinds"):
+            setattr(self, name, None)
+        self._mmap.close()
+
+
+_lock = threading.Lock()
+_segmenter: Optional[WordSegmenter] = None
+_known_terms: set[str] = set()
+_rebuild_pending = False
+_rebuild_thread: Optional[threading.Thread] = None
+
+
+def get_segmenter() -> WordSegmenter:
+    """
+    返回当前分词器。
+
+    首次调用时优先加载已有的词典文件；文件不存在时只用基础词表构建。
+    """
+    global _segmenter
+    if _segmenter is None:
+        with _lock:
+            if _segmenter is None:
+                try:
+                    _segmenter = WordSegmenter(segmenter_dict_path)
+                except (OSError, ValueError, struct.error):
+                    _segmenter = WordSegmenter(build_dictionary(_known_terms, segmenter_dict_path))
+    return _segmenter
+
+
+def rebuild_segmenter(terms: Iterable[str]) -> WordSegmenter:
+    """用全部术语重建词典文件并切换到新分词器（旧的映射由 GC 回收）"""
+    global _segmenter
+    with _lock:
+        _known_terms.update(t.strip() for t in terms if t and t.strip())
+        snapshot = sorted(_known_terms)
+    path = build_dictionary(snapshot, segmenter_dict_path)
+    segmenter = WordSegmenter(path)
+    with _lock:
+        _segmenter = segmenter
+    print(f"[WordSegmenter] 词典已重建: {len(snapshot)} 个术语, {len(segmenter.base)} 个状态")
+    return segmenter
+
+
+def add_terms(terms: Iterable[str]) -> None:
+    """
+    登记新术语（例如新建的闪词卡片）。有新词时在后台线程重建词典，
+    重建期间继续使用旧词典；多次登记会合并为一次重建。
+    """
+    global _rebuild_pending, _rebuild_thread
+    with _lock:
+        new = {t.strip() for t in terms if t and t.strip()} - _known_terms
+        if not new:
+            return
+        _known_terms.update(new)
+        _rebuild_pending = True
+        # 重建线程在持有 _lock 时退出并清空 _rebuild_thread，之后登记的新词会启动新线程
+        if _rebuild_thread is not None:
+            return
+
+        def worker():
+            global _rebuild_pending, _rebuild_thread
+            while True:
+                with _lock:
+                    if not _rebuild_pending:
+                        _rebuild_thread = None
+                        return
+                    _rebuild_pending = False
+                try:
+                    rebuild_segmenter(())
+                except Exception as exc:  # noqa: BLE001
+                    print(f"[WordSegmenter] 词典重建失败: {exc}")
+
+        _rebuild_thread = threading.Thread(target=worker, name="segmenter-rebuild", daemon=True)
+        _rebuild_thread.start()
+
+
+def cut(text: str) -> List[str]:
+    """使用当前词典切分文本中的中文部分"""
+    return get_segmenter().cut(text)
+
+
+__all__ = [
+    "KIND_BASE",
+    "KIND_TERM",
+    "WordSegmenter",
+    "add_terms",
+    "build_dictionary",
+    "cut",
+    "get_segmenter",
+    "rebuild_segmenter",
+]